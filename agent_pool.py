@@ -0,0 +1,466 @@
+# agent_pool.py
+"""
+他のノードで動く BlastNavigator エージェント (blast_agent.py) に blastn を実行させる。
+
+同じ DB をマウントした複数の Linux マシンで blast_agent.py を起動しておき、
+[AGENTS] の hosts に登録すると、ローカルの空きがないときに解析待ちのジョブを
+空きスロットの多いエージェントから順に割り当てる。
+
+通信は TCP 上の簡単なフレーム形式 (1行の JSON ヘッダー + ヘッダーの size バイトのデータ):
+
+- status: エージェントのノード名・スロット数・実行中のジョブ数を返す (ハートビート)
+- run: _build_blast_command の引数とクエリの大きさを送ると、エージェントがスロットを確保して
+  ready (空きがなければ busy) を返す。ready の後にクエリの内容を送ると blastn を実行し、
+  started → output (標準出力のバイト列) ... → exit (終了コード・stderr・資源使用量) を返す。
+  出力がない間も heartbeat を送るので、timeout_sec の間何も届かなければノードを見失ったとみなす。
+  接続を閉じると、エージェントは blastn をプロセスツリーごと終了する。
+
+ノードを見失ったジョブは "requeue" メッセージで解析待ちに戻し、別のノード (かローカル) で
+やり直す。見失ったエージェントはハートビートが再び届くまで割り当てない。
+"""
+import json
+import os
+import socket
+import threading
+import time
+
+# 1フレームのヘッダーの最大長 (これを超える行はプロトコルのエラーとする)
+MAX_HEADER_BYTES = 64 * 1024
+# 既定の待ち受けポート
+DEFAULT_PORT = 7070
+
+
+class AgentUnavailableError(ConnectionError):
+    """エージェントに接続できない・途中で応答がなくなった・空きがない (ジョブはやり直せる)"""
+
+    def __init__(self, agent, message):
+        super().__init__(f"{agent.address}: {message}")
+        self.agent = agent
+
+
+class AgentRequestRejectedError(RuntimeError):
+    """
+    エージェントが要求を拒否した (クエリが大きすぎる・DB がない・許可されていない引数)。
+    同じ要求は何度送っても拒否されるので、やり直さずにエラーとして通知する。
+    """
+
+    def __init__(self, agent, message):
+        super().__init__(f"{agent.address}: {message}")
+        self.agent = agent
+
+
+def send_message(sock, header, payload=b""):
+    """
+    フレームを1つ送る。
+
+    Args:
+        sock (socket.socket): 送り先のソケット
+        header (dict): JSON にできるヘッダー (type は必須)
+        payload (bytes): ヘッダーに続けて送るデータ (size は自動で付ける)
+    """
+    if payload:
+        header = dict(header, size=len(payload))
+    sock.sendall(json.dumps(header, ensure_ascii=False).encode("utf-8") + b"\n" + payload)
+
+
+def read_message(rfile):
+    """
+    フレームを1つ受け取る。
+
+    Args:
+        rfile: ソケットの読み込み用ファイル (socket.makefile("rb"))
+
+    Returns:
+        tuple[dict | None, bytes]: (ヘッダー, データ)。接続が閉じられていれば (None, b"")
+
+    Raises:
+        ConnectionError: フレームの途中で接続が閉じられた・ヘッダーが不正な場合
+    """
+    line = rfile.readline(MAX_HEADER_BYTES + 1)
+    if not line:
+        return None, b""
+    if not line.endswith(b"\n"):
+        raise ConnectionError("フレームのヘッダーが不正です")
+    header = json.loads(line)
+    size = header.get("size", 0)
+    payload = rfile.read(size) if size else b""
+    if len(payload) != size:
+        raise ConnectionError("フレームの途中で接続が閉じられました")
+    return header, payload
+
+
+def parse_address(text):
+    """"host:port" (ポートを省略すると DEFAULT_PORT) を (host, port) にする"""
+    host, _, port = text.strip().rpartition(":")
+    if not host:
+        return text.strip(), DEFAULT_PORT
+    return host.strip("[]"), int(port)
+
+
+class RemoteAgent:
+    """登録したエージェント1つの状態 (ハートビートで更新する)"""
+
+    def __init__(self, pool, host, port):
+        self.pool = pool
+        self.host = host
+        self.port = port
+        self.address = f"{host}:{port}"
+        self.node = None  # エージェントが返したノード名
+        self.slots = 0  # エージェントが同時に実行できるジョブ数
+        self.busy = 0  # エージェント上で実行中のジョブ数 (他の端末からのジョブも含む)
+        self.assigned = 0  # この端末が割り当てて実行中のジョブ数
+        self.alive = False
+        self.last_seen = None  # 最後に応答があった時刻 (time.monotonic())
+
+    @property
+    def free_slots(self):
+        # ハートビートの間に割り当てた分は、次の応答まで自分で数える
+        return self.slots - max(self.busy, self.assigned)
+
+    def release(self):
+        """ジョブの終了時に、割り当てたスロットを返す"""
+        self.pool.release(self)
+
+    def spawn(self, blast_command, query_path):
+        """
+        エージェントで blastn を起動する。
+
+        Args:
+            blast_command (list[str]): _build_blast_command が作ったコマンド
+                (実行ファイルと -query のパスは、エージェント側のものに置き換わる)
+            query_path (str): 送るクエリ FASTA
+
+        Returns:
+            RemoteProcess: 起動した blastn (subprocess.Popen と同じように読み出す)
+
+        Raises:
+            AgentUnavailableError: 接続できない・空きがない場合 (ジョブはやり直せる)
+            AgentRequestRejectedError: エージェントが要求を拒否した場合 (やり直せない)
+            FileNotFoundError: エージェントで blastn が見つからない場合
+        """
+        pool = self.pool
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=pool.timeout_sec)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError as e:
+            pool.mark_lost(self, f"接続できません ({e})")
+            raise AgentUnavailableError(self, f"接続できません ({e})") from e
+
+        try:
+            args = list(blast_command[1:])
+            args[args.index("-query") + 1] = "{query}"
+            header = {
+                "type": "run",
+                "token": pool.token,
+                "args": args,
+                "heartbeat_sec": pool.heartbeat_sec,
+                "size": os.path.getsize(query_path),
+            }
+            sock.sendall(json.dumps(header).encode("utf-8") + b"\n")
+            rfile = sock.makefile("rb")
+            # エージェントはスロットを確保してから ready を返す (空きがなければ busy)。
+            # クエリは ready を受け取ってから送る
+            reply, _ = read_message(rfile)
+            if reply is not None and reply.get("type") == "ready":
+                with open(query_path, "rb") as f:
+                    sock.sendfile(f)
+                reply, _ = read_message(rfile)
+        except OSError as e:
+            sock.close()
+            pool.mark_lost(self, f"ジョブを送れません ({e})")
+            raise AgentUnavailableError(self, f"ジョブを送れません ({e})") from e
+
+        reply_type = reply.get("type") if reply else None
+        if reply_type == "started":
+            self.node = reply.get("node", self.node)
+            return RemoteProcess(self, sock, rfile, reply.get("pid"))
+        sock.close()
+        if reply_type == "busy":
+            pool.mark_full(self)
+            raise AgentUnavailableError(self, "空きスロットがありません")
+        if reply_type == "error" and reply.get("error_type") == "FileNotFoundError":
+            raise FileNotFoundError(2, reply.get("message", ""), reply.get("filename"))
+        if reply_type == "error" and reply.get("error_type") == "RequestRejected":
+            # 引数・クエリの大きさを受け付けないだけで、エージェント自体は使える
+            raise AgentRequestRejectedError(self, reply.get("message", "要求を拒否されました"))
+        message = reply.get("message", "不明な応答") if reply else "応答がありません"
+        pool.mark_lost(self, message)
+        raise AgentUnavailableError(self, message)
+
+
+class RemoteMonitor:
+    """
+    ProcessMonitor の代わりに、エージェントの blastn のタイムスタンプと資源使用量を持つ
+    (資源使用量はエージェントが測って exit で返す)。
+    """
+
+    def __init__(self):
+        self.pid = None
+        self.spawned_at = time.time()
+        self.first_output_at = None
+        self.exited_at = None
+        self.cpu_user_sec = None
+        self.cpu_sys_sec = None
+        self.peak_rss_bytes = None
+        self.read_bytes = None
+        self.write_bytes = None
+
+    def mark_output(self):
+        if self.first_output_at is None:
+            self.first_output_at = time.time()
+
+    def wait_exit(self):
+        pass  # 終了は exit フレームで分かる
+
+    def stop(self):
+        if self.exited_at is None:
+            self.exited_at = time.time()
+
+
+class RemoteProcess:
+    """
+    エージェントで実行中の blastn を、BlastWorker が使う subprocess.Popen の形
+    (stdout / stderr の行の反復・poll() / wait() / kill() / returncode) で扱う。
+
+    pid はローカルのプロセスではないので None (kill_process_tree は kill() を呼ぶ)。
+    """
+
+    def __init__(self, agent, sock, rfile, remote_pid):
+        self.agent = agent
+        self.pid = None
+        self.remote_pid = remote_pid
+        self.returncode = None
+        self.monitor = RemoteMonitor()
+        self._sock = sock
+        self._rfile = rfile
+        self._stderr_text = ""
+        self._exited = threading.Event()
+        self._killed = False
+        self.stdout = self._read_output()
+        self.stderr = _RemoteStderr(self)
+
+    def _read_output(self):
+        """output フレームを行に分けて返し、exit フレームで終了コードと stderr を受け取る"""
+        pending = b""
+        try:
+            while True:
+                reason = "接続が切れました"
+                try:
+                    header, payload = read_message(self._rfile)
+                except socket.timeout:
+                    header = None
+                    reason = f"{self.agent.pool.timeout_sec:.0f}秒間応答がありません"
+                except (OSError, ValueError) as e:
+                    header = None
+                    reason = f"接続が切れました ({e})"
+                if header is None:
+                    if self._killed:
+                        self.returncode = -9
+                        return
+                    self.agent.pool.mark_lost(self.agent, reason)
+                    raise AgentUnavailableError(self.agent, f"ジョブの実行中に{reason}")
+
+                if header["type"] == "output":
+                    lines = (pending + payload).split(b"\n")
+                    pending = lines.pop()
+                    for line in lines:
+                        yield line + b"\n"
+                elif header["type"] == "exit":
+                    if pending:
+                        yield pending
+                    self._stderr_text = header.get("stderr", "")
+                    for key in ("cpu_user_sec", "cpu_sys_sec", "peak_rss_bytes",
+                                "read_bytes", "write_bytes"):
+                        setattr(self.monitor, key, header.get(key))
+                    self.monitor.exited_at = time.time()
+                    self.returncode = header.get("returncode")
+                    return
+                # heartbeat は受け取るだけ (ソケットのタイムアウトを延ばす)
+        finally:
+            self._exited.set()
+            self._sock.close()
+
+    def poll(self):
+        return self.returncode if self._exited.is_set() else None
+
+    def wait(self):
+        self._exited.wait()
+        return self.returncode
+
+    def kill(self):
+        """接続を切って、エージェントに blastn を終了させる"""
+        if self._exited.is_set():
+            return
+        self._killed = True
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class _RemoteStderr:
+    """blastn の終了後に、エージェントが返した stderr の末尾を行ごとに返す"""
+
+    def __init__(self, process):
+        self._process = process
+
+    def __iter__(self):
+        self._process._exited.wait()
+        for line in self._process._stderr_text.splitlines(keepends=True):
+            yield line.encode("utf-8")
+
+    def close(self):
+        pass
+
+
+class AgentPool:
+    """
+    登録したエージェントの空きを、ハートビートで調べながら割り当てる。
+    acquire() / release() は GUI・CLI のスレッドとワーカースレッドから呼ばれるので、ロックで守る。
+    """
+
+    @classmethod
+    def from_config(cls, config, on_available=None):
+        """[AGENTS] が有効でエージェントが登録されていれば AgentPool を作る (なければ None)"""
+        if not config.getboolean("AGENTS", "enabled", fallback=False):
+            return None
+        hosts = [
+            parse_address(host)
+            for host in config.get("AGENTS", "hosts", fallback="").split(";")
+            if host.strip()
+        ]
+        if not hosts:
+            return None
+        return cls(
+            hosts,
+            heartbeat_sec=config.getfloat("AGENTS", "heartbeat_sec", fallback=5),
+            timeout_sec=config.getfloat("AGENTS", "timeout_sec", fallback=30),
+            token=config.get("AGENTS", "token", fallback=""),
+            on_available=on_available,
+        )
+
+    def __init__(self, hosts, heartbeat_sec=5, timeout_sec=30, token="", on_available=None):
+        """
+        Args:
+            hosts (list[tuple[str, int]]): エージェントの (ホスト, ポート)
+            heartbeat_sec (float): 状態を問い合わせる間隔 (秒)
+            timeout_sec (float): 応答がなければノードを見失ったとみなすまでの時間 (秒)
+            token (str): エージェントと共有する合言葉 (空なら送らない)
+            on_available (callable): 空きができたエージェントがあるときに
+                ハートビートのスレッドから呼ぶ関数 (任意)
+        """
+        self.agents = [RemoteAgent(self, host, port) for host, port in hosts]
+        self.heartbeat_sec = max(0.5, heartbeat_sec)
+        self.timeout_sec = max(self.heartbeat_sec * 2, timeout_sec)
+        self.token = token
+        self.on_available = on_available
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def start(self, wait=True):
+        """
+        ハートビートのスレッドを開始する。
+
+        Args:
+            wait (bool): 最初の問い合わせが終わるまで待つか (GUI では待たずに、
+                応答したエージェントを on_available で知らせてもらう)
+        """
+        if wait:
+            self._probe_all()
+            self._report_unresponsive()
+        threading.Thread(
+            target=self._heartbeat_loop, args=(not wait,), name="agent-heartbeat", daemon=True
+        ).start()
+
+    def stop(self):
+        """ハートビートを止める (問い合わせ中のスレッドは待たない。デーモンスレッドなので残らない)"""
+        self._stop.set()
+
+    def acquire(self):
+        """
+        空きスロットが最も多いエージェントに、1つのジョブを割り当てる。
+
+        Returns:
+            RemoteAgent | None: 割り当てたエージェント (空きがなければ None)
+        """
+        with self._lock:
+            candidates = [agent for agent in self.agents if agent.alive and agent.free_slots > 0]
+            if not candidates:
+                return None
+            agent = max(candidates, key=lambda agent: (agent.free_slots, -agent.assigned))
+            agent.assigned += 1
+            return agent
+
+    def release(self, agent):
+        with self._lock:
+            agent.assigned = max(0, agent.assigned - 1)
+            agent.busy = max(0, agent.busy - 1)
+
+    def mark_lost(self, agent, reason):
+        """応答のなくなったエージェントを、次のハートビートで応答するまで割り当てから外す"""
+        with self._lock:
+            was_alive, agent.alive = agent.alive, False
+        if was_alive:
+            print(f"エージェント {agent.address} を見失いました: {reason}")
+
+    def mark_full(self, agent):
+        """空きがないと応答したエージェントを、次のハートビートまで満杯として扱う"""
+        with self._lock:
+            agent.busy = agent.slots
+
+    def summary(self):
+        """表示用に、応答中のエージェント数と空きスロット数を返す"""
+        with self._lock:
+            alive = [agent for agent in self.agents if agent.alive]
+            return len(alive), sum(max(0, agent.free_slots) for agent in alive)
+
+    def _heartbeat_loop(self, probe_first):
+        if probe_first:
+            self._probe_all()
+            self._report_unresponsive()
+        while not self._stop.wait(self.heartbeat_sec):
+            self._probe_all()
+
+    def _report_unresponsive(self):
+        for agent in self.agents:
+            if not agent.alive:
+                print(f"エージェント {agent.address} が応答しません (応答したら割り当てます)")
+
+    def _probe_all(self):
+        became_available = False
+        for agent in self.agents:
+            if self._stop.is_set():
+                return
+            had_free = agent.alive and agent.free_slots > 0
+            self._probe(agent)
+            if agent.alive and agent.free_slots > 0 and not had_free:
+                became_available = True
+        if became_available and self.on_available is not None:
+            self.on_available()
+
+    def _probe(self, agent):
+        """エージェントに状態を問い合わせる"""
+        try:
+            with socket.create_connection(
+                (agent.host, agent.port), timeout=self.heartbeat_sec
+            ) as sock:
+                send_message(sock, {"type": "status", "token": self.token})
+                with sock.makefile("rb") as rfile:
+                    reply, _ = read_message(rfile)
+            if not reply or reply.get("type") != "status":
+                raise ConnectionError((reply or {}).get("message", "応答がありません"))
+        except (OSError, ValueError) as e:
+            # 一時的な失敗では外さず、timeout_sec の間応答がなければ見失ったとみなす
+            if agent.last_seen is None or time.monotonic() - agent.last_seen >= self.timeout_sec:
+                self.mark_lost(agent, f"{self.timeout_sec:.0f}秒間応答がありません ({e})")
+            return
+
+        with self._lock:
+            revived = not agent.alive
+            agent.alive = True
+            agent.last_seen = time.monotonic()
+            agent.node = reply.get("node", agent.address)
+            agent.slots = int(reply.get("slots", 0))
+            agent.busy = int(reply.get("running", 0))
+        if revived:
+            print(f"エージェント {agent.address} ({agent.node}): {agent.slots} スロット")
@@ -0,0 +1,286 @@
+# async_engine.py
+"""
+blastn の実行エンジン (ワーカーの起動方法) を選ぶ。
+
+[ENGINE] mode = thread (既定)
+    ジョブごとに BlastWorker のスレッドを起動する (従来どおり)。
+    ジョブごとにスレッドがあり、出力の読み出しやチャンクの並列実行でさらにスレッドを使う。
+
+[ENGINE] mode = asyncio
+    1つのバックグラウンドスレッドで動くイベントループが、全ジョブの blastn を
+    asyncio.create_subprocess_exec で起動し、標準出力・標準エラーの読み出しと
+    タイムアウトをまとめて扱う。ジョブごとのスレッドや、出力・チャンクの読み出し用の
+    スレッドを使わないので、ジョブが数十あっても1ジョブあたりのオーバーヘッドが小さい。
+    blastn の前後の処理 (キャッシュ・重複除去・チャンク分割・結果の移動など) は
+    BlastWorker と同じメソッドを、io_workers 本の共有スレッドプールで実行する。
+
+どちらの場合も、GUI / CLI へのメッセージ (progress / file_done / error / cancelled) と
+ワーカーの cancel() / terminate() は同じなので、呼び出し側は start_job() だけを使えばよい。
+"""
+import asyncio
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from blast_results import strip_qseqid
+from blast_worker import STDERR_TAIL_LINES, BlastWorker, job_timeout_sec
+from packed_worker import PackedBlastWorker
+from process_utils import popen_platform_kwargs
+
+ENGINE_MODES = ("thread", "asyncio")
+# 1行の最大長 (asyncio の StreamReader の既定の 64KB では stitle の長い行で失敗しうる)
+STREAM_LIMIT = 1024 * 1024
+# 結果ファイルへ1回に書き込む行数 (書き込みはイベントループの外で行う)
+WRITE_BATCH_LINES = 1024
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def start_job(
+    filepaths, message_queue, config, journal=None, num_threads=None, agent=None, cache=None
+):
+    """
+    ファイル群のジョブを、設定のエンジンで開始する (複数ならまとめて1回の blastn で実行)。
+
+    Args:
+        filepaths (list[str]): 解析するファイル
+        message_queue (queue.Queue): 進捗・完了・エラーを通知するキュー
+        config (configparser.ConfigParser): 設定情報
+        journal (JobJournal): 開始・移動・完了・エラーを記録するジャーナル (任意)
+        num_threads (int): -num_threads の値 (省略時は設定値)
+        agent (agent_pool.RemoteAgent): blastn を実行させるエージェント (任意)。
+            エージェントのジョブは、エンジンの設定にかかわらずスレッドで実行する
+            (blastn はエージェント側なので、ジョブのスレッドは出力の受信だけを行う)
+        cache (result_cache.ResultCache): 結果キャッシュ (任意。open_result_cache で開いたもの)
+
+    Returns:
+        BlastWorker: 開始したジョブ (cancel() / terminate() で中止できる)
+    """
+    if len(filepaths) == 1:
+        worker = BlastWorker(filepaths[0], message_queue, config, journal, num_threads)
+    else:
+        worker = PackedBlastWorker(filepaths, message_queue, config, journal, num_threads)
+    worker.agent = agent
+    worker.cache = cache
+
+    if agent is None and config.get("ENGINE", "mode", fallback="thread").lower() == "asyncio":
+        get_engine(config).submit(worker)
+    else:
+        worker.start()
+    return worker
+
+
+def get_engine(config):
+    """共有の AsyncBlastEngine を返す (初回にイベントループのスレッドを開始する)"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AsyncBlastEngine(config.getint("ENGINE", "io_workers", fallback=4))
+            _engine.start()
+        return _engine
+
+
+class _ProcessHandle:
+    """
+    asyncio のプロセスを、BlastWorker の中止処理と kill_process_tree が使う
+    subprocess.Popen の形 (pid / poll() / kill()) に合わせる。
+    """
+
+    def __init__(self, process):
+        self._process = process
+        self.pid = process.pid
+
+    def poll(self):
+        return self._process.returncode
+
+    def kill(self):
+        try:
+            self._process.kill()
+        except ProcessLookupError:
+            pass  # 既に終了している
+
+
+class AsyncBlastEngine:
+    """
+    1つのイベントループで、複数のジョブ (BlastWorker) の blastn を並行して実行する。
+
+    ワーカーはスレッドとして start() せずに submit() する。中止は従来どおり
+    worker.cancel() / terminate() で、どのスレッドから呼んでもよい。
+    """
+
+    def __init__(self, io_workers=4):
+        """
+        Args:
+            io_workers (int): blastn の前後のファイル処理に使うスレッド数
+        """
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, io_workers), thread_name_prefix="blastnav-io"
+        )
+        self._loop = None
+        self._ready = threading.Event()
+
+    def start(self):
+        """イベントループのスレッドを開始し、使えるようになるまで待つ"""
+        thread = threading.Thread(target=self._run_loop, name="blastnav-engine", daemon=True)
+        thread.start()
+        self._ready.wait()
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._ready.set()
+        self._loop.run_forever()
+
+    def submit(self, worker):
+        """ワーカーのジョブをイベントループで開始する (すぐに戻る)"""
+        future = asyncio.run_coroutine_threadsafe(self._run_job(worker), self._loop)
+        future.add_done_callback(self._report_crash)
+
+    @staticmethod
+    def _report_crash(future):
+        # ジョブの例外は全てメッセージにするので、ここに来るのはエンジン自体の不具合
+        if not future.cancelled() and future.exception() is not None:
+            print(f"実行エンジンでエラー: {future.exception()!r}")
+
+    async def _call(self, function, *args):
+        """ブロックする処理 (ファイルI/O) を共有スレッドプールで実行する"""
+        return await self._loop.run_in_executor(self._executor, function, *args)
+
+    async def _run_job(self, worker):
+        """BlastWorker.run() と同じ流れ (準備 → blastn → 後処理) をイベントループで実行する"""
+        worker._started_at = time.time()
+        timeout_handle = None
+        limit = job_timeout_sec(worker.config, worker.filepaths)
+        if limit is not None:
+            # kill_process_tree は Windows では taskkill を待つので、ループの外で中止する
+            timeout_handle = self._loop.call_later(
+                limit, self._executor.submit, worker.cancel, "timeout"
+            )
+        try:
+            try:
+                plan = await self._call(worker._prepare)
+                if plan is not None:
+                    await self._run_processes(worker, plan["runs"])
+                    await self._call(worker._complete, plan)
+            except Exception as e:
+                if not worker.terminated:
+                    fallbacks = await self._call(worker._handle_failure, e)
+                    await self._run_fallbacks(worker, fallbacks)
+        finally:
+            if timeout_handle is not None:
+                timeout_handle.cancel()
+            # 一時フォルダの削除などのファイル操作は、ループを止めないよう共有スレッドプールで行う
+            # (完了の通知の前に _complete() が一時フォルダを消しているので、通知後の終了でも残らない)
+            await self._call(worker._end_run)
+
+    async def _run_fallbacks(self, worker, fallbacks):
+        """_handle_failure() が返したワーカーを1つずつ実行する (BlastWorker._run_fallbacks と同じ)"""
+        for fallback in fallbacks:
+            if worker.terminated:
+                break
+            worker._current_worker = fallback
+            await self._run_job(fallback)
+            worker._reported_paths.update(fallback._reported_paths)
+        worker._current_worker = None
+
+    async def _run_processes(self, worker, runs):
+        """
+        BlastWorker._run_blast_processes の asyncio 版。全ての blastn を起動し、
+        出力を結果ファイルへ書き出しながら全ての完了を待つ。
+
+        Raises:
+            subprocess.CalledProcessError: いずれかのプロセスが失敗した場合
+            (起動・出力の書き出しに失敗した場合も含め、残りのプロセスは強制終了し、
+            終了を待ってから送出する)
+        """
+        # 出力は起動した順に読み始めるので、最初の起動から数える
+        worker._stream_started = time.monotonic()
+        tasks = []
+        try:
+            for blast_command, blast_cwd, query_path, output_file, keep_qseqid in runs:
+                if worker.terminated:
+                    break  # 起動の途中で中止された
+                query_order, run_state = await self._call(worker._begin_run_state, query_path)
+                process = await asyncio.create_subprocess_exec(
+                    *blast_command,
+                    cwd=blast_cwd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    limit=STREAM_LIMIT,
+                    **popen_platform_kwargs(),
+                )
+                monitor = worker._register_process(_ProcessHandle(process), blast_command)
+                # 起動したらすぐに読み出しを始める (後の起動が失敗しても、片付けの対象になる)
+                tasks.append(
+                    asyncio.ensure_future(
+                        self._stream_process(
+                            worker, process, monitor, blast_command, output_file, keep_qseqid,
+                            query_order, run_state,
+                        )
+                    )
+                )
+
+            for finished in asyncio.as_completed(tasks):
+                await finished
+        except Exception:
+            # 1つでも失敗したら、残りのプロセスも止めて全体をエラーにする
+            worker._kill_processes()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def _stream_process(
+        self, worker, process, monitor, blast_command, output_file, keep_qseqid,
+        query_order, run_state,
+    ):
+        """
+        BlastWorker._stream_process の asyncio 版 (stderr も同じループで読む)。
+        結果ファイルへの書き込みは WRITE_BATCH_LINES 行ずつ共有スレッドプールで行い、
+        遅いフォルダへの書き込みでループ (他の blastn の読み出し) を止めない。
+        """
+        stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        stderr_task = asyncio.ensure_future(_drain_stream(process.stderr, stderr_tail))
+        last_qseqid = None
+        out = await self._call(open, output_file, "wb")
+        pending_write = None
+        try:
+            batch = []
+            async for line in process.stdout:
+                batch.append(line if keep_qseqid else strip_qseqid(line))
+                run_state["rows"] += 1
+
+                qseqid = line.split(b"\t", 1)[0]
+                if qseqid != last_qseqid:
+                    last_qseqid = qseqid
+                    worker._track_query(qseqid, monitor, query_order, run_state)
+
+                if len(batch) >= WRITE_BATCH_LINES:
+                    # 前の書き込みが終わってから次を渡す (順序を保ち、溜めすぎない)
+                    if pending_write is not None:
+                        await pending_write
+                    pending_write = self._loop.run_in_executor(
+                        self._executor, out.writelines, batch
+                    )
+                    batch = []
+            if pending_write is not None:
+                await pending_write
+            pending_write = None
+            if batch:
+                await self._call(out.writelines, batch)
+        finally:
+            if pending_write is not None:
+                await asyncio.wait([pending_write])  # 書き込み中のファイルを閉じない
+            await self._call(out.close)
+        await self._call(monitor.wait_exit)
+        await process.wait()
+        monitor.stop()
+        await stderr_task
+        worker._finish_stream(process, blast_command, "".join(stderr_tail), run_state)
+
+
+async def _drain_stream(stream, tail):
+    """process_utils.drain_stream の asyncio 版"""
+    async for line in stream:
+        tail.append(line.decode("utf-8", errors="replace"))
@@ -0,0 +1,179 @@
+# autotune.py
+"""
+過去のジョブの実測値から、blastn ごとの -num_threads と同時実行数を決める。
+
+num_threads は全ファイル共通の固定値だったため、小さなファイルではスレッドが余り、
+大きなファイルではスレッドが足りなかった。ThreadTuner は完了したジョブの計測値
+(job_metrics の metrics) から、DBごとに
+
+    - 起動時間 S (blastn の起動から最初の出力まで。DBの読み込みが大半)
+    - スレッド数 t ごとの処理速度 r(t) (塩基/秒)
+
+を指数移動平均で学習し、1ジョブの所要時間を S + B / r(t) (B はクエリの塩基数) と見積もる。
+スレッド予算 T の中で同時に走らせられるジョブ数は min(T // t, 解析待ちの数, max_jobs) なので、
+
+    (同時実行数) × B / (S + B / r(t))
+
+(単位時間に処理できる塩基数) が最大になる t を選ぶ。解析待ちが多ければ少ないスレッドで
+多数を並列に、残りが少なければ多くのスレッドで1つを速く処理する。
+まだ測っていない t の速度は、測定済みの最も近い t から線形に伸びると楽観的に見積もるので、
+試す価値のある t は自然に一度試される。
+
+学習したモデルは config.ini と同じフォルダの JSON に保存し、次回のセッションでも使う。
+"""
+import json
+import os
+import tempfile
+
+# 指数移動平均の重み (新しい観測値の割合)
+EWMA_ALPHA = 0.3
+# 処理速度の観測に使う最短の処理時間 (秒)。これより短いと起動時間の誤差が大きい
+MIN_WORK_SEC = 0.05
+
+
+def _ewma(old, new):
+    return new if old is None else (1 - EWMA_ALPHA) * old + EWMA_ALPHA * new
+
+
+class ThreadTuner:
+    """
+    DBごとの起動時間とスレッド数ごとの処理速度を学習し、ジョブのスレッド数を決める。
+
+    GUI / CLI のメインスレッドからだけ呼ぶ (ロックは持たない)。
+    """
+
+    def __init__(self, model_path, db_name, thread_budget, max_jobs=0, max_threads=0, fallback_threads=8):
+        """
+        Args:
+            model_path (str): 学習したモデルの保存先 (JSON)
+            db_name (str): DB名 (モデルはDBごとに持つ)
+            thread_budget (int): 全ジョブ合計のスレッド数の上限
+            max_jobs (int): 同時実行ジョブ数の上限 (0 なら予算のみで決める)
+            max_threads (int): 1ジョブあたりのスレッド数の上限 (0 なら予算まで)
+            fallback_threads (int): まだ何も学習していないときのスレッド数
+        """
+        self.model_path = model_path
+        self.db_name = db_name
+        self.thread_budget = max(1, thread_budget)
+        self.max_jobs = max_jobs if max_jobs > 0 else self.thread_budget
+        self.max_threads = min(max_threads, self.thread_budget) if max_threads > 0 else self.thread_budget
+        self.fallback_threads = max(1, min(fallback_threads, self.max_threads))
+        self._seen_runs = set()  # まとめて実行したファイルの計測を二重に学習しない
+        self.model = self._load()
+
+    @classmethod
+    def from_config(cls, config, config_path):
+        """[AUTOTUNE] 設定からチューナーを作る。無効な場合は None を返す"""
+        if not config.getboolean("AUTOTUNE", "enabled", fallback=False):
+            return None
+        filename = config.get("AUTOTUNE", "model_file", fallback="autotune_model.json")
+        model_path = os.path.join(os.path.dirname(os.path.abspath(config_path)), filename)
+        thread_budget = config.getint("BLAST_SETTINGS", "thread_budget", fallback=0)
+        if thread_budget <= 0:
+            thread_budget = os.cpu_count() or 1
+        return cls(
+            model_path,
+            config.get("BLAST_SETTINGS", "database_name", fallback=""),
+            thread_budget,
+            max_jobs=config.getint("AUTOTUNE", "max_jobs", fallback=0),
+            max_threads=config.getint("AUTOTUNE", "max_threads", fallback=0),
+            fallback_threads=config.getint("BLAST_SETTINGS", "num_threads", fallback=8),
+        )
+
+    # --- 永続化 ---
+    def _load(self):
+        try:
+            with open(self.model_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"databases": {}}
+        except (OSError, ValueError) as e:
+            print(f"自動調整モデルを読み込めないため、学習し直します: {e}")
+            return {"databases": {}}
+
+    def _save(self):
+        """一時ファイルに書いてから置き換える (書き込み中に落ちても壊さない)"""
+        directory = os.path.dirname(self.model_path) or "."
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.model, f, indent=1)
+            os.replace(tmp_path, self.model_path)
+        except OSError as e:
+            print(f"自動調整モデルの保存中にエラー: {e}")
+
+    def _db_model(self):
+        return self.model["databases"].setdefault(
+            self.db_name, {"startup_sec": None, "rates": {}}
+        )
+
+    # --- 学習 ---
+    def observe(self, metrics):
+        """
+        完了したジョブの計測値から、起動時間と処理速度を更新して保存する。
+        BLAST していないジョブ (キャッシュヒットなど) と、同じ run_id の2回目以降は無視する。
+
+        Args:
+            metrics (dict): file_done メッセージの "metrics" (num_threads を含む)
+        """
+        run_id = metrics.get("run_id")
+        if run_id in self._seen_runs:
+            return
+        self._seen_runs.add(run_id)
+        threads = metrics.get("num_threads")
+        bases = metrics.get("bases")
+        blast_sec = metrics.get("blast_sec")
+        if not threads or not bases or not blast_sec:
+            return
+
+        db_model = self._db_model()
+        if metrics.get("first_output_at") is not None:
+            startup = metrics["first_output_at"] - metrics["spawned_at"]
+            db_model["startup_sec"] = _ewma(db_model["startup_sec"], min(startup, blast_sec))
+
+        work_sec = blast_sec - (db_model["startup_sec"] or 0.0)
+        if work_sec >= MIN_WORK_SEC:
+            entry = db_model["rates"].setdefault(str(threads), {"bases_per_sec": None, "samples": 0})
+            entry["bases_per_sec"] = _ewma(entry["bases_per_sec"], bases / work_sec)
+            entry["samples"] += 1
+        self._save()
+
+    # --- 決定 ---
+    def _rate(self, threads, rates):
+        """t スレッドの処理速度。未測定なら最も近い測定済みの t から線形に見積もる"""
+        if threads in rates:
+            return rates[threads]
+        nearest = min(rates, key=lambda t: (abs(t - threads), t))
+        return rates[nearest] * threads / nearest
+
+    def choose_threads(self, query_bases, pending_jobs):
+        """
+        次に起動するジョブのスレッド数を決める。
+
+        Args:
+            query_bases (int): そのジョブのクエリの大きさ (塩基数。ファイルサイズで近似してよい)
+            pending_jobs (int): そのジョブを含む、まだ起動していないジョブの数
+
+        Returns:
+            int: -num_threads に渡すスレッド数
+        """
+        db_model = self._db_model()
+        rates = {
+            int(t): entry["bases_per_sec"]
+            for t, entry in db_model["rates"].items()
+            if entry["bases_per_sec"] and int(t) <= self.max_threads
+        }
+        if not rates:
+            return self.fallback_threads  # まだ学習していない
+        startup = db_model["startup_sec"] or 0.0
+        query_bases = max(1, query_bases)
+
+        best_threads, best_throughput = self.fallback_threads, -1.0
+        for threads in range(1, self.max_threads + 1):
+            concurrent = min(self.thread_budget // threads, max(1, pending_jobs), self.max_jobs)
+            job_sec = startup + query_bases / self._rate(threads, rates)
+            throughput = concurrent * query_bases / job_sec
+            # ほぼ同じなら少ないスレッド数を選ぶ (他のジョブに回せる)
+            if throughput > best_throughput * 1.01:
+                best_threads, best_throughput = threads, throughput
+        return best_threads
@@ -0,0 +1,95 @@
+# fake_blastn.py
+"""
+ベンチマーク用の blastn の代用品。
+
+BlastNavigator が組み立てるコマンド (-query / -db / -outfmt / -num_threads / -out) を
+受け付け、クエリごとに決まった (乱数を使わない) ヒット行を outfmt 6 で出力する。
+挙動は環境変数で調整する。
+
+    BENCH_BLASTN_STARTUP        起動時の待ち時間 (秒, DBの読み込みの代わり)
+    BENCH_BLASTN_QUERY_LATENCY  クエリ1件あたりの待ち時間 (秒)
+    BENCH_BLASTN_HITS           クエリ1件あたりのヒット行数
+    BENCH_BLASTN_FAIL_RATE      失敗させるクエリファイルの割合 (0〜1, ファイル名から決まる)
+"""
+import hashlib
+import os
+import sys
+import time
+
+
+def _stable_fraction(text):
+    """文字列から 0〜1 の決まった値を作る"""
+    return int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF
+
+
+def _iter_queries(query_path):
+    """(クエリID, 配列) を順に返す"""
+    query_id = None
+    sequence = []
+    with open(query_path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if line.startswith(">"):
+                if query_id is not None:
+                    yield query_id, "".join(sequence)
+                parts = line[1:].split(None, 1)
+                query_id = parts[0] if parts else ""
+                sequence = []
+            else:
+                sequence.append(line.strip())
+    if query_id is not None:
+        yield query_id, "".join(sequence)
+
+
+def main(argv):
+    options = {}
+    i = 0
+    while i < len(argv):
+        if argv[i].startswith("-") and i + 1 < len(argv):
+            options[argv[i]] = argv[i + 1]
+            i += 2
+        else:
+            i += 1
+
+    startup = float(os.environ.get("BENCH_BLASTN_STARTUP", "0"))
+    query_latency = float(os.environ.get("BENCH_BLASTN_QUERY_LATENCY", "0"))
+    hits = int(os.environ.get("BENCH_BLASTN_HITS", "3"))
+    fail_rate = float(os.environ.get("BENCH_BLASTN_FAIL_RATE", "0"))
+
+    query_path = options.get("-query")
+    if not query_path or not os.path.exists(query_path):
+        sys.stderr.write(f"BLAST query/options error: query file not found: {query_path}\n")
+        return 2
+    if fail_rate > 0 and _stable_fraction(os.path.basename(query_path)) < fail_rate:
+        sys.stderr.write("BLAST query/options error: simulated failure\n")
+        return 3
+
+    time.sleep(startup)
+
+    fields = options.get("-outfmt", "6 qseqid sseqid pident").split()[1:]
+    out = open(options["-out"], "w") if "-out" in options else sys.stdout
+    try:
+        for query_id, sequence in _iter_queries(query_path):
+            if query_latency:
+                time.sleep(query_latency)
+            digest = int(hashlib.md5(sequence.encode("ascii", "replace")).hexdigest(), 16)
+            for k in range(hits):
+                value = (digest >> (7 * k)) & 0xFFFF
+                row = {
+                    "qseqid": query_id,
+                    "sseqid": f"ref|NZ_{value % 997:06d}|",
+                    "sacc": f"NZ_{value % 997:06d}",
+                    "pident": f"{90 + value % 10}.{k}",
+                    "staxid": str(1000 + value % 50),
+                    "ssciname": f"Bench species {value % 50}",
+                    "stitle": f"Bench species {value % 50} strain {k} chromosome",
+                }
+                out.write("\t".join(row.get(field, "N/A") for field in fields) + "\n")
+        out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
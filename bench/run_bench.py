@@ -0,0 +1,684 @@
+# run_bench.py
+"""
+BlastNavigator 自身のオーバーヘッド (スケジューラ・I/O・UI) を測るベンチマーク。
+
+BLAST そのものの時間を除くため、blastn の代わりに fake_blastn.py を使う
+(起動時間・クエリごとの待ち時間・出力行数・失敗率を調整できる)。
+GUI は起動せずに (Linux でヘッドレスに) 実行し、結果を JSON で出力する。
+
+シナリオ:
+    queue_<N>    JobQueue の追加・並び替え・取り出し (N 件のキュー)
+    listbox_<N>  VirtualListbox の描画・スクロール・ドラッグ (表示できる環境のみ)
+    batch        cli.run_batch によるバッチ全体の時間と、ジョブ間の空き時間
+    ui_latency   Application と同じ手順で MessagePump を動かしたときの
+                 キューからUIまでの遅延とキューの深さ
+    result_format  <file>_result.csv と列指向の .bnc (result_columnar) の
+                 大きさ・変換時間・読み込み時間の比較
+    summary      qseqid 付きの結果から <file>_result.csv を書きながら集計する
+                 (result_summary) 時間と、qseqid 列を取り除くだけの時間の比較
+
+使い方:
+    python bench/run_bench.py
+    python bench/run_bench.py --output result.json
+    python bench/run_bench.py --save-baseline bench/baseline.json
+    python bench/run_bench.py --baseline bench/baseline.json
+
+各シナリオは別プロセスで実行し、ピークメモリ (peak_rss_mb) を個別に測る。
+--baseline を指定すると、時間・メモリの指標を比較し、--threshold を超えて
+悪化したものがあれば終了コード 1 を返す。
+"""
+import argparse
+import configparser
+import heapq
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+FAKE_BLASTN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_blastn.py")
+# 比較に使う指標の接尾辞 (いずれも小さいほど良い) と、悪化とみなす最小の差
+# (1ミリ秒未満の揺らぎなどで誤って悪化と判定しないため)
+NOISE_FLOORS = {"_sec": 0.001, "_ms": 1.0, "_us": 1.0, "_mb": 1.0}
+
+
+def percentile(values, fraction):
+    """values の fraction 分位点 (最近傍) を返す。空なら None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def peak_rss_mb(include_children=False):
+    """このプロセス (と終了した子プロセス) のピークメモリ (MB)。Linux の ru_maxrss は KB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if include_children:
+        peak = max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / 1024.0
+
+
+# --- 偽の BLAST 環境 ---
+def prepare_environment(work_dir, args):
+    """
+    fake_blastn を blastn として置いた bin フォルダ、DB フォルダ、
+    それを指す設定を作る。fake_blastn の挙動は環境変数で子プロセスに渡す。
+
+    Returns:
+        configparser.ConfigParser: ベンチマーク用の設定
+    """
+    bin_dir = os.path.join(work_dir, "bin")
+    db_dir = os.path.join(work_dir, "db")
+    os.makedirs(bin_dir)
+    os.makedirs(db_dir)
+
+    wrapper = os.path.join(bin_dir, "blastn")
+    with open(wrapper, "w") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_BLASTN}" "$@"\n')
+    os.chmod(wrapper, os.stat(wrapper).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    with open(os.path.join(db_dir, "bench.nal"), "w") as f:
+        f.write('TITLE bench\nDBLIST "bench.00"\n')
+    with open(os.path.join(db_dir, "bench.00.nsq"), "wb") as f:
+        f.write(b"\0" * 4096)
+
+    os.environ["BENCH_BLASTN_STARTUP"] = str(args.startup)
+    os.environ["BENCH_BLASTN_QUERY_LATENCY"] = str(args.query_latency)
+    os.environ["BENCH_BLASTN_HITS"] = str(args.hits)
+    os.environ["BENCH_BLASTN_FAIL_RATE"] = str(args.fail_rate)
+
+    config = configparser.ConfigParser()
+    config["PATHS"] = {"blast_path": bin_dir, "database_path": db_dir}
+    config["BLAST_SETTINGS"] = {
+        "database_name": "bench",
+        "num_threads": "1",
+        "max_jobs": str(args.jobs),
+        "thread_budget": str(args.jobs),
+    }
+    config["JOURNAL"] = {"enabled": "false"}
+    for override in args.set:
+        key, _, value = override.partition("=")
+        section, _, option = key.partition(".")
+        if not config.has_section(section):
+            config.add_section(section)
+        config.set(section, option, value)
+    return config
+
+
+def generate_fasta_files(work_dir, num_files, queries_per_file, seed=1):
+    """決まった内容の FASTA ファイルを作る"""
+    rng = random.Random(seed)
+    data_dir = os.path.join(work_dir, "data")
+    os.makedirs(data_dir)
+    paths = []
+    for file_index in range(num_files):
+        path = os.path.join(data_dir, f"sample{file_index:05d}.fasta")
+        with open(path, "w") as f:
+            for query_index in range(queries_per_file):
+                sequence = "".join(rng.choice("ACGT") for _ in range(150))
+                f.write(f">read{query_index} sample{file_index}\n{sequence[:75]}\n{sequence[75:]}\n")
+        paths.append(path)
+    return paths
+
+
+# --- Tk を使わずに MessagePump を動かすイベントループ ---
+class HeadlessMaster:
+    """MessagePump が使う bind / event_generate / after / after_idle だけを持つイベントループ"""
+
+    def __init__(self):
+        self._handlers = {}
+        self._timers = []  # (実行時刻, 連番, 関数) のヒープ
+        self._sequence = itertools.count()
+        self._events = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def bind(self, sequence, func):
+        self._handlers[sequence] = func
+
+    def event_generate(self, sequence, when=None):
+        # ワーカースレッドから呼ばれる
+        with self._lock:
+            self._events.append(sequence)
+        self._wakeup.set()
+
+    def after(self, ms, func):
+        heapq.heappush(self._timers, (time.monotonic() + ms / 1000.0, next(self._sequence), func))
+
+    def after_idle(self, func):
+        self.after(0, func)
+
+    def run_until(self, done, timeout):
+        """done() が True を返すまでイベントとタイマーを処理する"""
+        deadline = time.monotonic() + timeout
+        while not done():
+            if time.monotonic() > deadline:
+                raise TimeoutError("ベンチマークが時間内に終わりませんでした")
+            with self._lock:
+                events, self._events = self._events, []
+            for sequence in events:
+                self._handlers[sequence](None)
+            now = time.monotonic()
+            while self._timers and self._timers[0][0] <= now:
+                heapq.heappop(self._timers)[2]()
+            wait = self._timers[0][0] - time.monotonic() if self._timers else 0.1
+            self._wakeup.wait(max(0.0, min(wait, 0.1)))
+            self._wakeup.clear()
+
+
+def _start_worker(group, num_threads, message_queue, config):
+    from async_engine import start_job
+
+    return start_job(
+        [job.filepath for job in group], message_queue, config, num_threads=num_threads
+    )
+
+
+# --- シナリオ ---
+def scenario_queue(args, size):
+    from job_queue import JobQueue, JobState
+
+    rng = random.Random(2)
+    paths = [f"/bench/sample{i:06d}.fasta" for i in range(size)]
+    jobs = JobQueue()
+
+    start = time.perf_counter()
+    jobs.add(paths)
+    add_sec = time.perf_counter() - start
+
+    num_moves = min(1000, size)
+    start = time.perf_counter()
+    for _ in range(num_moves):
+        jobs.move(rng.randrange(size), rng.randrange(size))
+    move_us = 1e6 * (time.perf_counter() - start) / max(1, num_moves)
+
+    # スケジューラと同じ手順で全ジョブを取り出して完了させる (1割はエラー)
+    start = time.perf_counter()
+    count = 0
+    while True:
+        job = jobs.next_pending()
+        if job is None:
+            break
+        jobs.mark_running(job)
+        if count % 10 == 9:
+            jobs.mark_error(job)
+        else:
+            jobs.finish(job)
+        count += 1
+    schedule_us = 1e6 * (time.perf_counter() - start) / max(1, count)
+    assert jobs.count(JobState.PENDING) == 0
+
+    return {
+        "size": size,
+        "add_sec": add_sec,
+        "move_us": move_us,
+        "schedule_per_job_us": schedule_us,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def scenario_listbox(args, size):
+    try:
+        import tkinter as tk
+
+        root = tk.Tk()
+    except Exception as e:
+        return {"size": size, "skipped": f"Tk を利用できません: {e}"}
+
+    from job_queue import JobQueue
+    from virtual_listbox import VirtualListbox
+
+    rng = random.Random(3)
+    root.geometry("600x400")
+    listbox = VirtualListbox(root)
+    listbox.pack(fill=tk.BOTH, expand=True)
+    root.update()
+
+    jobs = JobQueue()
+    start = time.perf_counter()
+    jobs.add([f"/bench/sample{i:06d}.fasta" for i in range(size)])
+    listbox.set_source(
+        lambda: len(jobs),
+        lambda index: (jobs.job_at(index).display_text, None),
+        lambda index: jobs.job_at(index).job_id,
+    )
+    root.update()
+    add_sec = time.perf_counter() - start
+
+    num_ops = 200
+    start = time.perf_counter()
+    for _ in range(num_ops):
+        listbox.yview_moveto(rng.random())
+        root.update()
+    scroll_ms = 1000 * (time.perf_counter() - start) / num_ops
+
+    start = time.perf_counter()
+    for _ in range(num_ops):
+        index = listbox.top + rng.randrange(5)
+        jobs.move(index, min(len(jobs) - 1, index + 1))
+        listbox.refresh()
+        root.update()
+    drag_ms = 1000 * (time.perf_counter() - start) / num_ops
+    root.destroy()
+
+    return {
+        "size": size,
+        "add_sec": add_sec,
+        "scroll_ms": scroll_ms,
+        "drag_ms": drag_ms,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def scenario_batch(args):
+    import cli
+
+    work_dir = tempfile.mkdtemp(prefix="blastnav_bench_")
+    try:
+        config = prepare_environment(work_dir, args)
+        paths = generate_fasta_files(work_dir, args.batch_files, args.queries)
+
+        # 出力の代わりに、メッセージが届いた時刻を記録する
+        events = []
+        cli._emit = lambda message, as_json, done, total: events.append(
+            (time.monotonic(), message)
+        )
+        start = time.monotonic()
+        # [AUTOTUNE] のモデルは作業フォルダに置く (実行ごとに学習し直す)
+        cli.run_batch(paths, config, config_path=os.path.join(work_dir, "config.ini"))
+        wall_sec = time.monotonic() - start
+
+        # ジョブ間の空き時間: ファイルの完了から、次のファイルの最初の進捗までの時間
+        gaps = []
+        seen = set()
+        last_done = None
+        failed = 0
+        for timestamp, message in events:
+            path = message.get("original_path")
+            if message["type"] == "progress" and path not in seen:
+                seen.add(path)
+                if last_done is not None:
+                    gaps.append(timestamp - last_done)
+            elif message["type"] in ("file_done", "error"):
+                last_done = timestamp
+                if message["type"] == "error":
+                    failed += 1
+
+        return {
+            "files": len(paths),
+            "queries": args.queries,
+            "failed": failed,
+            "wall_sec": wall_sec,
+            "per_file_ms": 1000 * wall_sec / max(1, len(paths)),
+            "idle_gap_p50_ms": 1000 * (percentile(gaps, 0.5) or 0.0),
+            "idle_gap_max_ms": 1000 * (max(gaps) if gaps else 0.0),
+            "peak_rss_mb": peak_rss_mb(),
+            "peak_child_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.0,
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def scenario_ui_latency(args):
+    from job_queue import JobQueue, JobState
+    from message_pump import MessagePump, WorkerMessageQueue
+    from scheduler import take_next_launch
+
+    work_dir = tempfile.mkdtemp(prefix="blastnav_bench_")
+    try:
+        config = prepare_environment(work_dir, args)
+        paths = generate_fasta_files(work_dir, args.batch_files, args.queries)
+
+        master = HeadlessMaster()
+        message_queue = WorkerMessageQueue()
+        jobs = JobQueue()
+        jobs.add(paths)
+        running = {}
+
+        def launch():
+            while True:
+                group, num_threads = take_next_launch(jobs, config, running)
+                if not group:
+                    break
+                worker = _start_worker(group, num_threads, message_queue, config)
+                for job in group:
+                    running[job.filepath] = worker
+
+        def dispatch(message):
+            if message["type"] not in ("file_done", "error"):
+                return
+            path = message["original_path"]
+            if running.pop(path, None) is None:
+                return
+            job = jobs.by_path[path]
+            if message["type"] == "error" and message.get("error_type") != "MoveFileError":
+                jobs.mark_error(job)
+            else:
+                jobs.finish(job)
+            launch()
+
+        pump = MessagePump(master, message_queue, dispatch)
+        start = time.monotonic()
+        pump.start()
+        launch()
+        master.run_until(
+            lambda: not running and not jobs.count(JobState.PENDING), timeout=args.timeout
+        )
+        wall_sec = time.monotonic() - start
+
+        metrics = pump.metrics()
+        return {
+            "files": len(paths),
+            "wall_sec": wall_sec,
+            "dispatched": metrics["dispatched"],
+            "coalesced": metrics["coalesced"],
+            "max_depth": metrics["max_depth"],
+            "latency_avg_ms": metrics["latency_ms_avg"] or 0.0,
+            "latency_p95_ms": metrics["latency_ms_p95"] or 0.0,
+            "latency_max_ms": metrics["latency_ms_max"] or 0.0,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def generate_result_csv(path, num_rows, seed=4, qseqid=False):
+    """
+    ref_prok_rep_genomes の結果に似た outfmt 6 のファイルを書く
+    (クエリごとに同じ属の近縁なゲノムが並び、学名とタイトルが繰り返される)。
+    qseqid = True なら、先頭に qseqid 列を付けた RAW_FIELDS 形式で書く。
+    """
+    rng = random.Random(seed)
+    genera = ["Escherichia", "Klebsiella", "Salmonella", "Pseudomonas", "Bacillus",
+              "Staphylococcus", "Streptococcus", "Enterococcus", "Clostridium", "Vibrio"]
+    taxa = [
+        (100000 + i, f"{genera[i % len(genera)]} species_{i}") for i in range(2000)
+    ]
+    with open(path, "w", encoding="utf-8") as out:
+        written = 0
+        query = 0
+        while written < num_rows:
+            prefix = f"q{query}\t" if qseqid else ""
+            query += 1
+            genus = rng.randrange(len(genera))
+            for _ in range(min(rng.randint(5, 50), num_rows - written)):
+                staxid, ssciname = taxa[genus + len(genera) * rng.randrange(200)]
+                strain = rng.randrange(20)
+                out.write(
+                    f"{prefix}{rng.uniform(80, 100):.3f}\tNZ_CP{staxid:06d}{strain:02d}.1\t"
+                    f"{staxid}\t"
+                    f"{ssciname}\t{ssciname} strain ST{strain} chromosome, complete genome\n"
+                )
+                written += 1
+
+
+def scenario_result_format(args):
+    from result_columnar import convert_csv, iter_rows, read_columns
+
+    work_dir = tempfile.mkdtemp(prefix="blastnav_bench_")
+    try:
+        csv_path = os.path.join(work_dir, "sample.fasta_result.csv")
+        columnar_path = os.path.join(work_dir, "sample.fasta_result.bnc")
+        generate_result_csv(csv_path, args.format_rows)
+
+        start = time.perf_counter()
+        convert_csv(csv_path, columnar_path)
+        convert_sec = time.perf_counter() - start
+        # 変換は1ブロックずつなので、結果の行数によらずメモリが一定であること
+        convert_peak_rss_mb = peak_rss_mb()
+
+        # 後段のスクリプトと同じく、CSV を列ごとのリストに読み込む
+        start = time.perf_counter()
+        columns = [[] for _ in range(5)]
+        with open(csv_path, encoding="utf-8") as f:
+            for line in f:
+                pident, sacc, staxid, ssciname, stitle = line.rstrip("\n").split("\t")
+                columns[0].append(float(pident))
+                columns[1].append(sacc)
+                columns[2].append(int(staxid))
+                columns[3].append(ssciname)
+                columns[4].append(stitle)
+        csv_load_sec = time.perf_counter() - start
+        del columns
+
+        start = time.perf_counter()
+        read_columns(columnar_path)
+        columnar_load_sec = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in iter_rows(columnar_path):
+            pass
+        columnar_rows_sec = time.perf_counter() - start
+
+        csv_mb = os.path.getsize(csv_path) / 1e6
+        columnar_mb = os.path.getsize(columnar_path) / 1e6
+        return {
+            "rows": args.format_rows,
+            "csv_size_mb": csv_mb,
+            "columnar_size_mb": columnar_mb,
+            "size_ratio": csv_mb / columnar_mb if columnar_mb else None,
+            "convert_sec": convert_sec,
+            "csv_load_sec": csv_load_sec,
+            "columnar_load_sec": columnar_load_sec,
+            "columnar_rows_sec": columnar_rows_sec,
+            "load_speedup": csv_load_sec / columnar_load_sec if columnar_load_sec else None,
+            "convert_peak_rss_mb": convert_peak_rss_mb,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def scenario_summary(args):
+    from blast_results import strip_qseqid
+    from result_summary import SampleSummary, iter_best_hits
+
+    work_dir = tempfile.mkdtemp(prefix="blastnav_bench_")
+    try:
+        raw_path = os.path.join(work_dir, "raw_result.tsv")
+        csv_path = os.path.join(work_dir, "sample.fasta_result.csv")
+        generate_result_csv(raw_path, args.format_rows, qseqid=True)
+
+        # 集計しない場合も qseqid 列を取り除く1回の読み書きは必要
+        start = time.perf_counter()
+        with open(raw_path, "rb") as raw, open(csv_path, "wb") as out:
+            out.writelines(map(strip_qseqid, raw))
+        strip_sec = time.perf_counter() - start
+
+        settings = {"tie_rule": "lca", "tie_delta": 0.5, "min_pident": 0.0}
+        start = time.perf_counter()
+        summary = SampleSummary(0)
+        queries = 0
+        for _, assignment in iter_best_hits(
+            raw_path, settings["tie_rule"], settings["tie_delta"], strip_to=csv_path
+        ):
+            summary.add(assignment)
+            queries += 1
+        summary.total_queries = queries
+        summary.write(os.path.join(work_dir, "sample.fasta_summary.tsv"), settings)
+        summary_sec = time.perf_counter() - start
+
+        return {
+            "rows": args.format_rows,
+            "queries": queries,
+            "strip_sec": strip_sec,
+            "summary_sec": summary_sec,
+            "summary_overhead_sec": summary_sec - strip_sec,
+            "rows_per_sec": args.format_rows / summary_sec if summary_sec else None,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def scenario_names(args):
+    names = []
+    for size in args.queue_sizes:
+        names.append(f"queue_{size}")
+    for size in args.queue_sizes:
+        names.append(f"listbox_{size}")
+    names.extend(["batch", "ui_latency", "result_format", "summary"])
+    if args.only:
+        names = [name for name in names if any(name.startswith(p) for p in args.only)]
+    return names
+
+
+def run_scenario(name, args):
+    kind, _, size = name.partition("_")
+    if kind == "queue":
+        return scenario_queue(args, int(size))
+    if kind == "listbox":
+        return scenario_listbox(args, int(size))
+    if name == "batch":
+        return scenario_batch(args)
+    if name == "ui_latency":
+        return scenario_ui_latency(args)
+    if name == "result_format":
+        return scenario_result_format(args)
+    if name == "summary":
+        return scenario_summary(args)
+    raise ValueError(f"不明なシナリオです: {name}")
+
+
+# --- ベースラインとの比較 ---
+def compare(results, baseline, threshold):
+    """
+    時間・メモリの指標をベースラインと比較する。
+
+    Returns:
+        tuple[list[tuple], int]: ((シナリオ, 指標, ベースライン, 今回, 変化率, 悪化か) のリスト,
+        threshold と NOISE_FLOORS を超えて悪化した指標の数)
+    """
+    rows = []
+    regressions = 0
+    for scenario, metrics in results["scenarios"].items():
+        base_metrics = baseline.get("scenarios", {}).get(scenario)
+        if not base_metrics or "skipped" in metrics or "skipped" in base_metrics:
+            continue
+        for key, value in metrics.items():
+            suffix = next((s for s in NOISE_FLOORS if key.endswith(s)), None)
+            if suffix is None or key not in base_metrics:
+                continue
+            base_value = base_metrics[key]
+            change = (value - base_value) / base_value if base_value else 0.0
+            regressed = change > threshold and value - base_value > NOISE_FLOORS[suffix]
+            if regressed:
+                regressions += 1
+            rows.append((scenario, key, base_value, value, change, regressed))
+    return rows, regressions
+
+
+def print_comparison(rows):
+    for scenario, key, base_value, value, change, regressed in rows:
+        flag = "  <-- 悪化" if regressed else ""
+        print(
+            f"{scenario:<16} {key:<22} {base_value:>12.4f} -> {value:>12.4f} "
+            f"({change:+.1%}){flag}",
+            file=sys.stderr,
+        )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="BlastNavigator ベンチマーク")
+    parser.add_argument(
+        "--queue-sizes", type=int, nargs="+", default=[10, 1000, 50000],
+        help="キュー・リストボックスのシナリオの件数",
+    )
+    parser.add_argument("--batch-files", type=int, default=20, help="バッチのファイル数")
+    parser.add_argument("--queries", type=int, default=20, help="1ファイルあたりのクエリ数")
+    parser.add_argument("--jobs", type=int, default=1, help="同時に実行するジョブ数")
+    parser.add_argument("--startup", type=float, default=0.05, help="blastn の起動時間 (秒)")
+    parser.add_argument(
+        "--query-latency", type=float, default=0.001, help="クエリ1件あたりの時間 (秒)"
+    )
+    parser.add_argument("--hits", type=int, default=3, help="クエリ1件あたりのヒット行数")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="失敗させるファイルの割合")
+    parser.add_argument(
+        "--format-rows", type=int, default=1000000, help="result_format / summary の結果の行数"
+    )
+    parser.add_argument(
+        "--set", action="append", default=[], metavar="SECTION.key=value",
+        help="設定を上書きする (例: PACKING.enabled=true)",
+    )
+    parser.add_argument("--only", nargs="+", help="名前がこれで始まるシナリオだけを実行する")
+    parser.add_argument("--timeout", type=float, default=600, help="1シナリオの制限時間 (秒)")
+    parser.add_argument("--output", help="結果の JSON の保存先 (省略時は標準出力)")
+    parser.add_argument("--baseline", help="比較するベースラインの JSON")
+    parser.add_argument("--save-baseline", help="結果をベースラインとして保存する")
+    parser.add_argument(
+        "--threshold", type=float, default=0.10, help="悪化とみなす変化率 (0.10 = 10%%)"
+    )
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = build_parser().parse_args(argv)
+
+    if args.child:
+        # 子プロセス: 1つのシナリオを実行して結果を出力する
+        print(json.dumps(run_scenario(args.child, args)))
+        return 0
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": {
+                key: value
+                for key, value in vars(args).items()
+                if key not in ("output", "baseline", "save_baseline", "child")
+            },
+        },
+        "scenarios": {},
+    }
+    for name in scenario_names(args):
+        print(f"実行中: {name}", file=sys.stderr)
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), *argv, "--child", name],
+            capture_output=True,
+            text=True,
+            timeout=args.timeout,
+        )
+        if completed.returncode != 0:
+            results["scenarios"][name] = {"skipped": completed.stderr.strip()[-500:]}
+            continue
+        results["scenarios"][name] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows, regressions = compare(results, baseline, args.threshold)
+        print_comparison(rows)
+        if regressions:
+            print(f"{regressions} 個の指標が {args.threshold:.0%} を超えて悪化しました。", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,414 @@
+# blast_agent.py
+"""
+BlastNavigator エージェント: このノードで blastn を実行し、結果を送り返す。
+
+同じ DB をマウントした各ノードで起動しておき、解析する端末の [AGENTS] の hosts に
+"このホスト:ポート" を登録する (通信の形式は agent_pool.py を参照)。
+
+    python blast_agent.py --config config.ini --port 7070 --slots 2
+
+blastn の実行ファイルと DB フォルダ、-num_threads はこのノードの config.ini の
+[PATHS] / [BLAST_SETTINGS] を使う。送られてきた引数は ALLOWED_ARGS に挙げたものだけを
+受け付け (-db はこのノードの DB フォルダにある DB の名前だけ)、それ以外は拒否する。
+既定ではこのノード (127.0.0.1) からの接続だけを受け付ける。他のノードから使う場合は
+--host を指定し、[AGENTS] の token (合言葉) を必ず設定すること (token が空なら起動しない)。
+認証は token だけなので、信頼できるネットワークでのみ使うこと。
+"""
+import argparse
+import glob
+import hmac
+import ipaddress
+import json
+import os
+import shutil
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+from collections import deque
+
+from agent_pool import DEFAULT_PORT, send_message
+from blast_worker import STDERR_TAIL_LINES
+from config_manager import CONFIG_PATH, load_config
+from job_metrics import ProcessMonitor
+from process_utils import (
+    blastn_executable,
+    drain_stream,
+    kill_process_tree,
+    popen_platform_kwargs,
+)
+
+# blastn の標準出力を1フレームで送る最大のバイト数
+OUTPUT_CHUNK_BYTES = 64 * 1024
+# クエリを受け取るときの読み込み単位
+RECEIVE_CHUNK_BYTES = 1024 * 1024
+# ready を返してからクエリを受け取り終えるまでの制限時間 (秒, スロットを確保したままにしない)
+RECEIVE_TIMEOUT_SEC = 300
+# 受け付けるクエリの最大の大きさ (MB, [AGENTS] max_query_mb の既定値)
+DEFAULT_MAX_QUERY_MB = 1024
+# 既定の待ち受けアドレス (このノードからの接続だけを受け付ける)
+DEFAULT_HOST = "127.0.0.1"
+
+# 受け付ける blastn の引数 (-query と -num_threads 以外は、この順にコマンドに並べる)
+ALLOWED_ARGS = ("-task", "-db", "-outfmt", "-evalue", "-max_target_seqs")
+# -task に指定できる値
+ALLOWED_TASKS = ("megablast", "dc-megablast", "blastn", "blastn-short")
+
+
+class RequestRejected(ValueError):
+    """受け付けられない要求 (引数・クエリの大きさ)。エージェントの障害ではない"""
+
+
+def is_loopback(host):
+    """このノードからの接続だけを受け付けるアドレスか"""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False  # ホスト名は外部から接続できるものとみなす
+
+
+class AgentServer(socketserver.ThreadingTCPServer):
+    """接続ごとのスレッドでジョブを受け付け、slots 件まで同時に blastn を実行する"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, config, slots):
+        """
+        Args:
+            address (tuple[str, int]): 待ち受けるアドレスとポート
+            config (configparser.ConfigParser): このノードの設定
+            slots (int): 同時に実行するジョブ数
+
+        Raises:
+            ValueError: token が空のまま、このノード以外から接続できるアドレスで待ち受けようとした
+        """
+        token = config.get("AGENTS", "token", fallback="")
+        if not token and not is_loopback(address[0]):
+            raise ValueError(
+                f"[AGENTS] の token が空のため、{address[0]} では待ち受けできません。\n"
+                "他のノードから使う場合は token を設定してください。"
+            )
+        super().__init__(address, _AgentHandler)
+        self.config = config
+        self.slots = max(1, slots)
+        self.token = token
+        self.max_query_bytes = (
+            config.getint("AGENTS", "max_query_mb", fallback=DEFAULT_MAX_QUERY_MB) * 1024 * 1024
+        )
+        self.node = socket.gethostname()
+        self.running = 0
+        self._lock = threading.Lock()
+
+    def reserve_slot(self):
+        with self._lock:
+            if self.running >= self.slots:
+                return False
+            self.running += 1
+            return True
+
+    def release_slot(self):
+        with self._lock:
+            self.running -= 1
+
+    def check_token(self, token):
+        """送られてきた token が一致するか (比較にかかる時間から推測されないよう定数時間で比べる)"""
+        if not isinstance(token, str):
+            return False
+        return hmac.compare_digest(token.encode("utf-8"), self.token.encode("utf-8"))
+
+    def check_query_size(self, size):
+        """
+        クエリの大きさを確かめる。
+
+        Raises:
+            RequestRejected: 大きさが不正・[AGENTS] max_query_mb を超える場合
+        """
+        if not isinstance(size, int) or isinstance(size, bool) or size < 0:
+            raise RequestRejected(f"クエリの大きさが不正です: {size!r:.50}")
+        if size > self.max_query_bytes:
+            raise RequestRejected(
+                f"クエリが大きすぎます ({size} バイト, 上限 {self.max_query_bytes} バイト)"
+            )
+        return size
+
+    def build_command(self, args, query_path):
+        """
+        送られてきた引数を確かめ、このノードの blastn と -num_threads、受け取ったクエリで
+        コマンドを組み立てる。ALLOWED_ARGS 以外の引数 (ファイルを読み書きする
+        -import_search_strategy など) は受け付けない。
+
+        Returns:
+            tuple[list[str], str]: (コマンド, 実行ディレクトリ = このノードの DB フォルダ)
+
+        Raises:
+            RequestRejected: 受け付けない引数・値がある場合
+        """
+        if (
+            not isinstance(args, list)
+            or len(args) % 2
+            or not all(isinstance(arg, str) for arg in args)
+        ):
+            raise RequestRejected("引数が不正です")
+        options = {}
+        for name, value in zip(args[0::2], args[1::2]):
+            if name not in ALLOWED_ARGS and name not in ("-query", "-num_threads"):
+                raise RequestRejected(f"この引数は指定できません: {name}")
+            if name in options:
+                raise RequestRejected(f"引数が重複しています: {name}")
+            options[name] = value
+        if options.get("-query") != "{query}":
+            raise RequestRejected("-query は必須です")
+
+        db_path = self.config.get("PATHS", "database_path")
+        command = [blastn_executable(self.config.get("PATHS", "blast_path")), "-query", query_path]
+        for name in ALLOWED_ARGS:
+            if name in options:
+                command += [name, self._check_value(name, options[name], db_path)]
+        if "-num_threads" in options:
+            num_threads = self.config.get(
+                "BLAST_SETTINGS", "num_threads", fallback=options["-num_threads"]
+            )
+            command += ["-num_threads", self._check_value("-num_threads", num_threads, db_path)]
+        return command, db_path
+
+    @staticmethod
+    def _check_value(name, value, db_path):
+        """引数の値を確かめて返す (RequestRejected: 不正な値)"""
+        if name == "-task":
+            if value not in ALLOWED_TASKS:
+                raise RequestRejected(f"-task の値が不正です: {value}")
+        elif name == "-db":
+            # DB フォルダにある DB の名前だけ (パスや DB フォルダの外は指定できない)
+            names = value.split()
+            for db_name in names:
+                pattern = os.path.join(glob.escape(db_path), glob.escape(db_name) + ".*")
+                if (
+                    db_name != os.path.basename(db_name)
+                    or db_name.startswith(".")
+                    or not glob.glob(pattern)
+                ):
+                    raise RequestRejected(f"このノードの DB フォルダにない DB です: {db_name}")
+            if not names:
+                raise RequestRejected("-db の値が空です")
+        elif name == "-outfmt":
+            if value.split()[:1] != ["6"]:
+                raise RequestRejected(f"-outfmt は表形式 (6) だけを指定できます: {value}")
+        elif name == "-evalue":
+            try:
+                float(value)
+            except ValueError:
+                raise RequestRejected(f"-evalue の値が不正です: {value}") from None
+        elif not value.isdigit() or int(value) < 1:  # -max_target_seqs / -num_threads
+            raise RequestRejected(f"{name} の値が不正です: {value}")
+        return value
+
+
+class _AgentHandler(socketserver.BaseRequestHandler):
+    """1つの接続 (状態の問い合わせ、または1つの blastn の実行) を処理する"""
+
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._send_lock = threading.Lock()
+        rfile = self.request.makefile("rb")
+        try:
+            header = self._read_header(rfile)
+            if header is None:
+                return
+            if not self.server.check_token(header.get("token", "")):
+                self._send({"type": "error", "message": "token が一致しません"})
+            elif header.get("type") == "status":
+                self._send(
+                    {
+                        "type": "status",
+                        "node": self.server.node,
+                        "slots": self.server.slots,
+                        "running": self.server.running,
+                    }
+                )
+            elif header.get("type") == "run":
+                self._run_job(header, rfile)
+            else:
+                self._send({"type": "error", "message": f"不明な要求です: {header.get('type')}"})
+        except (OSError, ValueError):
+            pass  # 相手が接続を切った・要求が不正
+        finally:
+            rfile.close()
+
+    def _read_header(self, rfile):
+        """run のクエリは大きいことがあるので、ヘッダーだけを読む (size 分は _receive_query で読む)"""
+        line = rfile.readline(64 * 1024)
+        if not line:
+            return None
+        return json.loads(line)
+
+    def _send(self, header, payload=b""):
+        with self._send_lock:
+            send_message(self.request, header, payload)
+
+    def _receive_query(self, rfile, size, query_path):
+        with open(query_path, "wb") as out:
+            remaining = size
+            while remaining:
+                data = rfile.read(min(remaining, RECEIVE_CHUNK_BYTES))
+                if not data:
+                    raise ConnectionError("クエリの途中で接続が閉じられました")
+                out.write(data)
+                remaining -= len(data)
+
+    def _run_job(self, header, rfile):
+        """
+        要求を確かめ、スロットを確保してから ready を返してクエリを受け取り、blastn を起動する。
+        空きがなければクエリを受け取らずに busy を返す。
+        """
+        server = self.server
+        try:
+            size = server.check_query_size(header.get("size", 0))
+            # 引数はクエリを受け取る前に確かめる (クエリの置き場所は後で差し替える)
+            server.build_command(header.get("args"), "")
+        except RequestRejected as e:
+            self._send({"type": "error", "error_type": "RequestRejected", "message": str(e)})
+            return
+        if not server.reserve_slot():
+            self._send({"type": "busy"})
+            return
+
+        work_dir = None
+        try:
+            work_dir = tempfile.mkdtemp(prefix="blastnav_agent_")
+            query_path = os.path.join(work_dir, "query.fasta")
+            self._send({"type": "ready"})
+            self.request.settimeout(RECEIVE_TIMEOUT_SEC)
+            self._receive_query(rfile, size, query_path)
+            self.request.settimeout(None)
+            try:
+                command, cwd = server.build_command(header.get("args"), query_path)
+                process = subprocess.Popen(
+                    command,
+                    cwd=cwd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    **popen_platform_kwargs(),
+                )
+            except FileNotFoundError as e:
+                self._send(
+                    {
+                        "type": "error",
+                        "error_type": "FileNotFoundError",
+                        "message": str(e),
+                        "filename": e.filename,
+                    }
+                )
+                return
+            except Exception as e:
+                self._send({"type": "error", "message": f"blastn を起動できません: {e}"})
+                return
+            self._stream(process, command, rfile, header.get("heartbeat_sec", 5))
+        finally:
+            server.release_slot()
+            if work_dir is not None:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _stream(self, process, command, rfile, heartbeat_sec):
+        """blastn の標準出力を送り続け、終了したら終了コードと資源使用量を送る"""
+        monitor = ProcessMonitor(process)
+        print(f"開始 (PID {process.pid}): {' '.join(command[1:])}", flush=True)
+        stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        stderr_thread = threading.Thread(
+            target=drain_stream, args=(process.stderr, stderr_tail), daemon=True
+        )
+        stderr_thread.start()
+        finished = threading.Event()
+        # 相手が接続を切ったら (中止・ノードの停止)、blastn をプロセスツリーごと終了する
+        threading.Thread(
+            target=self._watch_disconnect, args=(rfile, process, finished), daemon=True
+        ).start()
+        threading.Thread(
+            target=self._send_heartbeats, args=(heartbeat_sec, finished), daemon=True
+        ).start()
+
+        self._send({"type": "started", "pid": process.pid, "node": self.server.node})
+        try:
+            while True:
+                data = process.stdout.read1(OUTPUT_CHUNK_BYTES)
+                if not data:
+                    break
+                self._send({"type": "output"}, data)
+        except OSError:
+            kill_process_tree(process, grace_sec=0)  # 送れない = 相手がいない
+            raise
+        finally:
+            monitor.wait_exit()
+            process.wait()
+            monitor.stop()
+            finished.set()
+            stderr_thread.join()
+            print(f"終了 (PID {process.pid}): 終了コード {process.returncode}", flush=True)
+
+        self._send(
+            {
+                "type": "exit",
+                "returncode": process.returncode,
+                "stderr": "".join(stderr_tail),
+                "cpu_user_sec": monitor.cpu_user_sec,
+                "cpu_sys_sec": monitor.cpu_sys_sec,
+                "peak_rss_bytes": monitor.peak_rss_bytes,
+                "read_bytes": monitor.read_bytes,
+                "write_bytes": monitor.write_bytes,
+            }
+        )
+
+    def _watch_disconnect(self, rfile, process, finished):
+        try:
+            rfile.read(1)  # 相手は何も送らないので、読めるのは接続が切れたときだけ
+        except (OSError, ValueError):
+            pass
+        if not finished.is_set() and process.poll() is None:
+            print(f"接続が切れたため、blastn (PID {process.pid}) を終了します", flush=True)
+            kill_process_tree(process)
+
+    def _send_heartbeats(self, heartbeat_sec, finished):
+        while not finished.wait(max(0.5, heartbeat_sec)):
+            try:
+                self._send({"type": "heartbeat"})
+            except OSError:
+                return
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="blast_agent", description="BlastNavigator エージェント (このノードで blastn を実行する)"
+    )
+    parser.add_argument("--config", default=CONFIG_PATH, help="このノードの設定ファイル")
+    parser.add_argument(
+        "--host",
+        default=DEFAULT_HOST,
+        help=f"待ち受けるアドレス (既定は {DEFAULT_HOST}。他のノードから使う場合は [AGENTS] token が必要)",
+    )
+    parser.add_argument("--port", type=int, help=f"待ち受けるポート (省略時は [AGENTS] port か {DEFAULT_PORT})")
+    parser.add_argument("--slots", type=int, help="同時に実行するジョブ数 (省略時は [AGENTS] slots)")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    port = args.port or config.getint("AGENTS", "port", fallback=DEFAULT_PORT)
+    slots = args.slots or config.getint("AGENTS", "slots", fallback=1)
+    try:
+        server = AgentServer((args.host, port), config, slots)
+    except ValueError as e:
+        print(f"エージェントを開始できません: {e}", file=sys.stderr)
+        return 1
+    with server:
+        print(f"エージェントを開始しました: {server.node} {args.host}:{port} ({server.slots} スロット)", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("エージェントを終了します。", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+# blast_db.py
+import hashlib
+import os
+import shlex
+
+
+def find_alias_file(db_path, db_name):
+    """DBの代表ファイル (.nal または .pal) のパスを返す。見つからなければ None"""
+    for ext in (".nal", ".pal"):
+        alias_path = os.path.join(db_path, f"{db_name}{ext}")
+        if os.path.exists(alias_path):
+            return alias_path
+    return None
+
+
+def read_volume_names(alias_path):
+    """
+    エイリアスファイルの DBLIST 行から、ボリューム名の一覧を読み取る。
+    例: DBLIST "ref_prok_rep_genomes.00" "ref_prok_rep_genomes.01"
+    """
+    volumes = []
+    with open(alias_path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if line.startswith("DBLIST"):
+                volumes.extend(shlex.split(line[len("DBLIST") :], posix=True))
+    return volumes
+
+
+def list_volume_files(db_path, db_name):
+    """
+    DBを構成するファイル (エイリアスファイルと各ボリュームの .nsq/.nin/.nhr など) を返す。
+
+    Returns:
+        list[str]: ファイルパスの一覧 (名前順)
+    """
+    alias_path = find_alias_file(db_path, db_name)
+    if alias_path is None:
+        return []
+
+    # DBLIST がない単一ボリュームのDBは、DB名そのものをボリューム名とみなす
+    volumes = read_volume_names(alias_path) or [db_name]
+    prefixes = tuple(f"{os.path.basename(v)}." for v in volumes)
+
+    files = [alias_path]
+    for entry in sorted(os.listdir(db_path)):
+        full_path = os.path.join(db_path, entry)
+        if full_path != alias_path and entry.startswith(prefixes):
+            if os.path.isfile(full_path):
+                files.append(full_path)
+    return files
+
+
+def db_fingerprint(db_path, db_name):
+    """
+    DBの指紋を返す。エイリアスファイルの内容と、各ボリュームファイルの
+    名前・サイズ・更新時刻から計算するので、DBが更新されると値が変わる。
+    """
+    digest = hashlib.sha256()
+    for file_path in list_volume_files(db_path, db_name):
+        stat = os.stat(file_path)
+        digest.update(
+            f"{os.path.basename(file_path)}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode(
+                "utf-8"
+            )
+        )
+        if file_path.endswith((".nal", ".pal")):
+            with open(file_path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
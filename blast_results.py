@@ -0,0 +1,111 @@
+# blast_results.py
+"""
+BLAST の表形式出力 (outfmt 6) を扱う補助関数。
+
+<file>_result.csv の列は RESULT_FIELDS のとおり (ヘッダなし・タブ区切り)。
+内部処理でクエリごとに行を振り分ける必要がある場合は、先頭に qseqid 列を
+加えた RAW_FIELDS で blastn を実行し、書き出すときに qseqid 列を取り除く。
+"""
+import array
+
+# <file>_result.csv に出力する列
+RESULT_FIELDS = "pident sacc staxid ssciname stitle"
+# 内部処理用の列 (先頭に qseqid を付ける)
+RAW_FIELDS = f"qseqid {RESULT_FIELDS}"
+
+
+def parse_staxid(text):
+    """
+    staxid 列の値を整数にする。"N/A" などの数字でない値は 0、
+    "9606;63221" のように複数の taxid が並ぶ場合は先頭の taxid にする。
+
+    Args:
+        text (str | bytes): staxid 列の値
+    """
+    head = text.split(b";" if isinstance(text, bytes) else ";", 1)[0].strip()
+    return int(head) if head.isdigit() else 0
+
+
+def strip_qseqid(line):
+    """RAW_FIELDS の1行 (bytes) から先頭の qseqid 列を取り除く"""
+    return line.split(b"\t", 1)[1] if b"\t" in line else line
+
+
+def index_rows_by_representative(raw_file, num_representatives):
+    """
+    重複除去したクエリ (u0, u1, ...) の結果ファイルで、代表ごとの行の範囲を調べる。
+    blastn はクエリの入力順に結果を出力するので、代表ごとの行は連続している。
+
+    Returns:
+        tuple[array.array, array.array]: 代表番号ごとの (開始オフセット, 終了オフセット)
+    """
+    starts = array.array("q", [0]) * num_representatives
+    ends = array.array("q", [0]) * num_representatives
+    offset = 0
+    with open(raw_file, "rb") as f:
+        for line in f:
+            qseqid = line.split(b"\t", 1)[0]
+            rep_index = int(qseqid[1:])  # "u123" -> 123
+            if ends[rep_index] != offset:
+                starts[rep_index] = offset
+            offset += len(line)
+            ends[rep_index] = offset
+    return starts, ends
+
+
+def expand_deduplicated_results(raw_file, output_file, representatives, num_representatives):
+    """
+    重複除去したクエリの結果を、元の全レコードに展開して <file>_result.csv を書く。
+
+    元のレコード順に代表の結果をコピーするので、重複除去せずに BLAST した場合と
+    同じ内容・同じ順序の結果になる。代表ごとの行はオフセットで読み直すため、
+    結果全体をメモリに載せない。
+
+    Args:
+        raw_file (str): RAW_FIELDS 形式の結果ファイル (qseqid は u<代表番号>)
+        output_file (str): 出力先 (<file>_result.csv)
+        representatives (array.array): 元のレコード順の代表番号
+        num_representatives (int): 代表の数
+    """
+    starts, ends = index_rows_by_representative(raw_file, num_representatives)
+    with open(raw_file, "rb") as raw, open(output_file, "wb") as out:
+        for rep_index in representatives:
+            length = ends[rep_index] - starts[rep_index]
+            if length <= 0:
+                continue  # ヒットなし
+            raw.seek(starts[rep_index])
+            for line in raw.read(length).splitlines(keepends=True):
+                out.write(strip_qseqid(line))
+
+
+def split_packed_results(raw_file, output_files):
+    """
+    まとめて BLAST したクエリ (qseqid は p<ファイル番号>_<レコード番号>) の結果を、
+    ファイルごとの <file>_result.csv に振り分ける (qseqid 列は取り除く)。
+
+    blastn はクエリの入力順に結果を出力するので、ファイルごとの行は連続している。
+    ヒットのないファイルにも空の結果ファイルを作る。
+
+    Args:
+        raw_file (str): RAW_FIELDS 形式の結果ファイル
+        output_files (list[str]): ファイル番号順の出力先
+    """
+    for output_file in output_files:
+        open(output_file, "wb").close()
+
+    current_index = None
+    out = None
+    try:
+        with open(raw_file, "rb") as raw:
+            for line in raw:
+                qseqid = line.split(b"\t", 1)[0]
+                file_index = int(qseqid[1 : qseqid.index(b"_")])  # "p3_17" -> 3
+                if file_index != current_index:
+                    if out is not None:
+                        out.close()
+                    out = open(output_files[file_index], "ab")
+                    current_index = file_index
+                out.write(strip_qseqid(line))
+    finally:
+        if out is not None:
+            out.close()
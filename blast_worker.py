@@ -3,6 +3,100 @@ import subprocess
 import threading
 import os
 import shutil
+import tempfile
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from agent_pool import AgentRequestRejectedError, AgentUnavailableError
+from blast_results import RAW_FIELDS, expand_deduplicated_results, strip_qseqid
+from db_warmup import get_warmer
+from fasta_tools import (
+    count_fasta_records,
+    deduplicate_fasta,
+    read_query_ids,
+    read_query_order,
+    split_fasta,
+)
+from job_metrics import ProcessMonitor, next_run_id, summarize_job
+from process_utils import (
+    blastn_executable,
+    drain_stream,
+    kill_process_tree,
+    popen_platform_kwargs,
+)
+from result_cache import make_cache_key
+from result_columnar import COLUMNAR_SUFFIX, columnar_settings_from_config, convert_csv
+from result_summary import (
+    BEST_HITS_SUFFIX,
+    SUMMARY_SUFFIX,
+    SampleSummary,
+    iter_best_hits,
+    summary_cache_key,
+    summary_settings_from_config,
+    summary_suffixes,
+)
+from staging import get_scratch, publish_file
+
+
+# CalledProcessError に添える stderr の末尾の最大行数
+STDERR_TAIL_LINES = 200
+# 行数・スループットの進捗を通知する最短間隔 (秒)
+PROGRESS_INTERVAL = 1.0
+
+# 中止の理由と表示用の文字列 ("cancelled" メッセージの reason)
+CANCEL_REASONS = {
+    "user": "ユーザーによる中止",
+    "timeout": "制限時間の超過",
+    "batch_timeout": "バッチ全体の制限時間の超過",
+}
+
+
+def job_timeout_sec(config, filepaths):
+    """
+    [TIMEOUTS] 設定から、ジョブの制限時間 (秒) を決める。
+    job_timeout_min (固定) と sec_per_mb (クエリ 1MB あたり) の合計で、0 なら制限しない。
+
+    Args:
+        config (configparser.ConfigParser): 設定情報
+        filepaths (list[str]): ジョブで解析するファイル
+
+    Returns:
+        float | None: 制限時間 (秒)。制限しない場合は None
+    """
+    limit = config.getfloat("TIMEOUTS", "job_timeout_min", fallback=0) * 60
+    sec_per_mb = config.getfloat("TIMEOUTS", "sec_per_mb", fallback=0)
+    if sec_per_mb > 0:
+        size = 0
+        for filepath in filepaths:
+            try:
+                size += os.path.getsize(filepath)
+            except OSError:
+                pass
+        limit += sec_per_mb * size / (1024 * 1024)
+    return limit if limit > 0 else None
+
+
+def format_duration(seconds):
+    """秒数を「1時間02分」「3分05秒」のような表示用の文字列にする"""
+    seconds = int(max(0, seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}時間{minutes:02d}分"
+    if minutes:
+        return f"{minutes}分{secs:02d}秒"
+    return f"{secs}秒"
+
+
+def format_bytes(num_bytes):
+    """バイト数を「1.5 GB」のような表示用の文字列にする"""
+    if num_bytes < 1024:
+        return f"{num_bytes} B"
+    for unit in ("KB", "MB", "GB", "TB"):
+        num_bytes /= 1024
+        if num_bytes < 1024 or unit == "TB":
+            return f"{num_bytes:.1f} {unit}"
 
 
 class BlastWorker(threading.Thread):
@@ -10,137 +104,954 @@ class BlastWorker(threading.Thread):
     【改修】単一のFASTAファイルのBLASTn実行を担当するクラス
     """
 
-    def __init__(self, filepath_to_process, queue, config):
+    def __init__(self, filepath_to_process, queue, config, journal=None, num_threads=None):
         """
         Args:
             filepath_to_process (str): 処理対象の単一のファイルパス
             queue (queue.Queue): GUIへ通知を送るためのキュー
             config (configparser.ConfigParser): 設定情報
+            journal (JobJournal): 開始・移動・完了・エラーを記録するジャーナル (任意)
+            num_threads (int): -num_threads の値 (省略時は設定値。自動調整で使う)
         """
         super().__init__()
         self.filepath = filepath_to_process
+        # 1回の blastn で解析するファイル (まとめて実行する場合は複数) と表示名
+        self.filepaths = [filepath_to_process]
+        self.display_name = os.path.basename(filepath_to_process)
         self.queue = queue
         self.config = config
+        self.journal = journal
+        if num_threads is None:
+            num_threads = config.getint("BLAST_SETTINGS", "num_threads", fallback=8)
+        self.num_threads = max(1, num_threads)
         self.daemon = True  # メインスレッドが終了したら、このスレッドも終了する
 
-        self.process = None  # 実行中のサブプロセスを保持する
+        self.processes = []  # 実行中のサブプロセスを保持する (チャンク分割時は複数)
         self.terminated = False  # 外部から強制終了されたかを追跡するフラグ
+        self.cancel_reason = None  # cancel() された理由 (CANCEL_REASONS のキー)
+        self._timeout_timer = None
+        self._reported_paths = set()  # 完了・エラーを通知したファイル
+        self.cache_hit = False  # 結果をキャッシュから取り出したか
+        self.work_dir = None  # このジョブ用の一時フォルダ (重複除去・チャンク分割用)
+        self.staged = False  # work_dir を scratch に作り、クエリ・結果を scratch に置いているか
+        self._scratch = None
+        self._scratch_reserved = 0
+        self._current_worker = None  # 失敗後に代わりに実行しているワーカー (_run_fallbacks)
+        # blastn を実行させるエージェント (agent_pool.RemoteAgent。None ならこのマシンで実行)
+        self.agent = None
+        self._agent_released = False  # エージェントのスロットを返したか
+        # 結果キャッシュ (result_cache.ResultCache。None ならキャッシュを使わない)
+        self.cache = None
+
+        # 計測用 (開始時刻と blastn ごとの資源使用量。file_done / error に添える)
+        self.run_id = next_run_id()
+        self._started_at = None
+        self._monitors = []
+
+        # 進捗の集計用 (プロセスごとの結果行数・完了クエリ数・クエリ総数・塩基数)
+        self._run_states = []
+        self._progress_lock = threading.Lock()
+        self._stream_started = None
+        self._last_progress = 0.0
 
     def run(self):
-        """【改修】単一のファイルに対する処理を実行"""
-        filename = os.path.basename(self.filepath)
+        """【改修】スレッドとして実行する場合の処理 (準備 → blastn → 後処理)"""
+        self._started_at = time.time()
+        self._start_timeout()
         try:
-            # GUIに進捗状況を通知（処理中 50%）
+            plan = self._prepare()
+            if plan is not None:
+                self._run_blast_processes(plan["runs"])
+                # 完了・エラーを通知した時点で次のジョブを割り当てられるよう、先にスロットを返す
+                self._release_agent()
+                self._complete(plan)
+        except Exception as e:
+            self._release_agent()
+            if not self.terminated:
+                self._run_fallbacks(self._handle_failure(e))
+        finally:
+            self._end_run()
+
+    def _prepare(self):
+        """
+        blastn を起動する前の処理 (キャッシュの参照・DBのウォームアップ・重複除去・
+        チャンク分割) を行い、起動する blastn の実行計画を返す。
+        キャッシュにヒットした場合は、完了を通知して None を返す。
+
+        スレッドでも async_engine でも同じ処理を使う (blastn の起動と出力の読み出しだけが異なる)。
+
+        Returns:
+            dict | None: 実行計画 (runs: _run_blast_processes に渡す起動リスト /
+            blast_output: blastn の結果の出力先 / chunk_outputs: チャンクごとの出力先 など)
+        """
+        filename = os.path.basename(self.filepath)
+        # GUIに処理開始を通知 (クエリの進捗は _report_progress で通知する)
+        self.queue.put(
+            {
+                "type": "progress",
+                "value": 0,
+                "message": f"処理中: {filename}",
+                "original_path": self.filepath,
+            }
+        )
+
+        # 同じクエリ・DB・オプションの結果がキャッシュにあれば、BLASTを省略する
+        cache, cache_key = self._lookup_cache()
+        if self.cache_hit:
+            self._write_columnar()
+            self._move_to_processed(self.filepath)
+            self._record_done(self.filepath)
             self.queue.put(
-                {"type": "progress", "value": 50, "message": f"処理中: {filename}"}
+                {
+                    "type": "file_done",
+                    "original_path": self.filepath,
+                    "cache_hit": True,
+                    "metrics": self._job_metrics(),
+                }
             )
+            return None
 
-            # BLAST実行（本体）
-            # (C-4) _execute_blast_popen 内でエラーを捕捉し、
-            # 構造化されたエラー辞書を生成する
-            blast_command, blast_cwd = self._build_blast_command(self.filepath)
+        # DBボリュームをページキャッシュに載せてから blastn を起動する
+        self._warm_up_database()
+
+        # BLAST実行（本体）
+        # (C-4) blastn のエラーは _handle_failure で構造化されたエラー辞書にする
+        self._make_work_dir()
+        output_file = self._result_path(self.filepath)
+
+        dedup = None
+        query_path = self.filepath
+        if self.staged:
+            # ネットワーク共有から1回だけ読み、以降は scratch のコピーを使う
+            # (元のファイル名は使わない。unique.fasta などの中間ファイルと衝突させないため)
+            extension = os.path.splitext(self.filepath)[1]
+            query_path = os.path.join(self.work_dir, "query" + extension)
+            shutil.copyfile(self.filepath, query_path)
+        source_path = query_path
+        if self.config.getboolean("DEDUP", "enabled", fallback=False):
+            # 同一配列をまとめ、代表の配列だけを BLAST する
+            unique_path = os.path.join(self.work_dir, "unique.fasta")
+            dedup = self._deduplicate(query_path, unique_path)
+            query_path = unique_path
+
+        # 重複除去時は qseqid 付きの中間結果から、元の全レコードに展開する
+        # (集計する場合も qseqid 付きの中間結果を読みながら <file>_result.csv を書く)
+        summary = summary_settings_from_config(self.config)
+        keep_qseqid = bool(dedup) or summary is not None
+        blast_output = (
+            os.path.join(self.work_dir, "raw_result.tsv") if keep_qseqid else output_file
+        )
+        runs, chunk_outputs = self._plan_runs(query_path, blast_output, keep_qseqid=keep_qseqid)
+        return {
+            "runs": runs,
+            "chunk_outputs": chunk_outputs,
+            "blast_output": blast_output,
+            "output_file": output_file,
+            "source_path": source_path,
+            "dedup": dedup,
+            "summary": summary,
+            "cache": cache,
+            "cache_key": cache_key,
+        }
+
+    def _complete(self, plan):
+        """
+        全ての blastn が終わった後の処理 (チャンクの連結・重複除去の展開・キャッシュへの登録・
+        processed フォルダへの移動) を行い、完了を通知する。
+
+        Args:
+            plan (dict): _prepare() が返した実行計画
+        """
+        if plan["chunk_outputs"] and not self.terminated:
+            self._merge_chunks(plan["chunk_outputs"], plan["blast_output"])
 
-            # (C-4) Popenの実行をtry...exceptで囲む
-            self.process = subprocess.Popen(
-                blast_command,
-                cwd=blast_cwd,  # blastnの実行場所を指定
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding="utf-8",
-                # (C-4) Windowsでサブプロセスを隠す
-                creationflags=subprocess.CREATE_NO_WINDOW,
+        dedup = plan["dedup"]
+        if dedup and not self.terminated:
+            representatives, num_unique = dedup
+            expand_deduplicated_results(
+                plan["blast_output"], plan["output_file"], representatives, num_unique
             )
+        summaries = []
+        if plan["summary"] is not None and not self.terminated:
+            summaries = self._summarize(plan)
 
-            # サブプロセスの完了を待機
-            # communicate() はプロセスが終了するまでブロックする
-            stdout_data, stderr_data = self.process.communicate()
-            return_code = self.process.returncode
+        # --- ★追加 (ステップ3) ---
+        # 強制終了フラグが立っていたら、ここで処理を中断
+        # (キューに完了/エラーメッセージを送らない)
+        if self.terminated:
+            print(
+                "Workerが外部から停止されたため、キューへの通知をスキップします。"
+            )
+            return
 
-            # --- ★追加 (ステップ3) ---
-            # 強制終了フラグが立っていたら、ここで処理を中断
-            # (キューに完了/エラーメッセージを送らない)
-            if self.terminated:
-                print(
-                    "Workerが外部から停止されたため、キューへの通知をスキップします。"
-                )
-                return
+        self._publish_results()
+        self._write_summaries(summaries, plan["summary"])
+        cache_key = plan["cache_key"]
+        if cache_key is not None:
+            self._store_cache(plan["cache"], cache_key)
+        self._write_columnar()
 
-            # (C-4) エラーチェックを強化
-            # CalledProcessErrorを模倣して、BLAST実行エラーを検知
-            if return_code != 0:
-                # BLAST実行自体が失敗した場合 (DBが見つからない、FASTAが不正など)
-                raise subprocess.CalledProcessError(
-                    returncode=return_code,
-                    cmd=blast_command,
-                    stderr=stderr_data,
-                    stdout=stdout_data,
-                )
+        # --- 6. 処理成功時：ファイルを 'processed' フォルダに移動 ---
+        self._move_to_processed(self.filepath)
 
-            # --- 6. 処理成功時：ファイルを 'processed' フォルダに移動 ---
-            self._move_to_processed(self.filepath)
+        # 処理成功をGUIに通知
+        # 完了した元のファイルパスをGUIに送り返す
+        done_message = {"type": "file_done", "original_path": self.filepath}
+        if cache_key is not None:
+            done_message["cache_hit"] = False
+        if dedup:
+            representatives, num_unique = dedup
+            done_message["dedup"] = {
+                "records": len(representatives),
+                "unique": num_unique,
+            }
+        done_message["metrics"] = self._job_metrics()
+        self._release_work_dir()
+        self._record_done(self.filepath)
+        self.queue.put(done_message)
 
-            # 処理成功をGUIに通知
-            # 完了した元のファイルパスをGUIに送り返す
-            self.queue.put({"type": "file_done", "original_path": self.filepath})
+    def _handle_failure(self, error):
+        """
+        準備・blastn・後処理で送出された例外を、構造化されたエラーとして通知する。
+        (中止された場合は呼ばない)
+
+        Args:
+            error (Exception): 送出された例外
 
-        # (C-4) 具体的な例外を捕捉する
-        except FileNotFoundError as e:
+        Returns:
+            list[BlastWorker]: 代わりに実行し直すワーカー (PackedBlastWorker 以外は常に空)
+        """
+        filename = os.path.basename(self.filepath)
+        if isinstance(error, AgentUnavailableError):
+            # ノードを見失った。エラーにせず、解析待ちに戻して別のノードでやり直す
+            self._post_requeue(error)
+            return []
+        # (C-4) 具体的な例外を区別する
+        if isinstance(error, FileNotFoundError):
             # blastn.exe が見つからなかった場合など
-            if not self.terminated:
-                self.queue.put(
-                    {
-                        "type": "error",
-                        "error_type": "FileNotFoundError",
-                        "message": f"実行エラー: '{e.filename}' が見つかりません。\n"
-                        "設定画面でBLAST+ (bin) フォルダのパスが\n"
-                        "正しく設定されているか確認してください。",
-                        "original_path": self.filepath,
-                    }
-                )
-        except subprocess.CalledProcessError as e:
+            message = {
+                "type": "error",
+                "error_type": "FileNotFoundError",
+                "message": f"実行エラー: '{error.filename}' が見つかりません。\n"
+                "設定画面でBLAST+ (bin) フォルダのパスが\n"
+                "正しく設定されているか確認してください。",
+                "original_path": self.filepath,
+            }
+        elif isinstance(error, AgentRequestRejectedError):
+            # エージェントが要求を受け付けない (やり直しても同じなので、解析待ちには戻さない)
+            message = {
+                "type": "error",
+                "error_type": "AgentRequestRejected",
+                "message": f"エージェントが {filename} の解析を拒否しました:\n{error}\n"
+                "クエリの大きさ (max_query_mb) やエージェントの DB を確認してください。",
+                "original_path": self.filepath,
+            }
+        elif isinstance(error, subprocess.CalledProcessError):
             # BLAST実行がゼロ以外のリターンコードを返した場合
-            if not self.terminated:
+            message = {
+                "type": "error",
+                "error_type": "CalledProcessError",
+                "message": "BLAST実行エラー:\n"
+                "データベース名が間違っているか、\n"
+                "入力FASTAファイルが破損している可能性があります。",
+                "stderr": error.stderr,  # エラー詳細
+                "original_path": self.filepath,
+            }
+        else:
+            # その他の予期せぬエラー
+            message = {
+                "type": "error",
+                "error_type": "GenericError",
+                "message": f"予期せぬエラー: {filename} の処理中に問題が発生しました。\n{error}",
+                "original_path": self.filepath,
+            }
+        self._post_error(message)
+        return []
+
+    def _post_requeue(self, error):
+        """
+        完了・エラーを通知していないファイルの書きかけの結果を削除し、
+        "requeue" メッセージで解析待ちに戻すよう通知する。
+        戻したファイルをすぐに割り当て直せるよう、通知する前にスロットを返す。
+        """
+        self._release_agent()
+        for filepath in self.filepaths:
+            if filepath in self._reported_paths:
+                continue
+            self._reported_paths.add(filepath)
+            partial_output = f"{filepath}_result.csv"
+            try:
+                if os.path.exists(partial_output):
+                    os.remove(partial_output)
+            except OSError as e:
+                print(f"書きかけの結果ファイルの削除中にエラー: {e}")
+            self.queue.put(
+                {
+                    "type": "requeue",
+                    "message": f"{os.path.basename(filepath)} を解析待ちに戻しました ({error})。",
+                    "original_path": filepath,
+                    "agent": error.agent.address,
+                }
+            )
+
+    def _run_fallbacks(self, workers):
+        """_handle_failure() が返したワーカーを、このスレッドで1つずつ実行する"""
+        for worker in workers:
+            if self.terminated:
+                break
+            self._current_worker = worker
+            worker.run()
+            # 個別のワーカーが完了・エラーを通知したファイルは、中止の通知から除く
+            self._reported_paths.update(worker._reported_paths)
+        self._current_worker = None
+
+    def _start_timeout(self):
+        """[TIMEOUTS] の制限時間を過ぎたら cancel("timeout") するタイマーを開始する"""
+        limit = job_timeout_sec(self.config, self.filepaths)
+        if limit is None:
+            return
+        self._timeout_timer = threading.Timer(limit, self.cancel, args=("timeout",))
+        self._timeout_timer.daemon = True
+        self._timeout_timer.start()
+
+    def _release_agent(self):
+        """割り当てられたエージェントのスロットを返す (1回だけ)"""
+        if self.agent is not None and not self._agent_released:
+            self._agent_released = True
+            self.agent.release()
+
+    def _end_run(self):
+        """
+        run() の最後に必ず呼ぶ後片付け。タイマーと計測を止めて一時フォルダを消し、
+        途中で止められた場合は、完了・エラーを通知していないファイルの書きかけの
+        _result.csv を削除して、cancel() されていれば "cancelled" を通知する。
+        """
+        if self._timeout_timer is not None:
+            self._timeout_timer.cancel()
+        self._stop_monitors()
+        # 重複除去・チャンク分割で作った一時ファイル (ステージング時は書きかけの結果も) を片付ける
+        self._release_work_dir()
+        self._release_agent()
+        if not self.terminated:
+            return
+
+        unfinished = [path for path in self.filepaths if path not in self._reported_paths]
+        for filepath in unfinished:
+            partial_output = f"{filepath}_result.csv"
+            try:
+                if os.path.exists(partial_output):
+                    os.remove(partial_output)
+            except OSError as e:
+                print(f"書きかけの結果ファイルの削除中にエラー: {e}")
+        if self.cancel_reason is None:
+            return  # アプリの終了時など (通知しない)
+
+        metrics = self._job_metrics()
+        reason_text = CANCEL_REASONS.get(self.cancel_reason, self.cancel_reason)
+        for filepath in unfinished:
+            if self.journal is not None:
+                self.journal.record_cancelled(filepath, self.cancel_reason)
+            self.queue.put(
+                {
+                    "type": "cancelled",
+                    "reason": self.cancel_reason,
+                    "message": f"{os.path.basename(filepath)} を中止しました ({reason_text})。",
+                    "original_path": filepath,
+                    "metrics": dict(metrics),
+                }
+            )
+
+    def _make_work_dir(self):
+        """
+        このジョブの一時フォルダを作る。[STAGING] が有効で scratch の空きを予約できれば
+        scratch に作り、blastn のクエリと結果も scratch に置く (self.staged)。
+        空きが足りなければ通知して、従来どおり元のフォルダで実行する。
+        """
+        scratch = get_scratch(self.config)
+        if scratch is not None:
+            needed = scratch.required_bytes(self.filepaths)
+            if scratch.reserve(needed):
+                self._scratch, self._scratch_reserved = scratch, needed
+                self.staged = True
+            else:
                 self.queue.put(
                     {
-                        "type": "error",
-                        "error_type": "CalledProcessError",
-                        "message": "BLAST実行エラー:\n"
-                        "データベース名が間違っているか、\n"
-                        "入力FASTAファイルが破損している可能性があります。",
-                        "stderr": e.stderr,  # エラー詳細
+                        "type": "progress",
+                        "value": 0,
+                        "message": f"処理中: {self.display_name} "
+                        f"(scratch の空きが足りないため、元のフォルダで実行します)",
                         "original_path": self.filepath,
                     }
                 )
+        self.work_dir = tempfile.mkdtemp(
+            prefix="blastnav_", dir=scratch.directory if self.staged else None
+        )
+
+    def _release_work_dir(self):
+        """
+        一時フォルダを削除し、scratch の予約を返す (何度呼んでもよい)。
+        完了の通知の直後に CLI が終了しても残らないよう、通知の前にも呼ぶ。
+        """
+        if self.work_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+            self.work_dir = None
+        if self._scratch_reserved:
+            self._scratch.release(self._scratch_reserved)
+            self._scratch_reserved = 0
+
+    def _result_path(self, filepath):
+        """blastn の結果を書く場所 (ステージング中は scratch、でなければ <file>_result.csv)"""
+        if not self.staged:
+            return f"{filepath}_result.csv"
+        index = self.filepaths.index(filepath)
+        return os.path.join(
+            self.work_dir, f"{index}_{os.path.basename(filepath)}_result.csv"
+        )
+
+    def _publish_results(self):
+        """ステージング中なら、scratch の結果を <file>_result.csv として公開する"""
+        if not self.staged:
+            return
+        for filepath in self.filepaths:
+            publish_file(self._result_path(filepath), f"{filepath}_result.csv")
+
+    def _write_columnar(self):
+        """
+        [COLUMNAR] が有効なら、公開した <file>_result.csv を列指向の <file>_result.bnc に変換する
+        (keep_csv = false なら CSV は削除する)。書いた直後の CSV はページキャッシュから読める。
+        変換に失敗しても解析は成功扱いにし、CSV を残す。
+        """
+        settings = columnar_settings_from_config(self.config)
+        if settings is None:
+            return
+        for filepath in self.filepaths:
+            csv_path = f"{filepath}_result.csv"
+            try:
+                convert_csv(
+                    csv_path,
+                    f"{filepath}{COLUMNAR_SUFFIX}",
+                    block_rows=settings["block_rows"],
+                    compress_level=settings["compress_level"],
+                )
+                if not settings["keep_csv"]:
+                    os.remove(csv_path)
+            except (OSError, ValueError) as e:
+                print(f"列指向の結果ファイルへの変換中にエラー ({filepath}): {e}")
+
+    def _summarize(self, plan):
+        """
+        [SUMMARY] が有効なら、qseqid 付きの中間結果を1回だけ読み、クエリごとの最良ヒットを
+        集計する。重複除去しない場合は、同じ読み出しで qseqid 列を取り除いた
+        <file>_result.csv も書く。集計に失敗しても解析は成功扱いにする (結果ファイルは書く)。
+
+        Returns:
+            list[tuple[str, SampleSummary]]: (元のファイル, 集計)。書き出しは結果の公開後に行う
+        """
+        settings = plan["summary"]
+        dedup = plan["dedup"]
+        strip_to = None if dedup else plan["output_file"]
+        best_hits_path = (
+            f"{self.filepath}{BEST_HITS_SUFFIX}" if settings["best_hits"] else None
+        )
+        summary = None
+        try:
+            if dedup:
+                # 代表ごとの割り当てを、代表が表すレコードの数だけ数える
+                representatives, num_unique = dedup
+                summary = SampleSummary(len(representatives), best_hits_path)
+                best = [None] * num_unique
+                for qseqid, assignment in self._iter_best_hits(plan["blast_output"], settings):
+                    best[int(qseqid[1:])] = assignment  # "u123" -> 123
+                if best_hits_path is None:
+                    for rep_index, weight in Counter(representatives).items():
+                        if best[rep_index] is not None:
+                            summary.add(best[rep_index], weight=weight)
+                else:
+                    query_ids = read_query_ids(plan["source_path"])
+                    for rep_index, query_id in zip(representatives, query_ids):
+                        if best[rep_index] is not None:
+                            summary.add(best[rep_index], query_id)
+            else:
+                summary = SampleSummary(
+                    count_fasta_records(plan["source_path"]), best_hits_path
+                )
+                for qseqid, assignment in self._iter_best_hits(
+                    plan["blast_output"], settings, strip_to=strip_to
+                ):
+                    summary.add(assignment, qseqid)
+        except (OSError, ValueError) as e:
+            print(f"結果の集計中にエラー ({self.filepath}): {e}")
+            if summary is not None:
+                summary.abort()
+            if strip_to is not None:
+                # 集計せずに <file>_result.csv だけを書き直す
+                with open(plan["blast_output"], "rb") as raw, open(strip_to, "wb") as out:
+                    out.writelines(map(strip_qseqid, raw))
+            return []
+        return [(self.filepath, summary)]
+
+    @staticmethod
+    def _iter_best_hits(raw_file, settings, strip_to=None):
+        return iter_best_hits(
+            raw_file,
+            tie_rule=settings["tie_rule"],
+            tie_delta=settings["tie_delta"],
+            min_pident=settings["min_pident"],
+            strip_to=strip_to,
+        )
+
+    def _write_summaries(self, summaries, settings):
+        """集計を <file>_summary.tsv に書く (失敗しても解析は成功扱い)"""
+        for filepath, summary in summaries:
+            try:
+                summary.write(f"{filepath}{SUMMARY_SUFFIX}", settings)
+            except OSError as e:
+                summary.abort()
+                print(f"集計ファイルの書き込み中にエラー ({filepath}): {e}")
+
+    def _job_metrics(self):
+        """このジョブのタイムスタンプと blastn の資源使用量をまとめる (job_metrics 参照)"""
+        self._stop_monitors()
+        if self._run_states:
+            queries = sum(state["queries_total"] for state in self._run_states)
+            bases = sum(state["bases"] for state in self._run_states)
+        else:
+            queries = bases = None  # キャッシュヒットなど、BLAST していない
+        metrics = summarize_job(self.run_id, self._started_at, self._monitors, queries, bases)
+        metrics["num_threads"] = self.num_threads
+        if self.agent is not None:
+            metrics["agent"] = self.agent.address
+        return metrics
+
+    def _stop_monitors(self):
+        for monitor in self._monitors:
+            monitor.stop()
+
+    def _record_done(self, filepath):
+        self._reported_paths.add(filepath)
+        if self.journal is not None:
+            self.journal.record_done(filepath)
+
+    def _post_error(self, message):
+        """エラーをジャーナルに記録し、計測値を添えてGUIに通知する"""
+        message.setdefault("metrics", self._job_metrics())
+        self._reported_paths.add(message["original_path"])
+        if self.journal is not None:
+            self.journal.record_error(message["original_path"], message["error_type"])
+        self.queue.put(message)
+
+    def _lookup_cache(self):
+        """
+        結果キャッシュを引き、ヒットすれば <file>_result.csv をすぐにコピーする。
+        キャッシュの障害で解析自体を失敗させないよう、例外は警告の表示に留める。
+
+        Returns:
+            tuple[ResultCache | None, str | None]: (キャッシュ, キー)。
+            キャッシュを使わない (self.cache が None の) 場合は (None, None)
+        """
+        try:
+            cache = self.cache
+            if cache is None:
+                return None, None
+            blast_command, blast_cwd = self._build_blast_command(self.filepath)
+            db_name = self.config.get("BLAST_SETTINGS", "database_name")
+            cache_key = make_cache_key(self.filepath, blast_command, blast_cwd, db_name)
+            self.cache_hit = cache.lookup(cache_key, f"{self.filepath}_result.csv")
+            if self.cache_hit:
+                self.cache_hit = self._lookup_cached_summaries(cache, cache_key)
+            return cache, cache_key
         except Exception as e:
-            # その他の予期せぬエラー
-            if not self.terminated:
-                self.queue.put(
-                    {
-                        "type": "error",
-                        "error_type": "GenericError",
-                        "message": f"予期せぬエラー: {filename} の処理中に問題が発生しました。\n{e}",
-                        "original_path": self.filepath,
-                    }
+            print(f"結果キャッシュの参照中にエラー: {e}")
+            return None, None
+
+    def _lookup_cached_summaries(self, cache, cache_key):
+        """
+        [SUMMARY] が有効なら、結果と一緒に登録した集計ファイルもキャッシュから取り出す。
+        集計がない (集計を有効にする前に登録した結果など) 場合は、集計を作るために
+        ミス扱いにして BLAST し直す。
+
+        Returns:
+            bool: 必要な集計ファイルが全て揃った場合は True
+        """
+        settings = summary_settings_from_config(self.config)
+        if settings is None:
+            return True
+        for suffix in summary_suffixes(settings):
+            key = summary_cache_key(cache_key, settings, suffix)
+            if not cache.lookup(key, f"{self.filepath}{suffix}"):
+                return False
+        return True
+
+    def _store_cache(self, cache, cache_key):
+        """完了した結果 (と集計) をキャッシュに登録する (失敗しても解析は成功扱い)"""
+        try:
+            cache.store(cache_key, f"{self.filepath}_result.csv")
+            settings = summary_settings_from_config(self.config)
+            if settings is not None:
+                for suffix in summary_suffixes(settings):
+                    summary_path = f"{self.filepath}{suffix}"
+                    if os.path.exists(summary_path):
+                        key = summary_cache_key(cache_key, settings, suffix)
+                        cache.store(key, summary_path)
+        except Exception as e:
+            print(f"結果キャッシュへの登録中にエラー: {e}")
+
+    def _run_blast_processes(self, runs):
+        """
+        BLASTコマンドを同時に起動し、標準出力を行単位で結果ファイルへ書き出しながら
+        全ての完了を待つ。出力をメモリに溜めないので、結果の大きさに関係なく
+        メモリ使用量は一定で、受け取った行数・完了したクエリ数を進捗として通知できる。
+
+        Args:
+            runs (list[tuple[list[str], str, str, str, bool]]):
+                (コマンド, 実行ディレクトリ, クエリFASTA, 結果の出力先, qseqid 列を残すか)
+                のリスト
+
+        Raises:
+            subprocess.CalledProcessError: いずれかのプロセスが失敗した場合
+            (残りのプロセスは強制終了する)
+        """
+        started = []
+        for blast_command, blast_cwd, query_path, output_file, keep_qseqid in runs:
+            if self.terminated:
+                break  # 起動の途中で中止された
+            query_order, run_state = self._begin_run_state(query_path)
+
+            if self.agent is not None:
+                # エージェントで実行し、出力を同じように受け取る (計測値もエージェントが返す)
+                process = self.agent.spawn(blast_command, query_path)
+                monitor = self._register_process(process, blast_command, process.monitor)
+            else:
+                # (C-4) Popenの実行をtry...exceptで囲む
+                process = subprocess.Popen(
+                    blast_command,
+                    cwd=blast_cwd,  # blastnの実行場所を指定
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    # (C-4) Windowsでサブプロセスを隠す
+                    **popen_platform_kwargs(),
+                )
+                monitor = self._register_process(process, blast_command)
+
+            # stderr は別スレッドで読み続け、末尾だけをリングバッファに残す
+            stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+            stderr_thread = threading.Thread(
+                target=drain_stream, args=(process.stderr, stderr_tail), daemon=True
+            )
+            stderr_thread.start()
+            started.append(
+                (
+                    process,
+                    monitor,
+                    blast_command,
+                    output_file,
+                    keep_qseqid,
+                    query_order,
+                    run_state,
+                    stderr_tail,
+                    stderr_thread,
                 )
+            )
+        self._stream_started = time.monotonic()
+
+        if len(started) == 1:
+            # サブプロセスの完了を待機 (出力を読み切るまでブロックする)
+            self._stream_process(*started[0])
+            return
+
+        # 各プロセスの標準出力を並列に読み出す
+        with ThreadPoolExecutor(max_workers=len(started)) as executor:
+            futures = [executor.submit(self._stream_process, *item) for item in started]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception:
+                    # 1つでも失敗したら (ノードを見失った場合も)、残りのプロセスも止めて全体をエラーにする
+                    self._kill_processes()
+                    raise
+
+    def _begin_run_state(self, query_path):
+        """
+        完了クエリ数を数えるため、blastn の起動前にクエリIDと入力順を調べ、
+        進捗の集計に加える。
+
+        Returns:
+            tuple[dict, dict]: (qseqid -> 入力順, このプロセスの進捗の状態)
+        """
+        query_order, num_queries, num_bases = read_query_order(query_path)
+        run_state = {
+            "rows": 0,
+            "queries_done": 0,
+            "queries_total": num_queries,
+            "bases": num_bases,
+        }
+        self._run_states.append(run_state)
+        return query_order, run_state
+
+    def _register_process(self, process, blast_command, monitor=None):
+        """
+        起動した blastn を中止・計測・ジャーナルの対象に加える。
+
+        Args:
+            process: subprocess.Popen (または pid / poll() / kill() を持つ同等のもの)
+            blast_command (list[str]): 起動したコマンド
+            monitor: このプロセスの計測 (省略時は ProcessMonitor を作る)
+
+        Returns:
+            ProcessMonitor: このプロセスの計測
+        """
+        self.processes.append(process)
+        if self.terminated:
+            # 起動の直前に中止された (terminate() はこのプロセスを知らない)
+            kill_process_tree(process, grace_sec=0)
+        if monitor is None:
+            monitor = ProcessMonitor(process)
+        self._monitors.append(monitor)
+        if self.journal is not None:
+            for filepath in self.filepaths:
+                self.journal.record_start(filepath, process.pid, blast_command)
+        return monitor
+
+    def _track_query(self, qseqid, monitor, query_order, run_state):
+        """
+        出力に新しい qseqid が現れたときに呼ぶ。blastn はクエリの入力順に結果を出すので、
+        それより前のクエリは全て完了している (ヒットなしのクエリも含めて数えられる)。
+        """
+        monitor.mark_output()
+        position = query_order.get(qseqid)
+        if position is not None and position > run_state["queries_done"]:
+            run_state["queries_done"] = position
+        self._report_progress()
+
+    def _finish_stream(self, process, blast_command, stderr_data, run_state):
+        """出力を読み切って回収した blastn の終了コードを確認し、完了を進捗に反映する"""
+        self._check_returncode(process, blast_command, stderr_data)
+        if self.terminated:
+            return  # 中止した場合は完了扱いの進捗を出さない
+
+        # 正常に終了したら、このプロセスのクエリは全て完了
+        run_state["queries_done"] = run_state["queries_total"]
+        self._report_progress(force=True)
+
+    def _stream_process(
+        self,
+        process,
+        monitor,
+        blast_command,
+        output_file,
+        keep_qseqid,
+        query_order,
+        run_state,
+        stderr_tail,
+        stderr_thread,
+    ):
+        """
+        1つの blastn の標準出力を結果ファイルへ書き出し、終了コードを確認する。
+        """
+        last_qseqid = None
+        with open(output_file, "wb") as out:
+            for line in process.stdout:
+                out.write(line if keep_qseqid else strip_qseqid(line))
+                run_state["rows"] += 1
+
+                qseqid = line.split(b"\t", 1)[0]
+                if qseqid != last_qseqid:
+                    last_qseqid = qseqid
+                    self._track_query(qseqid, monitor, query_order, run_state)
+        monitor.wait_exit()
+        process.wait()
+        monitor.stop()
+        stderr_thread.join()
+        self._finish_stream(process, blast_command, "".join(stderr_tail), run_state)
 
-    def _build_blast_command(self, fasta_file):
+    def _report_progress(self, force=False):
+        """
+        全プロセスの完了クエリ数を集計し、一定間隔で進捗率・クエリ/秒・残り時間を
+        GUI に通知する。
+        """
+        now = time.monotonic()
+        with self._progress_lock:
+            if not force and now - self._last_progress < PROGRESS_INTERVAL:
+                return
+            self._last_progress = now
+
+        rows = sum(state["rows"] for state in self._run_states)
+        queries_done = sum(state["queries_done"] for state in self._run_states)
+        queries_total = sum(state["queries_total"] for state in self._run_states)
+
+        elapsed = max(now - self._stream_started, 1e-6)
+        queries_per_sec = queries_done / elapsed
+        percent = 100.0 * queries_done / queries_total if queries_total else 0.0
+        eta_sec = None
+        if queries_per_sec > 0:
+            eta_sec = (queries_total - queries_done) / queries_per_sec
+
+        eta_text = f", 残り約{format_duration(eta_sec)}" if eta_sec is not None else ""
+        self.queue.put(
+            {
+                "type": "progress",
+                "value": percent,
+                "message": f"処理中: {self.display_name} "
+                f"{queries_done}/{queries_total} クエリ ({percent:.0f}%, "
+                f"{queries_per_sec:.1f} クエリ/秒{eta_text})",
+                "original_path": self.filepath,
+                "rows": rows,
+                "rows_per_sec": rows / elapsed,
+                "queries_done": queries_done,
+                "queries_total": queries_total,
+                "queries_per_sec": queries_per_sec,
+                "eta_sec": eta_sec,
+            }
+        )
+
+    def _check_returncode(self, process, blast_command, stderr_data):
+        """(C-4) 終了コードを確認し、失敗していれば CalledProcessError を送出する"""
+        if self.terminated:
+            return  # 外部から停止された場合はエラー扱いにしない
+
+        # CalledProcessErrorを模倣して、BLAST実行エラーを検知
+        if process.returncode != 0:
+            # BLAST実行自体が失敗した場合 (DBが見つからない、FASTAが不正など)
+            raise subprocess.CalledProcessError(
+                returncode=process.returncode,
+                cmd=blast_command,
+                stderr=stderr_data,
+            )
+
+    def _warm_up_database(self):
+        """
+        [DB_WARMUP] が有効なら、DBのウォームアップを待つ (DBが変わっていなければ省略)。
+        ウォームアップの失敗で解析自体を失敗させないよう、例外は警告の表示に留める。
+        """
+        try:
+            warmer = get_warmer(self.config)
+            if warmer is None:
+                return
+            report = warmer.ensure_warm()
+        except Exception as e:
+            print(f"DBウォームアップ中にエラー: {e}")
+            return
+
+        if report is not None:
+            resident = report["resident_bytes"]
+            resident_text = (
+                f", 常駐 {format_bytes(resident)}" if resident is not None else ""
+            )
+            self.queue.put(
+                {
+                    "type": "progress",
+                    "value": 0,
+                    "message": f"DBウォームアップ完了: {report['files']} ファイル "
+                    f"{format_bytes(report['read_bytes'])} 読み込み{resident_text}",
+                    "original_path": self.filepath,
+                    "db_warmup": report,
+                }
+            )
+
+    def _deduplicate(self, query_path, unique_path):
+        """
+        クエリの同一配列をまとめた FASTA を unique_path に書き出し、集約件数を通知する。
+
+        Args:
+            query_path (str): 元のクエリ (ステージング中は scratch のコピー)
+            unique_path (str): 代表の配列だけの FASTA の出力先
+
+        Returns:
+            tuple[array.array, int]: (元のレコード順の代表番号, 代表の数)
+        """
+        representatives, num_unique = deduplicate_fasta(query_path, unique_path)
+        collapsed = len(representatives) - num_unique
+        self.queue.put(
+            {
+                "type": "progress",
+                "value": 0,
+                "message": f"処理中: {os.path.basename(self.filepath)} "
+                f"(重複 {collapsed} 件を集約: {len(representatives)} → {num_unique} 配列)",
+                "original_path": self.filepath,
+            }
+        )
+        return representatives, num_unique
+
+    def _decide_num_chunks(self, query_path):
+        """[CHUNKING] 設定と入力ファイルの大きさから、分割数を決める (1 = 分割しない)"""
+        if not self.config.getboolean("CHUNKING", "enabled", fallback=False):
+            return 1
+        if self.agent is not None:
+            return 1  # エージェントには1ジョブ = 1スロットで割り当てるので分割しない
+        num_chunks = self.config.getint("CHUNKING", "chunks", fallback=4)
+        min_records = self.config.getint("CHUNKING", "min_records", fallback=1000)
+        if num_chunks <= 1:
+            return 1
+        if count_fasta_records(query_path) < max(min_records, num_chunks):
+            return 1  # 小さなファイルは分割のオーバーヘッドの方が大きい
+        return num_chunks
+
+    def _plan_runs(self, query_path, output_file, keep_qseqid=False):
+        """
+        クエリを blastn に渡す起動リストを作る。[CHUNKING] で分割する場合は、
+        クエリFASTAをレコード単位で分割し、チャンクごとに同時に起動する
+        (1つでも失敗したチャンクがあれば、ファイル全体がエラーになる)。
+
+        Returns:
+            tuple[list[tuple], list[str] | None]: (_run_blast_processes に渡す起動リスト,
+            チャンクごとの出力先。分割しない場合は None)
+        """
+        num_chunks = self._decide_num_chunks(query_path)
+        if num_chunks <= 1:
+            blast_command, blast_cwd = self._build_blast_command(query_path)
+            return [(blast_command, blast_cwd, query_path, output_file, keep_qseqid)], None
+
+        split_by = self.config.get("CHUNKING", "split_by", fallback="records")
+        # チャンク全体で num_threads を分け合う
+        threads_per_chunk = max(1, self.num_threads // num_chunks)
+
+        chunk_dir = os.path.join(self.work_dir, "chunks")
+        os.makedirs(chunk_dir, exist_ok=True)
+        chunk_paths = split_fasta(query_path, chunk_dir, num_chunks, split_by)
+        runs = []
+        chunk_outputs = []
+        for chunk_path in chunk_paths:
+            chunk_output = f"{chunk_path}_result.csv"
+            blast_command, blast_cwd = self._build_blast_command(
+                chunk_path, num_threads=threads_per_chunk
+            )
+            runs.append((blast_command, blast_cwd, chunk_path, chunk_output, keep_qseqid))
+            chunk_outputs.append(chunk_output)
+        return runs, chunk_outputs
+
+    def _merge_chunks(self, chunk_outputs, output_file):
+        """チャンクごとの結果をチャンク順に連結する (元のクエリ順の結果になる)"""
+        with open(output_file, "wb") as out:
+            for chunk_output in chunk_outputs:
+                if os.path.exists(chunk_output):
+                    with open(chunk_output, "rb") as f:
+                        shutil.copyfileobj(f, out)
+
+    def _build_blast_command(self, fasta_file, num_threads=None):
         """
         【C案 改修】設定を読み込み、BLASTコマンドと実行ディレクトリを構築する。
         - FileNotFoundErrorを早期検知するため、パスの構築と実行を分離
+        - 結果は -out ではなく標準出力に書かせ、_stream_process で受け取る
+          (qseqid 列付きで出力し、<file>_result.csv に書くときに取り除く)
+
+        Args:
+            fasta_file (str): クエリとして渡すFASTAファイル
+            num_threads (int, optional): -num_threads の値 (省略時はこのワーカーの値)
         """
         # --- 1. 設定ファイルからパスと設定を読み込む ---
         try:
             blast_path = self.config.get("PATHS", "blast_path")
             db_path = self.config.get("PATHS", "database_path")
             db_name = self.config.get("BLAST_SETTINGS", "database_name")
-            num_threads = self.config.get("BLAST_SETTINGS", "num_threads")
         except Exception as e:
             raise RuntimeError(f"config.iniからの設定読み込みエラー: {e}")
 
         # 実行パスとDBパスを動的に構築
+        if num_threads is None:
+            num_threads = self.num_threads
+
         # (C-4) FileNotFoundErrorを発生させるため、blastn.exeのフルパスを構築
-        blastn_exe = os.path.join(blast_path, "blastn.exe")
+        blastn_exe = blastn_executable(blast_path)
 
         # (C-4) DBパスの構築方法を変更
         # blastnは -db オプションにフルパスを渡すよりも、
@@ -148,8 +1059,6 @@ class BlastWorker(threading.Thread):
         # .nal/.palエイリアスファイルの解決において堅牢
         full_db_path_name = db_name  # os.path.join(db_path, db_name)
 
-        output_file = f"{fasta_file}_result.csv"
-
         # --- 3. 実行するコマンドをリストとして構築 ---
         command = [
             blastn_exe,
@@ -159,12 +1068,10 @@ class BlastWorker(threading.Thread):
             fasta_file,
             "-db",
             full_db_path_name,  # DB名のみ
-            "-out",
-            output_file,
             "-outfmt",
-            "6 pident sacc staxid ssciname stitle",
+            f"6 {RAW_FIELDS}",
             "-num_threads",
-            num_threads,
+            str(num_threads),
         ]
 
         # (C-4) 実行時のカレントワーキングディレクトリとしてDBパスを渡す
@@ -185,8 +1092,10 @@ class BlastWorker(threading.Thread):
             file_name = os.path.basename(fasta_file)
             # 最終的な移動先のファイルパス
             destination_file = os.path.join(processed_folder, file_name)
-            # ファイルを移動する
-            shutil.move(fasta_file, destination_file)
+            # ファイルを移動する (別のボリュームなら1回のコピーの後に rename する)
+            publish_file(fasta_file, destination_file)
+            if self.journal is not None:
+                self.journal.record_move(fasta_file, destination_file)
         except Exception as e:
             # ファイル移動のエラーはGUIに通知する（ただし解析は完了している）
             self.queue.put(
@@ -195,25 +1104,56 @@ class BlastWorker(threading.Thread):
                     "error_type": "MoveFileError",
                     "message": f"警告: 解析は完了しましたが、処理済みファイルの移動に失敗しました。\n{e}",
                     "original_path": fasta_file,  # エラーだが、完了扱いにする
+                    "metrics": self._job_metrics(),
                 }
             )
 
+    def _kill_processes(self):
+        """まだ実行中のサブプロセスを、子孫のプロセスも含めて全て強制終了する"""
+        for process in self.processes:
+            if process.poll() is None:
+                kill_process_tree(process, grace_sec=0)
+
+    def cancel(self, reason):
+        """
+        ジョブを中止する (リストからの中止・タイムアウト)。terminate() と同じく
+        blastn をプロセスツリーごと終了し、書きかけの結果を削除したうえで、
+        完了していないファイルごとに "cancelled" メッセージを通知する。
+
+        Args:
+            reason (str): 中止の理由 (CANCEL_REASONS のキー)
+        """
+        if self.cancel_reason is None:
+            self.cancel_reason = reason
+        self.terminate()
+
     def terminate(self):
-        """外部 (main.py) から呼び出され、サブプロセスを強制終了する"""
+        """
+        外部 (main.py) から呼び出され、サブプロセスをプロセスツリーごと終了する
+        (SIGTERM の後、猶予を過ぎても残っていれば強制終了する)。
+        """
         print(f"Terminate() が {self.filepath} に対して呼ばれました。")
         self.terminated = True  # まずフラグを立てる (キュー通知を抑制)
 
-        if self.process and self.process.poll() is None:
-            # プロセスがまだ実行中の場合
+        worker = self._current_worker
+        if worker is not None:
+            worker.terminate()
+
+        running = [p for p in self.processes if p.poll() is None]
+        if not running:
+            print("プロセスは既に終了しているか、開始されていません。")
+            return
+
+        for process in running:
             try:
-                self.process.terminate()  # SIGTERM を送信
-                print(f"プロセス {self.process.pid} に terminate() を送信しました。")
+                kill_process_tree(process)
+                if process.pid is None:
+                    print(f"エージェント {self.agent.address} に blastn の終了を要求しました。")
+                else:
+                    print(f"プロセス {process.pid} (と子プロセス) に終了を要求しました。")
             except Exception as e:
-                print(f"プロセス terminate() 中にエラー: {e}")
+                print(f"プロセスの終了中にエラー: {e}")
                 try:
-                    self.process.kill()  # 強制終了
-                    print(f"プロセス {self.process.pid} に kill() を送信しました。")
+                    process.kill()  # 強制終了
                 except Exception as e_kill:
                     print(f"プロセス kill() 中にエラー: {e_kill}")
-        else:
-            print("プロセスは既に終了しているか、開始されていません。")
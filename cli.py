@@ -0,0 +1,466 @@
+# cli.py
+"""
+BlastNavigator のヘッドレス (Tkinter 不要) バッチ実行エントリポイント。
+
+使い方:
+    python cli.py run *.fasta --db ref_prok_rep_genomes --jobs 4
+    python cli.py run samples/*.fa --json > progress.jsonl
+    python cli.py run --watch /mnt/sequencer/out   (新しいファイルを解析し続ける)
+    python cli.py run *.fasta --agent node1:7070 --agent node2:7070   (他のノードにも分散する)
+    python cli.py index /data/results          (既存の結果を索引に取り込む)
+    python cli.py search --taxid 562 --min-pident 97
+
+GUI と同じ config.ini・BlastWorker・processed フォルダへの移動処理を使う。
+このモジュールからは tkinter を import しないこと (表示のないサーバーで動かすため)。
+"""
+import argparse
+import glob
+import json
+import os
+import queue
+import sys
+import time
+
+from agent_pool import AgentPool
+from async_engine import ENGINE_MODES, start_job
+from autotune import ThreadTuner
+from config_manager import CONFIG_PATH, load_config, validate_settings
+from folder_watch import DEFAULT_PATTERNS, FolderWatcher
+from job_metrics import format_summary, open_metrics_log
+from job_queue import JobQueue, JobState
+from result_cache import open_result_cache
+from result_index import (
+    DEFAULT_SEARCH_LIMIT,
+    ResultIndex,
+    find_result_files,
+    index_path_from_config,
+    open_index_writer,
+    result_path_for,
+)
+from scheduler import (
+    SCHEDULING_POLICIES,
+    apply_policy,
+    take_next_launch,
+    take_next_remote_launch,
+)
+
+
+def _expand_paths(patterns):
+    """
+    シェルが展開しない環境 (Windows の cmd など) 向けにワイルドカードを展開する。
+    blastn は DBフォルダをカレントにして実行されるため、絶対パスに変換しておく。
+    """
+    filepaths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        filepaths.extend(os.path.abspath(p) for p in (matches or [pattern]))
+    return filepaths
+
+
+def _apply_overrides(config, args):
+    """コマンドライン引数で config.ini の値を上書きする (ファイルには保存しない)"""
+    for section in ("PATHS", "BLAST_SETTINGS", "SCHEDULING", "ENGINE", "AGENTS"):
+        if not config.has_section(section):
+            config.add_section(section)
+    if args.blast_path:
+        config.set("PATHS", "blast_path", args.blast_path)
+    if args.db_path:
+        config.set("PATHS", "database_path", args.db_path)
+    if args.db:
+        config.set("BLAST_SETTINGS", "database_name", args.db)
+    if args.threads:
+        config.set("BLAST_SETTINGS", "num_threads", str(args.threads))
+    if args.jobs:
+        config.set("BLAST_SETTINGS", "max_jobs", str(args.jobs))
+    if args.policy:
+        config.set("SCHEDULING", "policy", args.policy)
+    if args.engine:
+        config.set("ENGINE", "mode", args.engine)
+    if args.agent:
+        config.set("AGENTS", "enabled", "true")
+        config.set("AGENTS", "hosts", ";".join(args.agent))
+
+
+def _emit(message, as_json, batch_done, batch_total):
+    """ワーカーからのメッセージを標準出力に書き出す"""
+    if as_json:
+        record = dict(message)
+        record["time"] = time.time()
+        record["batch_done"] = batch_done
+        record["batch_total"] = batch_total
+        print(json.dumps(record, ensure_ascii=False), flush=True)
+        return
+
+    message_type = message.get("type")
+    if message_type == "watch_files":
+        for path in message["paths"]:
+            print(f"[watch] {path}", flush=True)
+    elif message_type == "progress":
+        print(f"[progress] {message.get('message', '')}", flush=True)
+    elif message_type == "file_done":
+        suffix = " (キャッシュ)" if message.get("cache_hit") else ""
+        print(
+            f"[done {batch_done}/{batch_total}] {message['original_path']}{suffix}",
+            flush=True,
+        )
+    elif message_type == "requeue":
+        print(
+            f"[requeue] {message['original_path']}\n{message.get('message', '')}",
+            file=sys.stderr,
+            flush=True,
+        )
+    elif message_type == "cancelled":
+        print(
+            f"[cancelled {batch_done}/{batch_total}] {message['original_path']}\n"
+            f"{message.get('message', '')}",
+            file=sys.stderr,
+            flush=True,
+        )
+    elif message_type == "error":
+        print(
+            f"[error {batch_done}/{batch_total}] "
+            f"{message.get('error_type', 'GenericError')}: "
+            f"{message['original_path']}\n{message.get('message', '')}",
+            file=sys.stderr,
+            flush=True,
+        )
+        if message.get("stderr"):
+            print(message["stderr"], file=sys.stderr, flush=True)
+
+
+def run_batch(
+    filepaths, config, as_json=False, metrics_path=None, config_path=CONFIG_PATH, watch_dirs=None
+):
+    """
+    ファイル群を BlastWorker で解析し、キューのメッセージを出力し続ける。
+    最後にファイルあたりの時間とスループットの集計を出力する
+    (--json の場合は "type": "summary" の行)。
+
+    Args:
+        metrics_path (str): ジョブごとの計測の書き出し先 (省略時は [METRICS] 設定)
+        config_path (str): 設定ファイルのパス ([AUTOTUNE] のモデルを同じフォルダに置く)
+        watch_dirs (list[str]): 監視するフォルダ。指定すると、新しいファイルを解析し続け、
+            Ctrl+C まで終了しない (監視の設定は [WATCH] の値を使う)
+
+    Returns:
+        int: 終了コード (0: 全て成功 / 1: エラー・中止したファイルがある)
+    """
+    message_queue = queue.Queue()
+    jobs = JobQueue()
+    jobs.add(filepaths)
+    apply_policy(jobs, config)
+    batch_total = len(jobs)
+    running_workers = {}  # ファイルパス -> BlastWorker
+    failed = 0
+    finished = 0  # 完了 (成功・エラー) したファイル数
+    metrics_log = open_metrics_log(config, metrics_path)
+    # [RESULT_INDEX] が有効なら、完了した結果を索引に取り込む (別スレッド)
+    index_writer = open_index_writer(config, config_path)
+    # [CACHE] が有効なら、全てのジョブで同じ結果キャッシュを使う
+    result_cache = open_result_cache(config, config_path)
+    tuner = ThreadTuner.from_config(config, config_path)
+    # バッチ全体の制限時間 ([TIMEOUTS] の batch_timeout_min)。過ぎたら新しいファイルを開始しない
+    batch_timeout_min = config.getfloat("TIMEOUTS", "batch_timeout_min", fallback=0)
+    batch_deadline = time.time() + batch_timeout_min * 60 if batch_timeout_min > 0 else None
+    timed_out = False
+    watcher = None
+    if watch_dirs:
+        # 監視スレッドからはキューに入れるだけにし、このループでキューに追加する
+        watcher = FolderWatcher(
+            watch_dirs,
+            lambda paths: message_queue.put({"type": "watch_files", "paths": paths}),
+            patterns=config.get("WATCH", "patterns", fallback=DEFAULT_PATTERNS).split(),
+            stable_sec=config.getfloat("WATCH", "stable_sec", fallback=5),
+            poll_sec=config.getfloat("WATCH", "poll_sec", fallback=30),
+        )
+        watcher.start()
+        print(f"フォルダを監視しています (Ctrl+C で終了): {', '.join(watch_dirs)}", file=sys.stderr)
+    # [AGENTS] のエージェント。空きができたらキューで知らせてもらい、このループで割り当てる
+    agents = AgentPool.from_config(
+        config, on_available=lambda: message_queue.put({"type": "agents_available"})
+    )
+    if agents is not None:
+        agents.start()
+    waiting_for_agents = False
+
+    try:
+        while (
+            (watcher is not None and not timed_out)
+            or (jobs.count(JobState.PENDING) and not timed_out)
+            or running_workers
+        ):
+            # 空きスロットがある限り次のファイルを開始する
+            # (まとめて実行するファイルは同じワーカーを指すので、ワーカー数で数える)
+            # (このマシンに空きがなければ、空きスロットの多いエージェントに割り当てる)
+            while not timed_out:
+                group, num_threads = take_next_launch(jobs, config, running_workers, tuner)
+                agent = None
+                if not group:
+                    group, agent = take_next_remote_launch(jobs, config, agents)
+                    if not group:
+                        break
+                worker = start_job(
+                    [job.filepath for job in group],
+                    message_queue,
+                    config,
+                    num_threads=num_threads,
+                    agent=agent,
+                    cache=result_cache,
+                )
+                for job in group:
+                    running_workers[job.filepath] = worker
+            if not running_workers and jobs.count(JobState.PENDING) and not timed_out:
+                if not waiting_for_agents:
+                    print("利用できるエージェントがありません。応答を待っています...", file=sys.stderr)
+                waiting_for_agents = True
+            else:
+                waiting_for_agents = False
+
+            try:
+                timeout = None if batch_deadline is None else max(0.0, batch_deadline - time.time())
+                if watcher is not None:
+                    # 監視中は Ctrl+C を受け付けられるよう、待ち続けない (Windows 対策)
+                    timeout = 1.0 if timeout is None else min(timeout, 1.0)
+                message = message_queue.get(timeout=timeout)
+            except queue.Empty:
+                if batch_deadline is None or time.time() < batch_deadline:
+                    continue
+                # 制限時間を過ぎた。実行中のジョブを中止し、cancelled メッセージを待つ
+                timed_out = True
+                batch_deadline = None
+                for worker in set(running_workers.values()):
+                    worker.cancel("batch_timeout")
+                print("バッチ全体の制限時間を過ぎたため、解析を中止しています...", file=sys.stderr)
+                continue
+
+            if message["type"] == "agents_available":
+                continue  # ループの先頭で割り当てる
+            if message["type"] == "requeue":
+                # ノードを見失ったジョブは、解析待ちに戻して別のノードでやり直す
+                job = jobs.by_path.get(message["original_path"])
+                if running_workers.pop(message["original_path"], None) is not None:
+                    jobs.mark_pending(job)
+                    apply_policy(jobs, config)
+            elif message["type"] == "watch_files":
+                added = jobs.add(message["paths"])
+                if added:
+                    apply_policy(jobs, config)
+                    batch_total += len(added)
+                    message = dict(message, paths=[job.filepath for job in added])
+                else:
+                    continue  # 既にキューにあるファイルだけだった
+            elif message["type"] in ("file_done", "error", "cancelled"):
+                # 移動エラーは解析自体は完了しているので成功扱い
+                # (直後に届く file_done は実行中エントリがないので無視される)
+                job = jobs.by_path.get(message["original_path"])
+                if running_workers.pop(message["original_path"], None) is not None:
+                    metrics_log.add(message, job.queued_at)
+                    # 自動調整はこのマシンの実測値だけから学ぶ
+                    if (
+                        tuner is not None
+                        and message["type"] == "file_done"
+                        and "agent" not in message["metrics"]
+                    ):
+                        tuner.observe(message["metrics"])
+                    finished += 1
+                    if message["type"] == "cancelled":
+                        failed += 1
+                        jobs.mark_cancelled(job)
+                    elif message["type"] == "error" and (
+                        message.get("error_type") != "MoveFileError"
+                    ):
+                        failed += 1
+                        jobs.mark_error(job)
+                    else:
+                        jobs.finish(job)
+                    if index_writer is not None and message["type"] == "file_done":
+                        index_writer.submit(result_path_for(message["original_path"]))
+            _emit(message, as_json, finished, batch_total)
+    except KeyboardInterrupt:
+        for worker in set(running_workers.values()):
+            worker.terminate()
+        print("中断されました。実行中の blastn を終了しました。", file=sys.stderr)
+        return 130
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        if agents is not None:
+            agents.stop()
+        metrics_log.close()
+        if index_writer is not None:
+            index_writer.close()
+
+    if timed_out and jobs.count(JobState.PENDING):
+        failed += 1
+        print(
+            f"制限時間のため {jobs.count(JobState.PENDING)}個のファイルを解析しませんでした。",
+            file=sys.stderr,
+            flush=True,
+        )
+
+    summary = metrics_log.summary()
+    if as_json:
+        print(json.dumps(dict(summary, type="summary"), ensure_ascii=False), flush=True)
+    else:
+        print(format_summary(summary), file=sys.stderr, flush=True)
+    return 1 if failed else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="blastnavigator", description="BlastNavigator ヘッドレス実行"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="FASTAファイルを解析する")
+    run_parser.add_argument("files", nargs="*", help="解析するFASTAファイル")
+    run_parser.add_argument(
+        "--watch",
+        action="append",
+        metavar="DIR",
+        help="フォルダを監視し、新しい FASTA ファイルを解析し続ける (複数指定可)",
+    )
+    run_parser.add_argument("--config", default=CONFIG_PATH, help="設定ファイル")
+    run_parser.add_argument("--blast-path", help="BLAST+ binフォルダ")
+    run_parser.add_argument("--db-path", help="DBフォルダ")
+    run_parser.add_argument("--db", help="DB名")
+    run_parser.add_argument("--threads", type=int, help="1ジョブあたりのスレッド数")
+    run_parser.add_argument("--jobs", type=int, help="同時に実行するジョブ数")
+    run_parser.add_argument(
+        "--policy",
+        choices=SCHEDULING_POLICIES,
+        help="解析順の方針 (fifo: 指定した順 / sjf: 小さいファイルから)",
+    )
+    run_parser.add_argument(
+        "--engine",
+        choices=ENGINE_MODES,
+        help="blastn の実行エンジン (thread: ジョブごとのスレッド / asyncio: 1つのイベントループ)",
+    )
+    run_parser.add_argument(
+        "--agent",
+        action="append",
+        metavar="HOST:PORT",
+        help="blastn を実行させるエージェント (blast_agent.py)。複数指定可 ([AGENTS] の hosts を上書き)",
+    )
+    run_parser.add_argument(
+        "--json", action="store_true", help="メッセージを JSON Lines で出力する"
+    )
+    run_parser.add_argument(
+        "--metrics",
+        help="ジョブごとの計測の書き出し先 (.jsonl または .csv, 省略時は [METRICS] 設定)",
+    )
+
+    index_parser = subparsers.add_parser("index", help="既存の結果ファイルを索引に取り込む")
+    index_parser.add_argument(
+        "paths", nargs="+", help="結果ファイル (*_result.csv / *_result.bnc) またはそれを含むフォルダ"
+    )
+    index_parser.add_argument("--config", default=CONFIG_PATH, help="設定ファイル")
+    index_parser.add_argument("--index", help="索引ファイル (省略時は [RESULT_INDEX] filename)")
+    index_parser.add_argument(
+        "--json", action="store_true", help="取り込みの結果を JSON で出力する"
+    )
+
+    search_parser = subparsers.add_parser("search", help="索引から結果を検索する")
+    search_parser.add_argument("--config", default=CONFIG_PATH, help="設定ファイル")
+    search_parser.add_argument("--index", help="索引ファイル (省略時は [RESULT_INDEX] filename)")
+    search_parser.add_argument("--taxid", type=int, help="staxid")
+    search_parser.add_argument("--species", help="学名 (部分一致)")
+    search_parser.add_argument("--sacc", help="アクセッション (完全一致)")
+    search_parser.add_argument("--min-pident", type=float, help="pident の下限 (%%)")
+    search_parser.add_argument("--sample", help="サンプル名 (部分一致)")
+    search_parser.add_argument(
+        "--hits", action="store_true", help="サンプルごとの集計ではなく、ヒットを1行ずつ出力する"
+    )
+    search_parser.add_argument(
+        "--limit", type=int, default=DEFAULT_SEARCH_LIMIT, help="最大件数"
+    )
+    search_parser.add_argument("--json", action="store_true", help="JSON Lines で出力する")
+    return parser
+
+
+def _open_index(args):
+    """--index か [RESULT_INDEX] の filename の索引を開く (enabled でなくても使う)"""
+    path = args.index
+    if path is None:
+        config = load_config(args.config)
+        path = index_path_from_config(config, args.config, required=True)
+    return ResultIndex(path)
+
+
+def run_index(args):
+    """既存の結果ファイルを索引に取り込み、取り込んだ数と時間を出力する"""
+    index = _open_index(args)
+    result_files = find_result_files(args.paths)
+    report = index.ingest(result_files)
+    if args.json:
+        print(json.dumps(dict(report, **index.stats()), ensure_ascii=False))
+    else:
+        print(
+            f"{report['ingested']}個のファイル ({report['rows']}行) を取り込みました "
+            f"(変更なし {report['skipped']}個, {report['seconds']:.2f}秒)。"
+        )
+        if report["failed"]:
+            print(f"{report['failed']}個のファイルを読めませんでした。", file=sys.stderr)
+        stats = index.stats()
+        print(f"索引: サンプル {stats['samples']}個, ヒット {stats['hits']}行")
+    return 1 if report["missing"] or report["failed"] else 0
+
+
+def run_search(args):
+    """索引を検索し、サンプル (--hits ならヒット) を1行ずつ出力する"""
+    index = _open_index(args)
+    filters = {
+        "staxid": args.taxid,
+        "species": args.species,
+        "sacc": args.sacc,
+        "min_pident": args.min_pident,
+        "sample": args.sample,
+    }
+    started = time.monotonic()
+    if args.hits:
+        rows = index.find_hits(limit=args.limit, **filters)
+    else:
+        rows = index.find_samples(limit=args.limit, **filters)
+    elapsed_ms = (time.monotonic() - started) * 1000
+    for row in rows:
+        if args.json:
+            print(json.dumps(row, ensure_ascii=False))
+        else:
+            print("\t".join(str(value) for value in row.values()))
+    print(f"{len(rows)}件 ({elapsed_ms:.1f} ms)", file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "index":
+        return run_index(args)
+    if args.command == "search":
+        return run_search(args)
+    if not args.files and not args.watch:
+        parser.error("解析するファイルか --watch のフォルダを指定してください")
+
+    config = load_config(args.config)
+    _apply_overrides(config, args)
+
+    try:
+        error_message = validate_settings(config)
+    except Exception as e:
+        error_message = f"設定ファイルの読み込み中にエラーが発生しました。\n{e}"
+    if error_message:
+        print(f"設定エラー: {error_message}", file=sys.stderr)
+        return 2
+
+    return run_batch(
+        _expand_paths(args.files),
+        config,
+        as_json=args.json,
+        metrics_path=args.metrics,
+        config_path=args.config,
+        watch_dirs=args.watch,
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
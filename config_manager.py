@@ -2,14 +2,20 @@
 import configparser
 import os
 
+from agent_pool import parse_address
+from async_engine import ENGINE_MODES
+from process_utils import blastn_executable
+from result_summary import TIE_RULES
+from scheduler import SCHEDULING_POLICIES
+
 CONFIG_PATH = "config.ini"
 
 
-def load_config():
+def load_config(config_path=CONFIG_PATH):
     """設定ファイル (config.ini) を読み込む。なければデフォルトで作成する。"""
     config = configparser.ConfigParser()
 
-    if not os.path.exists(CONFIG_PATH):
+    if not os.path.exists(config_path):
         # デフォルト設定の作成
         config["PATHS"] = {
             "blast_path": "C:\\ncbi-blast-2.17.0+\\bin",
@@ -18,20 +24,275 @@ def load_config():
         config["BLAST_SETTINGS"] = {
             "database_name": "ref_prok_rep_genomes",
             "num_threads": "8",
+            # 同時に実行する blastn ジョブ数の上限
+            "max_jobs": "1",
+            # 全ジョブ合計のスレッド数上限 (0 の場合は CPU コア数)
+            "thread_budget": "0",
+        }
+        config["CHUNKING"] = {
+            # 大きなマルチFASTAをチャンクに分割して並列に blastn を実行するか
+            "enabled": "false",
+            # 分割数
+            "chunks": "4",
+            # 分割の基準 (records: レコード数 / bytes: ファイルサイズ)
+            "split_by": "records",
+            # これより少ないレコード数のファイルは分割しない
+            "min_records": "1000",
+        }
+        config["CACHE"] = {
+            # 同じクエリ・DB・オプションの結果を再利用する結果キャッシュを使うか
+            "enabled": "false",
+            # キャッシュの保存先フォルダ (相対パスは config.ini のあるフォルダが基準)
+            "directory": "blast_cache",
+            # キャッシュの最大サイズ (MB)。超えたら古いものから削除する
+            "max_size_mb": "2048",
+        }
+        config["DEDUP"] = {
+            # 同一配列のクエリを1つにまとめてから BLAST し、結果を元の全レコードに展開するか
+            "enabled": "false",
+        }
+        config["DB_WARMUP"] = {
+            # 最初のジョブの前にDBボリュームを読み込み、ページキャッシュに載せておくか
+            "enabled": "false",
+            # ウォームアップを再確認する間隔 (分)
+            "interval_min": "60",
+        }
+        config["PACKING"] = {
+            # 小さなFASTAファイルをまとめて1回の blastn で解析するか
+            "enabled": "false",
+            # これより大きなファイル (KB) はまとめずに単独で実行する
+            "max_file_kb": "1024",
+            # まとめる合計レコード数の上限
+            "max_records": "20000",
+            # まとめるファイル数の上限
+            "max_files": "200",
+        }
+        config["JOURNAL"] = {
+            # キューの状態を記録し、クラッシュ後の起動時に未完了のジョブを復元するか
+            "enabled": "true",
+            # ジャーナルのファイル名 (config.ini と同じフォルダに作成)
+            "filename": "job_journal.sqlite3",
+        }
+        config["METRICS"] = {
+            # ジョブごとの時間・CPU・メモリ・I/O をバッチごとのファイルに書き出すか
+            "enabled": "false",
+            # 書き出し先フォルダ (metrics_<開始時刻>.<format> を作成)
+            "directory": "metrics",
+            # 形式 (jsonl: JSON Lines / csv)
+            "format": "jsonl",
+        }
+        config["AUTOTUNE"] = {
+            # 過去のジョブの実測値から、ファイルごとの num_threads と同時実行数を決めるか
+            # (有効な場合、合計スレッド数は thread_budget 以内。num_threads は学習前の初期値)
+            "enabled": "false",
+            # 学習したモデルのファイル名 (config.ini と同じフォルダに作成)
+            "model_file": "autotune_model.json",
+            # 同時実行ジョブ数の上限 (0 の場合はスレッド予算のみで決める。メモリ不足の対策用)
+            "max_jobs": "0",
+            # 1ジョブあたりのスレッド数の上限 (0 の場合はスレッド予算まで)
+            "max_threads": "0",
+        }
+        config["SCHEDULING"] = {
+            # 解析待ちの並べ方 (fifo: 追加した順 / sjf: 小さいファイルから)
+            # リストの表示順が実行順になる。ドラッグで動かしたファイルの位置は変えない
+            "policy": "fifo",
+            # sjf での大きさの基準 (size: ファイルサイズ / records: レコード数)
+            "size_by": "size",
+            # これより長く待っているファイル (分) は、方針やレーンに関係なく先に実行する (0 で無効)
+            "max_wait_min": "60",
+        }
+        config["TIMEOUTS"] = {
+            # 1ジョブ (1回の blastn) の制限時間 = job_timeout_min (分) + クエリ1MBあたり sec_per_mb (秒)
+            # 過ぎたら blastn をプロセスグループごと終了し、「中止」にする (両方 0 で無効)
+            "job_timeout_min": "0",
+            "sec_per_mb": "0",
+            # バッチ全体の制限時間 (分)。過ぎたら実行中のジョブを中止し、残りは開始しない (0 で無効)
+            "batch_timeout_min": "0",
+        }
+        config["STAGING"] = {
+            # クエリと結果をローカルの高速なディスク (scratch) に置いて blastn を実行する
+            # (入力フォルダがネットワーク共有の場合に有効。結果は完了後にまとめて公開する)
+            "enabled": "false",
+            # scratch フォルダ (空なら OS の一時フォルダ)
+            "directory": "",
+            # ジョブが scratch に必要とする容量の見積もり (クエリの大きさの何倍か)
+            "space_factor": "3",
+            # 予約後にも残しておく空き容量 (MB)。足りないジョブは元のフォルダで実行する
+            "min_free_mb": "1024",
+        }
+        config["WATCH"] = {
+            # 監視フォルダに置かれた新しい FASTA ファイルを自動でリストに追加する
+            "enabled": "false",
+            # 監視するフォルダ (";" 区切りで複数)
+            "directories": "",
+            # 対象のファイル名 (空白区切り)
+            "patterns": "*.fasta *.fa *.fna",
+            # 大きさと更新時刻がこの秒数変わらなければ書き込み完了とみなす
+            # (Linux では書き込みを閉じたファイルはすぐに追加する)
+            "stable_sec": "5",
+            # フォルダを走査する間隔 (秒)。ネットワーク共有は走査でしか検出できない
+            "poll_sec": "30",
+            # 追加したら確認なしで解析を開始する
+            "auto_start": "true",
+        }
+        config["ENGINE"] = {
+            # blastn の実行エンジン (thread: ジョブごとにスレッド / asyncio: 1つのイベントループで
+            # 全ジョブの blastn と出力・タイムアウトを扱う。同時実行数が多いときに軽い)
+            "mode": "thread",
+            # asyncio のとき、blastn の前後のファイル処理 (重複除去・分割・移動など) に使うスレッド数
+            "io_workers": "4",
+        }
+        config["AGENTS"] = {
+            # 他のノードの blast_agent.py に、ローカルの空きを超えたジョブを割り当てる
+            "enabled": "false",
+            # エージェントの "ホスト:ポート" (";" 区切りで複数)
+            "hosts": "",
+            # このマシンでも blastn を実行するか (false ならエージェントだけで実行する)
+            "use_local": "true",
+            # エージェントに状態を問い合わせる間隔 (秒)
+            "heartbeat_sec": "5",
+            # この秒数応答がなければノードを見失ったとみなし、実行中のジョブを解析待ちに戻す
+            "timeout_sec": "30",
+            # エージェントと共有する合言葉 (空ならエージェントは 127.0.0.1 でしか待ち受けない)
+            "token": "",
+            # このマシンで blast_agent.py を起動するときの待ち受けポートと同時実行数
+            "port": "7070",
+            "slots": "1",
+            # エージェントが受け付けるクエリの最大の大きさ (MB)
+            "max_query_mb": "1024",
         }
-        save_config(config)
-        print(f"'{CONFIG_PATH}' が見つからなかったため、デフォルト設定で作成しました。")
+        config["RESULT_INDEX"] = {
+            # 完了した結果を SQLite の索引に取り込み、taxid・学名・アクセッションで検索できるようにする
+            "enabled": "false",
+            # 索引ファイル (相対パスは config.ini のあるフォルダが基準)
+            "filename": "result_index.sqlite3",
+        }
+        config["COLUMNAR"] = {
+            # 完了した結果を、圧縮した列指向の <file>_result.bnc にも書く
+            # (アクセッション・学名・タイトルは辞書で符号化。読み込みは result_columnar.py)
+            "enabled": "false",
+            # <file>_result.csv も残す
+            "keep_csv": "true",
+            # 1ブロックの行数 (書き込み中にメモリに持つ行数)
+            "block_rows": "65536",
+            # zlib の圧縮レベル (1: 速い 〜 9: 小さい)
+            "compress_level": "1",
+        }
+        config["SUMMARY"] = {
+            # 結果を書くのと同じ読み出しで、クエリごとの最良ヒットと種の組成を集計し、
+            # <file>_summary.tsv に書く (result_summary.py 参照)
+            "enabled": "false",
+            # 同点のヒットの扱い (first: 最初のヒット / lca: 同点のヒットに共通の種・属)
+            "tie_rule": "lca",
+            # 最良の pident からこの差までのヒットを同点とみなす
+            "tie_delta": "0.5",
+            # 最良の pident がこれ未満のクエリは unclassified
+            "min_pident": "0",
+            # クエリごとの最良ヒットを <file>_besthits.tsv にも書く
+            "best_hits": "false",
+        }
+        save_config(config, config_path)
+        print(f"'{config_path}' が見つからなかったため、デフォルト設定で作成しました。")
 
-    config.read(CONFIG_PATH, encoding="utf-8")
+    config.read(config_path, encoding="utf-8")
     return config
 
 
-def save_config(config_object):
+def save_config(config_object, config_path=CONFIG_PATH):
     """設定オブジェクトをconfig.iniファイルに書き込む。"""
-    with open(CONFIG_PATH, "w", encoding="utf-8") as configfile:
+    with open(config_path, "w", encoding="utf-8") as configfile:
         config_object.write(configfile)
 
 
+def validate_settings(config):
+    """
+    設定ファイルの内容が実在するかを検証する (GUI/CLI 共通)。
+
+    Returns:
+        str | None: 問題があればエラーメッセージ、なければ None
+    """
+    blast_path = config.get("PATHS", "blast_path")
+    db_path = config.get("PATHS", "database_path")
+    db_name = config.get("BLAST_SETTINGS", "database_name")
+
+    # 1. blastn.exe の存在確認
+    blastn_exe_path = blastn_executable(blast_path)
+    if not os.path.exists(blastn_exe_path):
+        return (
+            f"{os.path.basename(blastn_exe_path)} が見つかりません。\n"
+            f"パス: {blastn_exe_path}\n"
+            "設定画面で [BLAST+ binフォルダ] を確認してください。"
+        )
+
+    # 2. データベースファイル (.nal または .pal) の存在確認
+    # .nal (nucleotide) または .pal (protein) がDBの代表ファイル
+    db_file_path_nal = os.path.join(db_path, f"{db_name}.nal")
+    db_file_path_pal = os.path.join(db_path, f"{db_name}.pal")
+
+    if not os.path.exists(db_file_path_nal) and not os.path.exists(db_file_path_pal):
+        return (
+            f"データベースファイル ({db_name}.nal または .pal) が見つかりません。\n"
+            f"パス: {db_path}\n"
+            "設定画面で [DBフォルダ] と [DB名] を確認してください。"
+        )
+
+    # 3. スケジューリング方針
+    policy = config.get("SCHEDULING", "policy", fallback="fifo").lower()
+    if policy not in SCHEDULING_POLICIES:
+        return (
+            f"不明なスケジューリング方針です: {policy}\n"
+            f"[SCHEDULING] の policy には {' / '.join(SCHEDULING_POLICIES)} を指定してください。"
+        )
+
+    # 4. 実行エンジン
+    engine = config.get("ENGINE", "mode", fallback="thread").lower()
+    if engine not in ENGINE_MODES:
+        return (
+            f"不明な実行エンジンです: {engine}\n"
+            f"[ENGINE] の mode には {' / '.join(ENGINE_MODES)} を指定してください。"
+        )
+
+    # 5. エージェント
+    if config.getboolean("AGENTS", "enabled", fallback=False):
+        for host in config.get("AGENTS", "hosts", fallback="").split(";"):
+            if not host.strip():
+                continue
+            try:
+                parse_address(host)
+            except ValueError:
+                return (
+                    f"エージェントのアドレスが不正です: {host.strip()}\n"
+                    "[AGENTS] の hosts には \"ホスト:ポート\" を \";\" 区切りで指定してください。"
+                )
+
+    # 6. 列指向の結果ファイル
+    if config.getboolean("COLUMNAR", "enabled", fallback=False):
+        compress_level = config.getint("COLUMNAR", "compress_level", fallback=1)
+        if not 0 <= compress_level <= 9:
+            return (
+                f"圧縮レベルが不正です: {compress_level}\n"
+                "[COLUMNAR] の compress_level には 0〜9 を指定してください。"
+            )
+
+    # 7. 集計
+    if config.getboolean("SUMMARY", "enabled", fallback=False):
+        tie_rule = config.get("SUMMARY", "tie_rule", fallback="lca").strip().lower()
+        if tie_rule not in TIE_RULES:
+            return (
+                f"同点のヒットの扱いが不正です: {tie_rule}\n"
+                f"[SUMMARY] の tie_rule には {' / '.join(TIE_RULES)} を指定してください。"
+            )
+        try:
+            tie_delta = config.getfloat("SUMMARY", "tie_delta", fallback=0.5)
+            config.getfloat("SUMMARY", "min_pident", fallback=0.0)
+        except ValueError as e:
+            return f"[SUMMARY] の数値が不正です: {e}"
+        if tie_delta < 0:
+            return f"[SUMMARY] の tie_delta には0以上を指定してください: {tie_delta}"
+
+    return None  # 全ての検証をパス
+
+
 if __name__ == "__main__":
     # テスト実行
     config = load_config()
@@ -0,0 +1,177 @@
+# db_warmup.py
+"""
+BLASTデータベースのウォームアップ (ページキャッシュへの事前読み込み)。
+
+blastn を起動するたびにネットワークドライブ上のDBボリュームを冷えた状態から
+読むのを避けるため、最初のジョブの前と、その後は一定間隔で、エイリアスファイルに
+列挙されたボリュームファイルを読み込んでOSのページキャッシュに載せておく。
+DBの指紋 (blast_db.db_fingerprint) が変わっていなければ、ジョブごとの読み込みは省略する。
+"""
+import ctypes
+import ctypes.util
+import mmap
+import os
+import sys
+import threading
+import time
+
+from blast_db import db_fingerprint, list_volume_files
+
+READ_BLOCK_SIZE = 8 * 1024 * 1024
+# 定期チェックで、これ以上がページキャッシュに残っていれば読み直さない
+RESIDENT_THRESHOLD = 0.9
+
+_warmers = {}  # (DBフォルダ, DB名) -> DatabaseWarmer
+_warmers_lock = threading.Lock()
+
+
+def get_warmer(config):
+    """
+    [DB_WARMUP] が有効なら、設定のDBに対応する DatabaseWarmer を返す (無効なら None)。
+    同じDBには1つのウォーマーを共有し、初回に定期実行スレッドを開始する。
+    """
+    if not config.getboolean("DB_WARMUP", "enabled", fallback=False):
+        return None
+    db_path = config.get("PATHS", "database_path")
+    db_name = config.get("BLAST_SETTINGS", "database_name")
+    interval_min = config.getfloat("DB_WARMUP", "interval_min", fallback=60)
+
+    with _warmers_lock:
+        warmer = _warmers.get((db_path, db_name))
+        if warmer is None:
+            warmer = DatabaseWarmer(db_path, db_name, interval_min * 60)
+            _warmers[(db_path, db_name)] = warmer
+            warmer.start_schedule()
+        return warmer
+
+
+def resident_bytes(filepath):
+    """
+    ファイルのうちページキャッシュに載っているバイト数を返す (Linux の mincore を使用)。
+    計測できない環境では None を返す。
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    size = os.path.getsize(filepath)
+    if size == 0:
+        return 0
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        page_size = mmap.PAGESIZE
+        num_pages = (size + page_size - 1) // page_size
+        vec = (ctypes.c_ubyte * num_pages)()
+        with open(filepath, "rb") as f:
+            # ACCESS_COPY (プライベートマップ) にすると ctypes からアドレスを取れる
+            mapped = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_COPY)
+            try:
+                buffer = ctypes.c_char.from_buffer(mapped)
+                try:
+                    result = libc.mincore(
+                        ctypes.c_void_p(ctypes.addressof(buffer)),
+                        ctypes.c_size_t(size),
+                        vec,
+                    )
+                finally:
+                    del buffer
+            finally:
+                mapped.close()
+        if result != 0:
+            return None
+        resident_pages = sum(1 for flag in vec if flag & 1)
+        return min(size, resident_pages * page_size)
+    except Exception:
+        return None
+
+
+class DatabaseWarmer:
+    """1つのBLASTデータベースのボリュームファイルをページキャッシュに保つ"""
+
+    def __init__(self, db_path, db_name, interval_sec):
+        self.db_path = db_path
+        self.db_name = db_name
+        self.interval_sec = interval_sec
+        self.last_fingerprint = None
+        self.last_warm_time = None
+        self.last_report = None  # 直近の結果 {"files", "total_bytes", "read_bytes", "resident_bytes"}
+        self._lock = threading.Lock()
+        self._schedule_thread = None
+
+    def start_schedule(self):
+        """一定間隔でウォームアップを確認するデーモンスレッドを開始する"""
+        if self.interval_sec <= 0 or self._schedule_thread is not None:
+            return
+        self._schedule_thread = threading.Thread(target=self._schedule_loop, daemon=True)
+        self._schedule_thread.start()
+
+    def _schedule_loop(self):
+        while True:
+            time.sleep(self.interval_sec)
+            try:
+                self.ensure_warm(scheduled=True)
+            except Exception as e:
+                print(f"DBウォームアップ中にエラー: {e}")
+
+    def ensure_warm(self, scheduled=False):
+        """
+        必要ならウォームアップを行う。複数のワーカーから同時に呼ばれても、
+        読み込みは1回だけ行い、他のワーカーは完了を待つ。
+
+        Args:
+            scheduled (bool): 定期実行からの呼び出しか (ページキャッシュの残り具合も確認する)
+
+        Returns:
+            dict | None: 読み込みを行った場合はその結果、省略した場合は None
+        """
+        with self._lock:
+            fingerprint = db_fingerprint(self.db_path, self.db_name)
+            if fingerprint == self.last_fingerprint and not scheduled:
+                return None  # DBが変わっていなければジョブごとの読み込みは不要
+
+            files = list_volume_files(self.db_path, self.db_name)
+            if fingerprint == self.last_fingerprint:
+                # 定期チェック: まだ十分にキャッシュに残っていれば読み直さない
+                total = sum(os.path.getsize(p) for p in files)
+                resident = self._total_resident(files)
+                if resident is not None and total and resident / total >= RESIDENT_THRESHOLD:
+                    self.last_warm_time = time.time()
+                    return None
+
+            report = self._read_files(files)
+            self.last_fingerprint = fingerprint
+            self.last_warm_time = time.time()
+            self.last_report = report
+            return report
+
+    def _total_resident(self, files):
+        total = 0
+        for filepath in files:
+            resident = resident_bytes(filepath)
+            if resident is None:
+                return None
+            total += resident
+        return total
+
+    def _read_files(self, files):
+        """ボリュームファイルを順に読み込み、ページキャッシュに載せる"""
+        buffer = bytearray(READ_BLOCK_SIZE)
+        view = memoryview(buffer)
+        total_bytes = 0
+        read_bytes = 0
+        for filepath in files:
+            total_bytes += os.path.getsize(filepath)
+            with open(filepath, "rb", buffering=0) as f:
+                if hasattr(os, "posix_fadvise"):
+                    # 先読みをOSに依頼してから、実際に読み込んで確実にキャッシュに載せる
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+                while True:
+                    n = f.readinto(view)
+                    if not n:
+                        break
+                    read_bytes += n
+
+        return {
+            "files": len(files),
+            "total_bytes": total_bytes,
+            "read_bytes": read_bytes,
+            "resident_bytes": self._total_resident(files),
+        }
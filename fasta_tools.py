@@ -0,0 +1,220 @@
+# fasta_tools.py
+import array
+import functools
+import hashlib
+import math
+import os
+
+
+def iter_fasta_records(fasta_file):
+    """
+    FASTAファイルをストリーミングで読み、1レコードずつ返すジェネレータ。
+
+    ファイル全体をメモリに載せないよう、行単位 (バイト列) で読み進める。
+    最初の '>' より前にある行 (空行など) は最初のレコードに含める。
+
+    Args:
+        fasta_file (str): FASTAファイルのパス
+
+    Yields:
+        list[bytes]: ヘッダ行と配列行からなる1レコード分の行 (改行付き)
+    """
+    record = []
+    has_header = False
+    with open(fasta_file, "rb") as f:
+        for line in f:
+            if line.startswith(b">"):
+                if has_header:
+                    yield record
+                    record = []
+                has_header = True
+            record.append(line)
+    if record:
+        yield record
+
+
+def count_fasta_records(fasta_file):
+    """
+    '>' で始まる行を数えて、FASTAのレコード数を高速に返す。
+    同じファイル (パス・サイズ・更新時刻が同じ) の結果はキャッシュする。
+    """
+    stat = os.stat(fasta_file)
+    return _count_fasta_records(fasta_file, stat.st_size, stat.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=4096)
+def _count_fasta_records(fasta_file, size, mtime_ns):
+    count = 0
+    with open(fasta_file, "rb") as f:
+        for line in f:
+            if line.startswith(b">"):
+                count += 1
+    return count
+
+
+def read_query_order(fasta_file):
+    """
+    クエリID (ヘッダ行の最初の単語) から、そのレコードの入力順 (0 始まり) を引く辞書を作る。
+    同じIDが複数ある場合は最初の出現位置を使う。スループットの計測用に塩基数も数える。
+
+    Returns:
+        tuple[dict[bytes, int], int, int]: (ID -> 入力順 の辞書, レコード数, 塩基数)
+    """
+    query_order = {}
+    position = 0
+    bases = 0
+    with open(fasta_file, "rb") as f:
+        for line in f:
+            if line.startswith(b">"):
+                parts = line[1:].split(None, 1)
+                query_id = parts[0] if parts else b""
+                query_order.setdefault(query_id, position)
+                position += 1
+            else:
+                bases += len(line.strip())
+    return query_order, position, bases
+
+
+def read_query_ids(fasta_file):
+    """
+    レコード順のクエリID (ヘッダ行の最初の単語) を返す。
+    重複除去・まとめて実行した結果を元のIDに戻すのに使う。
+
+    Returns:
+        list[bytes]: レコード順のクエリID
+    """
+    query_ids = []
+    with open(fasta_file, "rb") as f:
+        for line in f:
+            if line.startswith(b">"):
+                parts = line[1:].split(None, 1)
+                query_ids.append(parts[0] if parts else b"")
+    return query_ids
+
+
+def split_fasta(fasta_file, output_dir, num_chunks, split_by="records"):
+    """
+    FASTAファイルをレコード境界で num_chunks 個のファイルに分割する。
+
+    Args:
+        fasta_file (str): 分割元のFASTAファイル
+        output_dir (str): 分割ファイルの出力先フォルダ
+        num_chunks (int): 分割数
+        split_by (str): "records" (レコード数で均等) または "bytes" (サイズで均等)
+
+    Returns:
+        list[str]: 元の順序どおりに並んだ分割ファイルのパス (空のチャンクは含まない)
+    """
+    if split_by not in ("records", "bytes"):
+        raise ValueError(f"不明な分割方法です: {split_by}")
+
+    num_chunks = max(1, num_chunks)
+    if split_by == "records":
+        total = count_fasta_records(fasta_file)
+        per_chunk = max(1, math.ceil(total / num_chunks))
+    else:
+        total = os.path.getsize(fasta_file)
+        per_chunk = max(1, math.ceil(total / num_chunks))
+
+    base_name = os.path.basename(fasta_file)
+    chunk_paths = []
+    out = None
+    filled = 0  # 現在のチャンクに書き込んだレコード数 (またはバイト数)
+    try:
+        for record in iter_fasta_records(fasta_file):
+            # 現在のチャンクが満杯なら次のチャンクへ (最後のチャンクは溢れても詰める)
+            if out is None or (filled >= per_chunk and len(chunk_paths) < num_chunks):
+                if out is not None:
+                    out.close()
+                chunk_path = os.path.join(
+                    output_dir, f"{base_name}.chunk{len(chunk_paths):04d}"
+                )
+                out = open(chunk_path, "wb")
+                chunk_paths.append(chunk_path)
+                filled = 0
+
+            out.writelines(record)
+            if split_by == "records":
+                filled += 1
+            else:
+                filled += sum(len(line) for line in record)
+    finally:
+        if out is not None:
+            out.close()
+
+    return chunk_paths
+
+
+def deduplicate_fasta(fasta_file, output_file):
+    """
+    同一配列のレコードを1つにまとめた FASTA を書き出す。
+
+    代表レコードは出現順に u0, u1, ... という ID に付け替えて書き出すので、
+    元の ID が重複していても BLAST 結果の qseqid から代表を一意に引ける。
+    配列は大文字・空白除去で正規化し、ハッシュ値だけを保持してメモリを抑える。
+
+    Args:
+        fasta_file (str): 元のFASTAファイル
+        output_file (str): 重複を除いたFASTAの出力先
+
+    Returns:
+        tuple[array.array, int]: (元のレコード順の代表番号の配列, 代表の数)
+    """
+    seen = {}  # 配列のハッシュ -> 代表番号
+    representatives = array.array("I")
+    with open(output_file, "wb") as out:
+        for record in iter_fasta_records(fasta_file):
+            header_index = next(
+                (i for i, line in enumerate(record) if line.startswith(b">")), None
+            )
+            if header_index is None:
+                continue  # ヘッダのない先頭のゴミ行
+            sequence = b"".join(
+                line.strip() for line in record[header_index + 1 :]
+            ).upper()
+            digest = hashlib.blake2b(sequence, digest_size=16).digest()
+
+            rep_index = seen.get(digest)
+            if rep_index is None:
+                rep_index = len(seen)
+                seen[digest] = rep_index
+                out.write(b">u%d\n" % rep_index)
+                out.writelines(record[header_index + 1 :])
+                if not record[-1].endswith(b"\n"):
+                    out.write(b"\n")
+            representatives.append(rep_index)
+
+    return representatives, len(seen)
+
+
+def pack_fasta(fasta_files, output_file):
+    """
+    複数のFASTAファイルを1つのクエリにまとめて書き出す。
+
+    各レコードの ID は p<ファイル番号>_<レコード番号> に付け替えるので、
+    BLAST 結果の qseqid から元のファイルを引ける (元の ID に依存しない)。
+
+    Args:
+        fasta_files (list[str]): まとめるFASTAファイル
+        output_file (str): まとめたFASTAの出力先
+
+    Returns:
+        list[int]: ファイルごとのレコード数
+    """
+    record_counts = []
+    with open(output_file, "wb") as out:
+        for file_index, fasta_file in enumerate(fasta_files):
+            count = 0
+            for record in iter_fasta_records(fasta_file):
+                header_index = next(
+                    (i for i, line in enumerate(record) if line.startswith(b">")), None
+                )
+                if header_index is None:
+                    continue  # ヘッダのない先頭のゴミ行
+                out.write(b">p%d_%d\n" % (file_index, count))
+                out.writelines(record[header_index + 1 :])
+                if not record[-1].endswith(b"\n"):
+                    out.write(b"\n")
+                count += 1
+            record_counts.append(count)
+    return record_counts
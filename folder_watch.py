@@ -0,0 +1,256 @@
+# folder_watch.py
+"""
+監視フォルダに置かれた新しい FASTA ファイルを見つけて、自動で解析キューに入れる。
+
+Linux では inotify (IN_CLOSE_WRITE / IN_MOVED_TO) で、書き込みを閉じたファイルや
+移動されてきたファイルをすぐに見つける。inotify はネットワーク共有への他のホストからの
+書き込みを通知しないので、どの環境でも poll_sec ごとにフォルダを走査し、
+大きさと更新時刻が stable_sec の間変わらなかったファイルを書き込み完了とみなす。
+
+processed フォルダに同じ名前があるファイル (解析済み) と、一度通知したファイルは
+(書き換えられない限り) 通知しない。キューに既にあるファイルは JobQueue.add が除く。
+"""
+import ctypes
+import ctypes.util
+import fnmatch
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+# 監視するファイル名のパターン (空白区切り)
+DEFAULT_PATTERNS = "*.fasta *.fa *.fna"
+
+# inotify の定数 (<sys/inotify.h>)
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_Q_OVERFLOW = 0x00004000
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def watch_settings_from_config(config):
+    """
+    [WATCH] 設定から監視フォルダと監視の設定を読む。
+
+    Returns:
+        dict | None: directories / patterns / stable_sec / poll_sec / auto_start
+        (無効、または監視フォルダがない場合は None)
+    """
+    if not config.getboolean("WATCH", "enabled", fallback=False):
+        return None
+    directories = [
+        directory.strip()
+        for directory in config.get("WATCH", "directories", fallback="").split(";")
+        if directory.strip()
+    ]
+    if not directories:
+        return None
+    return {
+        "directories": directories,
+        "patterns": config.get("WATCH", "patterns", fallback=DEFAULT_PATTERNS).split(),
+        "stable_sec": config.getfloat("WATCH", "stable_sec", fallback=5),
+        "poll_sec": config.getfloat("WATCH", "poll_sec", fallback=30),
+        "auto_start": config.getboolean("WATCH", "auto_start", fallback=True),
+    }
+
+
+class _Inotify:
+    """libc の inotify を ctypes で使う最小限のラッパー (使えない環境では OSError)"""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 に失敗しました")
+        self.directories = {}  # watch descriptor -> フォルダ
+
+    def add_watch(self, directory):
+        wd = self._libc.inotify_add_watch(
+            self.fd, os.fsencode(directory), _IN_CLOSE_WRITE | _IN_MOVED_TO
+        )
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch に失敗しました: {directory}")
+        self.directories[wd] = directory
+
+    def read_paths(self):
+        """
+        届いているイベントのファイルパスを返す。
+
+        Returns:
+            tuple[list[str], bool]: (パス, イベントが溢れて取りこぼした可能性があるか)
+        """
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return [], False
+        paths = []
+        overflow = False
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset : offset + name_len].rstrip(b"\0")
+            offset += name_len
+            if mask & _IN_Q_OVERFLOW:
+                overflow = True
+            elif wd in self.directories and name:
+                paths.append(os.path.join(self.directories[wd], os.fsdecode(name)))
+        return paths, overflow
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """
+    監視フォルダの新しい FASTA ファイルを、バックグラウンドスレッドで見つけて通知する。
+
+    on_files はこのスレッドから呼ばれるので、GUI ではメッセージキューに入れて
+    メインスレッドで処理すること。
+    """
+
+    def __init__(self, directories, on_files, patterns=None, stable_sec=5, poll_sec=30):
+        """
+        Args:
+            directories (list[str]): 監視するフォルダ
+            on_files (callable): 新しいファイルのパスのリストを受け取る関数
+            patterns (list[str]): 対象のファイル名のパターン (fnmatch)
+            stable_sec (float): 走査で見つけたファイルを完了とみなすまでの、変化のない時間 (秒)
+            poll_sec (float): フォルダを走査する間隔 (秒)
+        """
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.on_files = on_files
+        self.patterns = patterns or DEFAULT_PATTERNS.split()
+        self.stable_sec = stable_sec
+        self.poll_sec = max(0.1, poll_sec)
+        self._stop = threading.Event()
+        self._thread = None
+        self._inotify = None
+        # 書き込み中かもしれないファイル: パス -> ((大きさ, 更新時刻), 最初にその値を見た時刻)
+        self._candidates = {}
+        # 通知したファイル: パス -> (大きさ, 更新時刻)。書き換えられたら再び通知する
+        self._notified = {}
+
+    def start(self):
+        """監視を開始する (最初の走査で、既にあるファイルも対象になる)"""
+        if sys.platform.startswith("linux"):
+            try:
+                self._inotify = _Inotify()
+                for directory in self.directories:
+                    self._inotify.add_watch(directory)
+            except (OSError, AttributeError) as e:
+                print(f"inotify を使えないため、定期的な走査だけで監視します: {e}")
+                if self._inotify is not None:
+                    self._inotify.close()
+                self._inotify = None
+        self._thread = threading.Thread(target=self._run, name="folder-watch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """監視を止める (スレッドの終了を待つ)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        try:
+            next_scan = 0.0
+            while not self._stop.is_set():
+                now = time.monotonic()
+                if now >= next_scan:
+                    self._emit(self._scan())
+                    # 書き込み中のファイルがあれば、安定したかを早めに確かめる
+                    interval = self.poll_sec
+                    if self._candidates:
+                        interval = min(interval, max(0.1, self.stable_sec / 2))
+                    next_scan = now + interval
+                self._wait_events(min(1.0, max(0.0, next_scan - time.monotonic())))
+        finally:
+            if self._inotify is not None:
+                self._inotify.close()
+                self._inotify = None
+
+    def _wait_events(self, timeout):
+        """inotify のイベントを待つ (使えなければ timeout だけ待つ)"""
+        if self._inotify is None:
+            self._stop.wait(timeout)
+            return
+        readable, _, _ = select.select([self._inotify.fd], [], [], timeout)
+        if not readable:
+            return
+        paths, overflow = self._inotify.read_paths()
+        # 書き込みを閉じた / 移動されてきたファイルは、書き込み完了とみなしてすぐに通知する
+        self._emit([path for path in paths if self._wanted(path)])
+        if overflow:
+            self._emit(self._scan())
+
+    def _wanted(self, path):
+        """対象のパターンに合い、まだ解析していないファイルか"""
+        name = os.path.basename(path)
+        if not any(fnmatch.fnmatch(name, pattern) for pattern in self.patterns):
+            return False
+        processed = os.path.join(os.path.dirname(path), "processed", name)
+        return not os.path.exists(processed)
+
+    def _scan(self):
+        """
+        全ての監視フォルダを走査し、stable_sec の間変化のなかったファイルを返す。
+
+        Returns:
+            list[str]: 書き込みが完了したとみなしたファイル
+        """
+        now = time.monotonic()
+        ready = []
+        present = set()
+        for directory in self.directories:
+            try:
+                entries = list(os.scandir(directory))
+            except OSError as e:
+                print(f"監視フォルダを読めません: {directory} ({e})")
+                continue
+            for entry in entries:
+                path = entry.path
+                try:
+                    if not entry.is_file() or not self._wanted(path):
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue  # 走査中に移動・削除された
+                present.add(path)
+                signature = (stat.st_size, stat.st_mtime_ns)
+                if self._notified.get(path) == signature:
+                    continue
+                previous = self._candidates.get(path)
+                if previous is None or previous[0] != signature:
+                    self._candidates[path] = (signature, now)
+                elif now - previous[1] >= self.stable_sec:
+                    ready.append(path)
+        # 消えたファイル (processed への移動など) の記録は捨てる
+        for table in (self._candidates, self._notified):
+            for path in [path for path in table if path not in present]:
+                del table[path]
+        return ready
+
+    def _emit(self, paths):
+        """新しく見つけたファイルを記録して on_files に通知する"""
+        new_paths = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if self._notified.get(path) == signature:
+                continue
+            self._notified[path] = signature
+            self._candidates.pop(path, None)
+            new_paths.append(path)
+        if new_paths:
+            try:
+                self.on_files(sorted(new_paths))
+            except Exception as e:
+                print(f"監視フォルダのファイルの通知中にエラー: {e}")
@@ -1,7 +1,7 @@
 # gui_view.py
 import tkinter as tk
 from tkinter import ttk
-from draggable_listbox import DraggableListbox
+from virtual_listbox import VirtualListbox
 
 
 class MainView(tk.Frame):
@@ -13,13 +13,16 @@ class MainView(tk.Frame):
         super().__init__(master)
         self.master = master
         self.master.title("BLASTn 自動解析ツール v0.4.2")
-        self.master.geometry("600x450")
+        self.master.geometry("760x450")
 
         # --- メニューバーの作成 ---
         self.menu_bar = tk.Menu(self.master)
         self.master.config(menu=self.menu_bar)
         self.file_menu = tk.Menu(self.menu_bar, tearoff=0)
         self.menu_bar.add_cascade(label="ファイル", menu=self.file_menu)
+        # 選択したファイルの優先度レーン (リストの右クリックでも表示する)
+        self.priority_menu = tk.Menu(self.menu_bar, tearoff=0)
+        self.menu_bar.add_cascade(label="優先度", menu=self.priority_menu)
 
         # --- 1. 上部フレーム（ボタン配置用） ---
         top_frame = tk.Frame(self.master)
@@ -28,10 +31,15 @@ class MainView(tk.Frame):
         self.add_button = tk.Button(top_frame, text="ファイル追加")
         self.remove_button = tk.Button(top_frame, text="選択を削除")
         self.clear_button = tk.Button(top_frame, text="リストをクリア")
+        # 選択した実行中のファイルをすぐに中止 / 中止・エラーのファイルを解析待ちに戻す
+        self.cancel_button = tk.Button(top_frame, text="選択を中止")
+        self.requeue_button = tk.Button(top_frame, text="選択を再実行")
 
         self.add_button.pack(side=tk.LEFT, padx=2)
         self.remove_button.pack(side=tk.LEFT, padx=2)
         self.clear_button.pack(side=tk.LEFT, padx=2)
+        self.cancel_button.pack(side=tk.LEFT, padx=2)
+        self.requeue_button.pack(side=tk.LEFT, padx=2)
 
         # --- 解析実行/中止ボタンを右側に配置 ---
         self.stop_button = tk.Button(top_frame, text="解析中止", bg="pink")
@@ -44,12 +52,13 @@ class MainView(tk.Frame):
         middle_frame = tk.Frame(self.master)
         middle_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True, padx=5, pady=5)
 
-        self.listbox = DraggableListbox(middle_frame, selectmode=tk.EXTENDED)
+        # 見えている行だけを描画するので、数万件のファイルを並べても重くならない
+        self.listbox = VirtualListbox(middle_frame)
 
         scrollbar = tk.Scrollbar(
             middle_frame, orient=tk.VERTICAL, command=self.listbox.yview
         )
-        self.listbox.config(yscrollcommand=scrollbar.set)
+        self.listbox.yscrollcommand = scrollbar.set
 
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
@@ -58,13 +67,32 @@ class MainView(tk.Frame):
         bottom_frame = tk.Frame(self.master)
         bottom_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=5, pady=5)
 
-        self.status_label = tk.Label(bottom_frame, text="準備完了", anchor=tk.W)
+        status_frame = tk.Frame(bottom_frame)
+        status_frame.pack(fill=tk.X)
+
+        self.status_label = tk.Label(status_frame, text="準備完了", anchor=tk.W)
+        # 結果キャッシュのヒット/ミス件数 (キャッシュ有効時のみ表示)
+        self.cache_label = tk.Label(status_frame, text="", anchor=tk.E)
+        # ワーカーからのメッセージキューの深さと遅延
+        self.queue_label = tk.Label(status_frame, text="", anchor=tk.E, fg="gray")
         self.progressbar = ttk.Progressbar(
             bottom_frame, orient=tk.HORIZONTAL, mode="determinate"
         )
 
-        self.status_label.pack(fill=tk.X)
+        # バッチ全体の進捗 (完了ファイル数 + 実行中ファイルの進捗率)
+        batch_frame = tk.Frame(bottom_frame)
+        self.batch_label = tk.Label(batch_frame, text="全体:", anchor=tk.W)
+        self.batch_progressbar = ttk.Progressbar(
+            batch_frame, orient=tk.HORIZONTAL, mode="determinate"
+        )
+
+        self.queue_label.pack(side=tk.RIGHT)
+        self.cache_label.pack(side=tk.RIGHT)
+        self.status_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
         self.progressbar.pack(fill=tk.X)
+        batch_frame.pack(fill=tk.X, pady=(2, 0))
+        self.batch_label.pack(side=tk.LEFT)
+        self.batch_progressbar.pack(side=tk.LEFT, fill=tk.X, expand=True)
 
 
 class SettingsWindow(tk.Toplevel):
@@ -76,7 +104,7 @@ class SettingsWindow(tk.Toplevel):
     def __init__(self, master):
         super().__init__(master)
         self.title("設定")
-        self.geometry("500x180")  # DB名入力欄のため高さを調整
+        self.geometry("500x210")  # DB名・監視フォルダの入力欄のため高さを調整
 
         main_frame = tk.Frame(self)
         main_frame.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
@@ -105,6 +133,14 @@ class SettingsWindow(tk.Toplevel):
         self.db_name_entry.grid(row=2, column=1, sticky=tk.EW, pady=2)
         self.db_name_button.grid(row=2, column=2, padx=5, pady=2)
 
+        # Watch folders (";" 区切りで複数指定できる)
+        watch_label = tk.Label(main_frame, text="監視フォルダ:")
+        self.watch_entry = tk.Entry(main_frame, width=50)
+        self.watch_button = tk.Button(main_frame, text="追加...")
+        watch_label.grid(row=3, column=0, sticky=tk.W, pady=2)
+        self.watch_entry.grid(row=3, column=1, sticky=tk.EW, pady=2)
+        self.watch_button.grid(row=3, column=2, padx=5, pady=2)
+
         main_frame.grid_columnconfigure(1, weight=1)
 
         # Bottom buttons
@@ -116,3 +152,57 @@ class SettingsWindow(tk.Toplevel):
 
         self.save_button.pack(side=tk.RIGHT, padx=5)
         self.cancel_button.pack(side=tk.RIGHT)
+
+
+class SearchWindow(tk.Toplevel):
+    """結果の索引を検索する画面の見た目を定義するクラス"""
+
+    # 結果の表の列: (列名, 見出し, 幅)
+    COLUMNS = (
+        ("sample", "サンプル", 260),
+        ("hits", "ヒット数", 80),
+        ("max_pident", "最高 pident", 90),
+    )
+
+    def __init__(self, master):
+        super().__init__(master)
+        self.title("結果を検索")
+        self.geometry("520x400")
+
+        search_frame = tk.Frame(self)
+        search_frame.pack(padx=10, pady=(10, 5), fill=tk.X)
+
+        # taxid (数字)・アクセッション・学名のいずれか
+        term_label = tk.Label(search_frame, text="taxid / アクセッション / 学名:")
+        self.term_entry = tk.Entry(search_frame, width=30)
+        term_label.grid(row=0, column=0, sticky=tk.W, pady=2)
+        self.term_entry.grid(row=0, column=1, columnspan=2, sticky=tk.EW, pady=2)
+
+        pident_label = tk.Label(search_frame, text="pident ≥:")
+        self.pident_entry = tk.Entry(search_frame, width=8)
+        self.search_button = tk.Button(search_frame, text="検索")
+        pident_label.grid(row=1, column=0, sticky=tk.W, pady=2)
+        self.pident_entry.grid(row=1, column=1, sticky=tk.W, pady=2)
+        self.search_button.grid(row=1, column=2, sticky=tk.E, padx=5, pady=2)
+
+        search_frame.grid_columnconfigure(1, weight=1)
+
+        # 検索結果 (ダブルクリックで結果ファイルを開く)
+        tree_frame = tk.Frame(self)
+        tree_frame.pack(padx=10, pady=5, fill=tk.BOTH, expand=True)
+        self.result_tree = ttk.Treeview(
+            tree_frame, columns=[name for name, _, _ in self.COLUMNS], show="headings"
+        )
+        for name, heading, width in self.COLUMNS:
+            self.result_tree.heading(name, text=heading)
+            self.result_tree.column(
+                name, width=width, anchor=tk.W if name == "sample" else tk.E
+            )
+        scrollbar = tk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.result_tree.yview)
+        self.result_tree.config(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.result_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        # 件数と検索にかかった時間
+        self.status_label = tk.Label(self, text="", anchor=tk.W)
+        self.status_label.pack(padx=10, pady=(0, 10), fill=tk.X)
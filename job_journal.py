@@ -0,0 +1,283 @@
+# job_journal.py
+"""
+解析キューの永続ジャーナル (クラッシュ後の再開用)。
+
+キューの状態はメモリ上にしかないため、アプリやマシンが途中で落ちると、どのファイルが
+processed フォルダに移動済みで、どの _result.csv が書きかけなのかが分からなくなる。
+このモジュールは、追加・開始 (blastn の PID とコマンド)・完了・エラー・移動・並び替えを
+config.ini と同じフォルダの SQLite (WAL モード) に記録し、次回起動時に
+未完了のジョブだけをキューに戻す。
+
+記録はメモリ上に溜めて、書き込みスレッドが FLUSH_INTERVAL ごとに1トランザクションで
+まとめて書くので、ジョブごとの処理を待たせない。そのため、クラッシュ直前の
+FLUSH_INTERVAL 程度の記録は失われることがある (その場合は安全側に倒し、再実行する)。
+"""
+import contextlib
+import json
+import os
+import signal
+import sqlite3
+import sys
+import threading
+import time
+
+# 書き込みスレッドがまとめて書き込む間隔 (秒)
+FLUSH_INTERVAL = 0.5
+
+# ジャーナル上のジョブの状態 (pending / running / error / cancelled は JobState の値と同じ)
+STATE_PENDING = "pending"
+STATE_RUNNING = "running"
+STATE_ERROR = "error"
+STATE_CANCELLED = "cancelled"
+STATE_MOVED = "moved"  # processed フォルダへの移動まで済んだ
+STATE_DONE = "done"
+
+
+def journal_path_from_config(config, config_path):
+    """
+    [JOURNAL] 設定からジャーナルファイルのパスを返す (無効な場合は None)。
+    相対パスは config.ini のあるフォルダを基準にする。
+    """
+    if not config.getboolean("JOURNAL", "enabled", fallback=True):
+        return None
+    filename = config.get("JOURNAL", "filename", fallback="job_journal.sqlite3")
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), filename)
+
+
+def result_path_for(filepath):
+    """解析対象ファイルに対応する結果ファイルのパス"""
+    return f"{filepath}_result.csv"
+
+
+def processed_path_for(filepath):
+    """解析対象ファイルの移動先 (processed フォルダ) のパス"""
+    return os.path.join(os.path.dirname(filepath), "processed", os.path.basename(filepath))
+
+
+def _is_orphan_blastn(pid, filepath):
+    """
+    記録した PID が、まだ filepath を処理している blastn かを調べる。
+    PID の再利用で無関係のプロセスを止めないよう、コマンドラインを確認できる
+    Linux (/proc) でのみ True を返す。
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            args = f.read().split(b"\0")
+    except OSError:
+        return False
+    if not args or not os.path.basename(args[0]).startswith(b"blastn"):
+        return False
+    # チャンク分割 (<ファイル名>.chunkNNNN)・重複除去 (一時フォルダの unique.fasta) の
+    # 場合もあるので、ファイル名か一時フォルダ名で照合する
+    name = os.path.basename(filepath).encode("utf-8", errors="replace")
+    return any(name in arg or b"blastnav_" in arg for arg in args)
+
+
+class JobJournal:
+    """
+    ジョブの状態を SQLite に記録するジャーナル。
+
+    record_* は呼び出し元のスレッド (GUI・ワーカー) では記録をリストに追加するだけで、
+    書き込みは専用のスレッドがまとめて行う。
+    """
+
+    def __init__(self, path, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._pending = []  # 未書き込みの (SQL, パラメータ)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "path TEXT PRIMARY KEY, state TEXT NOT NULL, position REAL NOT NULL, "
+                "enqueued_at REAL, started_at REAL, finished_at REAL, "
+                "pids TEXT, command TEXT, error TEXT, processed_path TEXT)"
+            )
+
+        self._thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._thread.start()
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """トランザクションを確定してから接続を閉じるコンテキストマネージャ"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            # WAL では NORMAL でもクラッシュでDBが壊れることはない (直近の確定が失われるだけ)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # --- 書き込み ---
+    def _append(self, sql, params):
+        with self._lock:
+            if self._closed:
+                return
+            self._pending.append((sql, params))
+
+    def _writer_loop(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            closed = self._closed
+            self._flush()
+            if closed:
+                return
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        try:
+            with self._connect() as conn:
+                for sql, params in pending:
+                    conn.execute(sql, params)
+        except sqlite3.Error as e:
+            print(f"ジョブジャーナルへの書き込み中にエラー: {e}")
+
+    def close(self):
+        """未書き込みの記録を書き出して、書き込みスレッドを終了する"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+
+    # --- 記録 ---
+    def record_enqueued(self, jobs):
+        """
+        キューへの追加を記録する (同じパスの古い記録は置き換える)。
+
+        Args:
+            jobs (Iterable[job_queue.Job]): 追加したジョブ
+        """
+        now = time.time()
+        for job in jobs:
+            self._append(
+                "INSERT OR REPLACE INTO jobs (path, state, position, enqueued_at) "
+                "VALUES (?, ?, ?, ?)",
+                (job.filepath, STATE_PENDING, job.position, now),
+            )
+
+    def record_positions(self, jobs):
+        """並び替えなどで変わった表示順を記録する"""
+        for job in jobs:
+            self._append(
+                "UPDATE jobs SET position = ? WHERE path = ?", (job.position, job.filepath)
+            )
+
+    def record_removed(self, filepaths):
+        """キューから取り除いたファイルを記録する"""
+        for filepath in filepaths:
+            self._append("DELETE FROM jobs WHERE path = ?", (filepath,))
+
+    def record_start(self, filepath, pid, command):
+        """
+        blastn の起動を記録する (チャンク分割時はプロセスごとに呼ばれる)。
+        エージェントで実行する blastn は、このマシンのプロセスではないので pid は None。
+        """
+        pid = "" if pid is None else str(pid)
+        self._append(
+            "UPDATE jobs SET state = ?, "
+            "started_at = COALESCE(started_at, ?), "
+            "pids = CASE WHEN pids IS NULL THEN ? ELSE pids || ',' || ? END, "
+            "command = ? WHERE path = ?",
+            (STATE_RUNNING, time.time(), pid, pid, json.dumps(command), filepath),
+        )
+
+    def record_move(self, filepath, destination):
+        """processed フォルダへの移動を記録する"""
+        self._append(
+            "UPDATE jobs SET state = ?, processed_path = ? WHERE path = ?",
+            (STATE_MOVED, destination, filepath),
+        )
+
+    def record_done(self, filepath):
+        """正常完了を記録する"""
+        self._append(
+            "UPDATE jobs SET state = ?, finished_at = ? WHERE path = ?",
+            (STATE_DONE, time.time(), filepath),
+        )
+
+    def record_error(self, filepath, error_type):
+        """エラー終了を記録する"""
+        self._append(
+            "UPDATE jobs SET state = ?, finished_at = ?, error = ? WHERE path = ?",
+            (STATE_ERROR, time.time(), error_type, filepath),
+        )
+
+    def record_cancelled(self, filepath, reason):
+        """中止 (ユーザー操作・タイムアウト) を記録する"""
+        self._append(
+            "UPDATE jobs SET state = ?, finished_at = ?, error = ? WHERE path = ?",
+            (STATE_CANCELLED, time.time(), reason, filepath),
+        )
+
+    # --- 起動時の復元 ---
+    def recover(self):
+        """
+        前回のセッションで終わらなかったジョブを調べる。書き込みスレッドが
+        何も書いていない起動直後に呼ぶこと。
+
+        - 実行中だったジョブ: 書きかけの _result.csv を削除して解析待ちに戻す。
+          元のファイルが processed フォルダに移動済みなら完了扱いにする。
+          blastn が残っていれば (Linux のみ) 終了させる。
+        - 移動済み・完了のジョブ: ジャーナルから削除する。
+        - 元のファイルがなくなっているジョブ: ジャーナルから削除する。
+
+        Returns:
+            dict: jobs (表示順の [(パス, 状態)] 。状態は pending / error / cancelled),
+            partial_outputs (削除した書きかけの結果ファイル), completed (完了扱いにした数),
+            missing (ファイルがなく取り除いた数), killed (終了させた blastn の PID)
+        """
+        report = {"jobs": [], "partial_outputs": [], "completed": 0, "missing": 0, "killed": []}
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT path, state, pids FROM jobs ORDER BY position"
+            ).fetchall()
+            for filepath, state, pids in rows:
+                if state in (STATE_MOVED, STATE_DONE):
+                    conn.execute("DELETE FROM jobs WHERE path = ?", (filepath,))
+                    continue
+
+                if not os.path.exists(filepath):
+                    if state == STATE_RUNNING and os.path.exists(processed_path_for(filepath)):
+                        report["completed"] += 1  # 移動の記録前に落ちた
+                    else:
+                        report["missing"] += 1
+                    conn.execute("DELETE FROM jobs WHERE path = ?", (filepath,))
+                    continue
+
+                if state == STATE_RUNNING:
+                    for pid in (pids or "").split(","):
+                        if pid and _is_orphan_blastn(int(pid), filepath):
+                            try:
+                                # blastn は自分のプロセスグループで起動しているので、子孫ごと止める
+                                os.killpg(int(pid), signal.SIGTERM)
+                            except OSError:
+                                try:
+                                    os.kill(int(pid), signal.SIGTERM)
+                                except OSError:
+                                    continue
+                            report["killed"].append(int(pid))
+                    result_path = result_path_for(filepath)
+                    if os.path.exists(result_path):
+                        os.remove(result_path)
+                        report["partial_outputs"].append(result_path)
+                    state = STATE_PENDING
+                    conn.execute(
+                        "UPDATE jobs SET state = ?, started_at = NULL, pids = NULL "
+                        "WHERE path = ?",
+                        (state, filepath),
+                    )
+                report["jobs"].append((filepath, state))
+        return report
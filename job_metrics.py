@@ -0,0 +1,484 @@
+# job_metrics.py
+"""
+ジョブごとの計測 (タイムスタンプと blastn 子プロセスの資源使用量)。
+
+BlastWorker は終了コードしか記録していなかったため、バッチが遅いときに
+DBドライブの I/O 待ちなのか、CPU が足りないのか、メモリ不足なのかが分からなかった。
+このモジュールは blastn の起動・最初の出力・終了の時刻と、CPU時間 (user/sys)・
+ピークメモリ・読み書きバイト数を集め、file_done / error メッセージの "metrics" に添える。
+
+    Linux   : /proc/<pid>/stat・status (VmHWM)・io を SAMPLE_INTERVAL ごとに読み、
+              終了直後の回収前 (ゾンビ状態) にもう一度読んで最終値にする
+    Windows : 起動直後に開いたプロセスハンドルから、終了後に GetProcessTimes・
+              K32GetProcessMemoryInfo・GetProcessIoCounters で読む
+    その他  : タイムスタンプと経過時間のみ (資源使用量は None)
+
+MetricsLog はバッチ中の計測を JSON Lines または CSV に書き出し、
+ファイルあたりの時間の p50/p95 と、クエリ/秒・塩基/秒のスループットを集計する。
+"""
+import csv
+import ctypes
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+# Linux で /proc を読み直す間隔 (秒)。ピークメモリ以外は終了時に正確な値を読む
+SAMPLE_INTERVAL = 0.5
+
+# CSV で書き出す列 (JSON Lines では全ての項目を書き出す)
+CSV_FIELDS = (
+    "path",
+    "status",
+    "packed",
+    "cache_hit",
+    "run_id",
+    "queued_at",
+    "started_at",
+    "spawned_at",
+    "first_output_at",
+    "exited_at",
+    "finished_at",
+    "queue_wait_sec",
+    "wall_sec",
+    "blast_sec",
+    "cpu_user_sec",
+    "cpu_sys_sec",
+    "peak_rss_bytes",
+    "read_bytes",
+    "write_bytes",
+    "processes",
+    "queries",
+    "bases",
+)
+
+_run_ids = itertools.count(1)
+
+
+def next_run_id():
+    """ワーカー (1回の解析) ごとの通し番号。まとめて実行したファイルは同じ番号を持つ"""
+    return next(_run_ids)
+
+
+def percentile(values, fraction):
+    """values の fraction 分位点 (最近傍) を返す。空なら None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+# --- Linux: /proc から読む ---
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def _read_proc_times(pid):
+    """/proc/<pid>/stat から (user 秒, sys 秒) を読む"""
+    with open(f"/proc/{pid}/stat", "rb") as f:
+        data = f.read()
+    # 2番目の項目 (comm) は空白や括弧を含みうるので、最後の ')' より後ろを使う
+    fields = data[data.rindex(b")") + 2 :].split()
+    return int(fields[11]) / _CLOCK_TICKS, int(fields[12]) / _CLOCK_TICKS
+
+
+def _read_proc_io(pid):
+    """/proc/<pid>/io から (ストレージからの読み込みバイト数, 書き込みバイト数) を読む"""
+    values = {}
+    with open(f"/proc/{pid}/io", "rb") as f:
+        for line in f:
+            key, _, value = line.partition(b":")
+            values[key] = int(value)
+    return values.get(b"read_bytes"), values.get(b"write_bytes")
+
+
+def _read_proc_peak_rss(pid):
+    """/proc/<pid>/status の VmHWM (ピーク常駐メモリ) をバイトで返す。ゾンビなら None"""
+    with open(f"/proc/{pid}/status", "rb") as f:
+        for line in f:
+            if line.startswith(b"VmHWM:"):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+# --- Windows: プロセスハンドルから読む ---
+class _FILETIME(ctypes.Structure):
+    _fields_ = [("low", ctypes.c_uint32), ("high", ctypes.c_uint32)]
+
+    def seconds(self):
+        return ((self.high << 32) | self.low) / 1e7  # 100ns 単位
+
+
+class _PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+    _fields_ = [
+        ("cb", ctypes.c_uint32),
+        ("PageFaultCount", ctypes.c_uint32),
+        ("PeakWorkingSetSize", ctypes.c_size_t),
+        ("WorkingSetSize", ctypes.c_size_t),
+        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+        ("PagefileUsage", ctypes.c_size_t),
+        ("PeakPagefileUsage", ctypes.c_size_t),
+    ]
+
+
+class _IO_COUNTERS(ctypes.Structure):
+    _fields_ = [
+        ("ReadOperationCount", ctypes.c_uint64),
+        ("WriteOperationCount", ctypes.c_uint64),
+        ("OtherOperationCount", ctypes.c_uint64),
+        ("ReadTransferCount", ctypes.c_uint64),
+        ("WriteTransferCount", ctypes.c_uint64),
+        ("OtherTransferCount", ctypes.c_uint64),
+    ]
+
+
+# OpenProcess のアクセス権 (PROCESS_QUERY_LIMITED_INFORMATION | PROCESS_VM_READ)
+_WINDOWS_ACCESS = 0x1000 | 0x0010
+
+
+def _open_windows_process(pid):
+    """プロセスハンドルを開く (失敗したら None)。終了後もハンドルがあれば値を読める"""
+    try:
+        handle = ctypes.windll.kernel32.OpenProcess(_WINDOWS_ACCESS, False, pid)
+    except Exception:
+        return None
+    return handle or None
+
+
+def _read_windows_counters(handle):
+    """
+    プロセスハンドルから CPU時間・ピークワーキングセット・I/O バイト数を読む。
+
+    Returns:
+        dict: cpu_user_sec / cpu_sys_sec / peak_rss_bytes / read_bytes / write_bytes
+        (読めなかった項目は含まない)
+    """
+    kernel32 = ctypes.windll.kernel32
+    values = {}
+    creation, exit_time, kernel, user = (_FILETIME() for _ in range(4))
+    if kernel32.GetProcessTimes(
+        handle,
+        ctypes.byref(creation),
+        ctypes.byref(exit_time),
+        ctypes.byref(kernel),
+        ctypes.byref(user),
+    ):
+        values["cpu_user_sec"] = user.seconds()
+        values["cpu_sys_sec"] = kernel.seconds()
+    memory = _PROCESS_MEMORY_COUNTERS()
+    memory.cb = ctypes.sizeof(memory)
+    if kernel32.K32GetProcessMemoryInfo(handle, ctypes.byref(memory), memory.cb):
+        values["peak_rss_bytes"] = memory.PeakWorkingSetSize
+    io = _IO_COUNTERS()
+    if kernel32.GetProcessIoCounters(handle, ctypes.byref(io)):
+        values["read_bytes"] = io.ReadTransferCount
+        values["write_bytes"] = io.WriteTransferCount
+    return values
+
+
+class ProcessMonitor:
+    """
+    1つの blastn 子プロセスのタイムスタンプと資源使用量を計測する。
+
+    Popen の直後に作り、最初の出力で mark_output()、出力を読み切ったら
+    process.wait() の前に wait_exit()、回収後に stop() を呼ぶ。
+    """
+
+    def __init__(self, process):
+        """
+        Args:
+            process (subprocess.Popen): 計測する blastn のプロセス
+        """
+        self.pid = process.pid
+        self.spawned_at = time.time()
+        self.first_output_at = None
+        self.exited_at = None
+        self.cpu_user_sec = None
+        self.cpu_sys_sec = None
+        self.peak_rss_bytes = None
+        self.read_bytes = None
+        self.write_bytes = None
+
+        self._stopped = threading.Event()
+        self._windows_handle = None
+        if sys.platform.startswith("linux"):
+            self._sample_linux()
+            threading.Thread(target=self._sample_loop, daemon=True).start()
+        elif sys.platform == "win32":
+            self._windows_handle = _open_windows_process(self.pid)
+
+    def mark_output(self):
+        """最初の出力行を受け取った時刻を記録する"""
+        if self.first_output_at is None:
+            self.first_output_at = time.time()
+
+    def wait_exit(self):
+        """
+        プロセスの終了を回収せずに待ち、終了時点の値を読む (Linux)。
+        回収前のゾンビでも /proc/<pid>/stat と io は最終値を返す。
+        """
+        if not sys.platform.startswith("linux") or not hasattr(os, "waitid"):
+            return
+        try:
+            os.waitid(os.P_PID, self.pid, os.WEXITED | os.WNOWAIT)
+        except (ChildProcessError, OSError):
+            return  # 既に他のスレッドが回収した (途中の計測値を使う)
+        self.exited_at = time.time()
+        self._sample_linux()
+
+    def stop(self):
+        """計測を終える (終了時刻を記録し、サンプリングとハンドルを片付ける)"""
+        if self.exited_at is None:
+            self.exited_at = time.time()
+        self._stopped.set()
+        if self._windows_handle is not None:
+            try:
+                for key, value in _read_windows_counters(self._windows_handle).items():
+                    setattr(self, key, value)
+            except Exception as e:
+                print(f"プロセスの資源使用量の取得中にエラー: {e}")
+            finally:
+                ctypes.windll.kernel32.CloseHandle(self._windows_handle)
+                self._windows_handle = None
+
+    def _sample_loop(self):
+        while not self._stopped.wait(SAMPLE_INTERVAL):
+            if not self._sample_linux():
+                return
+
+    def _sample_linux(self):
+        """/proc から現在の値を読む。プロセスが回収済みなら False"""
+        try:
+            self.cpu_user_sec, self.cpu_sys_sec = _read_proc_times(self.pid)
+            peak = _read_proc_peak_rss(self.pid)
+            if peak is not None:
+                self.peak_rss_bytes = max(peak, self.peak_rss_bytes or 0)
+        except (OSError, ValueError, IndexError):
+            return False
+        try:
+            self.read_bytes, self.write_bytes = _read_proc_io(self.pid)
+        except (OSError, ValueError):
+            pass  # io は権限やカーネル設定で読めないことがある
+        return True
+
+
+def _sum_or_none(values):
+    values = [value for value in values if value is not None]
+    return sum(values) if values else None
+
+
+def summarize_job(run_id, started_at, monitors, queries=None, bases=None):
+    """
+    ジョブ (1つのワーカー) の計測値をまとめる。チャンク分割で blastn が複数ある場合、
+    CPU時間と I/O は合計、ピークメモリはプロセスごとの最大値にする。
+
+    Args:
+        run_id (int): next_run_id() で得た番号
+        started_at (float): ワーカーが処理を始めた時刻 (time.time())
+        monitors (list[ProcessMonitor]): このジョブで起動した blastn の計測
+        queries (int): blastn に渡したクエリ数 (BLAST していなければ None)
+        bases (int): blastn に渡した塩基数 (同上)
+
+    Returns:
+        dict: file_done / error メッセージの "metrics" に添える辞書
+    """
+    finished_at = time.time()
+    spawned = [m.spawned_at for m in monitors]
+    first_output = [m.first_output_at for m in monitors if m.first_output_at is not None]
+    exited = [m.exited_at for m in monitors if m.exited_at is not None]
+    peaks = [m.peak_rss_bytes for m in monitors if m.peak_rss_bytes is not None]
+    return {
+        "run_id": run_id,
+        "started_at": started_at,
+        "spawned_at": min(spawned) if spawned else None,
+        "first_output_at": min(first_output) if first_output else None,
+        "exited_at": max(exited) if exited else None,
+        "finished_at": finished_at,
+        "wall_sec": finished_at - started_at,
+        "blast_sec": max(exited) - min(spawned) if spawned and exited else None,
+        "cpu_user_sec": _sum_or_none(m.cpu_user_sec for m in monitors),
+        "cpu_sys_sec": _sum_or_none(m.cpu_sys_sec for m in monitors),
+        "peak_rss_bytes": max(peaks) if peaks else None,
+        "read_bytes": _sum_or_none(m.read_bytes for m in monitors),
+        "write_bytes": _sum_or_none(m.write_bytes for m in monitors),
+        "processes": len(monitors),
+        "queries": queries,
+        "bases": bases,
+    }
+
+
+def metrics_path_from_config(config):
+    """
+    [METRICS] 設定から、このバッチの計測ファイルのパスを返す (無効な場合は None)。
+    ファイル名にはバッチの開始時刻を入れる。
+    """
+    if not config.getboolean("METRICS", "enabled", fallback=False):
+        return None
+    directory = config.get("METRICS", "directory", fallback="metrics")
+    file_format = config.get("METRICS", "format", fallback="jsonl").lower()
+    if file_format not in ("jsonl", "csv"):
+        raise ValueError(f"不明な計測ファイルの形式です: {file_format}")
+    return os.path.join(directory, f"metrics_{time.strftime('%Y%m%d_%H%M%S')}.{file_format}")
+
+
+def open_metrics_log(config, path=None):
+    """
+    path (省略時は [METRICS] 設定) に書き出す MetricsLog を作る。
+    書き出し先を作れない場合も解析は止めず、集計だけ行う。
+    """
+    try:
+        return MetricsLog(path or metrics_path_from_config(config))
+    except (OSError, ValueError) as e:
+        print(f"計測ファイルを作成できないため、集計のみ行います: {e}")
+        return MetricsLog()
+
+
+class MetricsLog:
+    """
+    バッチ中の file_done / error / cancelled の計測値を集計し、ファイルに書き出す。
+
+    書き出し先の拡張子が .csv なら CSV (CSV_FIELDS の列)、それ以外は JSON Lines。
+    まとめて実行したファイルは1つの blastn を共有するので、ファイルあたりの時間は
+    ワーカーの経過時間をファイル数で割り、クエリ数・塩基数は run_id ごとに1回だけ数える。
+    """
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str): 計測ファイルの書き出し先 (None なら集計のみ)
+        """
+        self.path = path
+        self._file = None
+        self._csv_writer = None
+        self._file_secs = []
+        self._runs = {}  # run_id -> 計測値
+        self.files = 0
+        self.errors = 0
+        self.cancelled = 0
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(path, "w", encoding="utf-8", newline="")
+            if path.lower().endswith(".csv"):
+                self._csv_writer = csv.DictWriter(
+                    self._file, fieldnames=CSV_FIELDS, extrasaction="ignore"
+                )
+                self._csv_writer.writeheader()
+
+    def add(self, message, queued_at=None):
+        """
+        file_done / error / cancelled メッセージの計測値を記録する。キューに入った時刻が分かれば、
+        メッセージの "metrics" に queued_at と queue_wait_sec を書き足す。
+
+        Args:
+            message (dict): ワーカーからの file_done / error / cancelled メッセージ
+            queued_at (float): ファイルをキューに追加した時刻 (time.time())
+        """
+        metrics = message.get("metrics")
+        if metrics is None:
+            return
+        if queued_at is not None:
+            metrics["queued_at"] = queued_at
+            metrics["queue_wait_sec"] = max(0.0, metrics["started_at"] - queued_at)
+
+        packed = message.get("packed", 1)
+        is_error = message["type"] == "error" and message.get("error_type") != "MoveFileError"
+        is_cancelled = message["type"] == "cancelled"
+        self.files += 1
+        self.errors += is_error
+        self.cancelled += is_cancelled
+        if is_cancelled:
+            status = f"cancelled:{message.get('reason', 'user')}"
+        elif is_error:
+            status = message.get("error_type", "error")
+        else:
+            status = "done"
+            self._file_secs.append(metrics["wall_sec"] / packed)
+        # 中止したジョブは途中までしか処理していないので、スループットの集計には入れない
+        if not is_cancelled:
+            self._runs.setdefault(metrics["run_id"], metrics)
+
+        if self._file is not None:
+            record = {
+                "path": message["original_path"],
+                "status": status,
+                "packed": packed,
+                "cache_hit": message.get("cache_hit"),
+            }
+            record.update(metrics)
+            if self._csv_writer is not None:
+                self._csv_writer.writerow(record)
+            else:
+                self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def summary(self):
+        """
+        Returns:
+            dict: files / errors / cancelled / file_sec_p50 / file_sec_p95 / elapsed_sec /
+            queries_per_sec / bases_per_sec / cpu_sec / read_bytes / write_bytes /
+            peak_rss_bytes (計測できなかった項目は None)
+        """
+        runs = list(self._runs.values())
+        elapsed = None
+        if runs:
+            elapsed = max(m["finished_at"] for m in runs) - min(m["started_at"] for m in runs)
+        queries = _sum_or_none(m["queries"] for m in runs)
+        bases = _sum_or_none(m["bases"] for m in runs)
+        cpu_values = [
+            (m["cpu_user_sec"] or 0) + (m["cpu_sys_sec"] or 0)
+            for m in runs
+            if m["cpu_user_sec"] is not None or m["cpu_sys_sec"] is not None
+        ]
+        peaks = [m["peak_rss_bytes"] for m in runs if m["peak_rss_bytes"] is not None]
+        return {
+            "files": self.files,
+            "errors": self.errors,
+            "cancelled": self.cancelled,
+            "file_sec_p50": percentile(self._file_secs, 0.50),
+            "file_sec_p95": percentile(self._file_secs, 0.95),
+            "elapsed_sec": elapsed,
+            "queries_per_sec": queries / elapsed if queries is not None and elapsed else None,
+            "bases_per_sec": bases / elapsed if bases is not None and elapsed else None,
+            "cpu_sec": sum(cpu_values) if cpu_values else None,
+            "read_bytes": _sum_or_none(m["read_bytes"] for m in runs),
+            "write_bytes": _sum_or_none(m["write_bytes"] for m in runs),
+            "peak_rss_bytes": max(peaks) if peaks else None,
+        }
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def format_summary(summary):
+    """summary() の結果をステータスバー・コンソール用の1行の文字列にする"""
+    head = f"計測: {summary['files']}ファイル"
+    if summary["errors"]:
+        head += f" (エラー{summary['errors']}件)"
+    if summary["cancelled"]:
+        head += f" (中止{summary['cancelled']}件)"
+    if summary["file_sec_p50"] is None:
+        return head
+    parts = [
+        head,
+        f"1ファイル p50 {summary['file_sec_p50']:.1f}秒 / p95 {summary['file_sec_p95']:.1f}秒",
+    ]
+    if summary["queries_per_sec"] is not None:
+        parts.append(
+            f"{summary['queries_per_sec']:.1f} クエリ/秒, "
+            f"{summary['bases_per_sec']:,.0f} 塩基/秒"
+        )
+    if summary["cpu_sec"] is not None:
+        parts.append(f"CPU {summary['cpu_sec']:.1f}秒")
+    if summary["read_bytes"] is not None:
+        parts.append(f"読み込み {summary['read_bytes'] / 1024 ** 2:.1f} MB")
+    if summary["peak_rss_bytes"] is not None:
+        parts.append(f"最大メモリ {summary['peak_rss_bytes'] / 1024 ** 2:.0f} MB")
+    return ", ".join(parts)
@@ -0,0 +1,316 @@
+# job_queue.py
+"""
+解析待ち・実行中・エラーのファイルを管理するジョブキュー (Tkinter 非依存)。
+
+以前はリストボックスの表示文字列 ("(実行中...)" などの接頭辞) が唯一の状態で、
+状態が変わるたびにリスト全体を走査していた。このモジュールでは状態をメモリ上で
+管理し、パス・状態ごとの索引と、表示順に並んだ解析待ちのヒープを持つことで、
+次に実行するファイルを O(1) (償却) で取り出せるようにする。
+リストボックスはこのモデルを描画するだけにする。
+"""
+import collections
+import enum
+import heapq
+import itertools
+import time
+
+
+class JobState(enum.Enum):
+    PENDING = "pending"  # 解析待ち
+    RUNNING = "running"  # 実行中
+    ERROR = "error"  # エラー
+    CANCELLED = "cancelled"  # 中止・タイムアウト (再実行できる)
+
+
+# 表示用の接頭辞 (以前のリストボックス表示と同じ)
+STATE_PREFIXES = {
+    JobState.PENDING: "",
+    JobState.RUNNING: "(実行中...) ",
+    JobState.ERROR: "(エラー) ",
+    JobState.CANCELLED: "(中止) ",
+}
+
+# 優先度レーン (小さいほど先に実行する)
+LANE_HIGH = 0
+LANE_NORMAL = 1
+LANE_LOW = 2
+LANE_PREFIXES = {LANE_HIGH: "[優先] ", LANE_NORMAL: "", LANE_LOW: "[後回し] "}
+
+
+class Job:
+    """キュー内の1ファイル分のジョブ"""
+
+    __slots__ = (
+        "job_id",
+        "filepath",
+        "state",
+        "position",
+        "queued_at",
+        "lane",
+        "pinned",
+        "size",
+    )
+
+    def __init__(self, job_id, filepath, position):
+        self.job_id = job_id
+        self.filepath = filepath
+        self.state = JobState.PENDING
+        self.position = position  # 表示順の並び替えキー (小さいほど上)
+        self.queued_at = time.time()  # キューに追加した時刻 (待ち時間の計測用)
+        self.lane = LANE_NORMAL  # 優先度レーン
+        self.pinned = False  # ドラッグで位置を決めた (並び替えの方針で動かさない)
+        self.size = None  # 短いジョブ優先で使う大きさ (scheduler が初回に調べる)
+
+    @property
+    def display_text(self):
+        return f"{STATE_PREFIXES[self.state]}{LANE_PREFIXES[self.lane]}{self.filepath}"
+
+
+class JobQueue:
+    """
+    ジョブの表示順と状態を管理するモデル。
+
+    - jobs: ジョブID -> Job
+    - by_path: ファイルパス -> Job
+    - by_state: 状態 -> {ジョブID: Job}
+    - _pending_heap: (position, ジョブID) のヒープ。並び替えや状態変更で古くなった
+      要素は取り出すときに読み捨てる (遅延削除)。
+    - _arrivals: 解析待ちになった順の (ジョブID, queued_at) の両端キュー (待ち時間の長い
+      ジョブを O(1) (償却) で見つけるため)。解析待ちでなくなったジョブや、解析待ちに
+      戻して queued_at が変わったジョブの古い要素は、同じく読み捨てる。
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self.by_path = {}
+        self.by_state = {state: {} for state in JobState}
+        self._order = []  # 表示順のジョブIDのリスト
+        self._pending_heap = []
+        self._arrivals = collections.deque()
+        self._ids = itertools.count(1)
+
+    # --- 参照 ---
+    def __len__(self):
+        return len(self._order)
+
+    def __iter__(self):
+        """表示順にジョブを返す"""
+        return (self.jobs[job_id] for job_id in self._order)
+
+    def job_at(self, index):
+        """表示上の index 番目のジョブを返す"""
+        return self.jobs[self._order[index]]
+
+    def index_of(self, job):
+        """ジョブの表示上の位置を返す"""
+        return self._order.index(job.job_id)
+
+    def count(self, state):
+        return len(self.by_state[state])
+
+    def running_jobs(self):
+        return list(self.by_state[JobState.RUNNING].values())
+
+    def next_pending(self):
+        """表示順で最初の解析待ちジョブを返す (なければ None)"""
+        heap = self._pending_heap
+        while heap:
+            position, job_id = heap[0]
+            job = self.jobs.get(job_id)
+            if job is not None and job.state is JobState.PENDING and job.position == position:
+                return job
+            heapq.heappop(heap)  # 削除・状態変更・並び替え済みの古い要素
+        return None
+
+    # --- 追加・削除 ---
+    def add(self, filepaths):
+        """
+        ファイルをまとめて末尾に追加する。既にキューにあるパスは追加しない。
+
+        Returns:
+            list[Job]: 追加したジョブ
+        """
+        added = []
+        next_position = self.jobs[self._order[-1]].position + 1 if self._order else 0
+        for filepath in filepaths:
+            if filepath in self.by_path:
+                continue
+            job = Job(next(self._ids), filepath, next_position)
+            next_position += 1
+            self.jobs[job.job_id] = job
+            self.by_path[filepath] = job
+            self.by_state[JobState.PENDING][job.job_id] = job
+            self._order.append(job.job_id)
+            heapq.heappush(self._pending_heap, (job.position, job.job_id))
+            self._arrivals.append((job.job_id, job.queued_at))
+            added.append(job)
+        return added
+
+    def remove(self, jobs):
+        """
+        ジョブをキューから取り除く。実行中のジョブは取り除かない。
+
+        Returns:
+            int: 取り除いたジョブの数
+        """
+        removed_ids = set()
+        for job in jobs:
+            if job.state is JobState.RUNNING or job.job_id not in self.jobs:
+                continue
+            self._forget(job)
+            removed_ids.add(job.job_id)
+        if removed_ids:
+            self._order = [job_id for job_id in self._order if job_id not in removed_ids]
+        return len(removed_ids)
+
+    def clear(self):
+        """実行中以外の全てのジョブを取り除く"""
+        return self.remove([job for job in self if job.state is not JobState.RUNNING])
+
+    def _forget(self, job):
+        del self.jobs[job.job_id]
+        del self.by_path[job.filepath]
+        del self.by_state[job.state][job.job_id]
+
+    # --- 状態遷移 ---
+    def _set_state(self, job, state):
+        del self.by_state[job.state][job.job_id]
+        job.state = state
+        self.by_state[state][job.job_id] = job
+
+    def mark_running(self, job):
+        self._set_state(job, JobState.RUNNING)
+
+    def mark_error(self, job):
+        """エラーにして、以前のリスト表示と同じくリストの末尾へ移動する"""
+        self._set_state(job, JobState.ERROR)
+        self._order.remove(job.job_id)
+        self._order.append(job.job_id)
+        job.position = self.jobs[self._order[-2]].position + 1 if len(self._order) > 1 else 0
+
+    def mark_cancelled(self, job):
+        """中止した (再実行できる) 状態にする。表示上の位置は変えない"""
+        self._set_state(job, JobState.CANCELLED)
+
+    def mark_pending(self, job):
+        """解析待ちに戻す (再実行用)。待ち時間は戻した時点から数える"""
+        self._set_state(job, JobState.PENDING)
+        # 時計の分解能が粗い (Windows) と同じ時刻になりうるので、必ず前の queued_at より進める
+        job.queued_at = max(time.time(), job.queued_at + 1e-6)
+        heapq.heappush(self._pending_heap, (job.position, job.job_id))
+        # 戻す前の要素は queued_at が一致しなくなるので、oldest_waiting で読み捨てる
+        self._arrivals.append((job.job_id, job.queued_at))
+
+    def finish(self, job):
+        """正常に完了したジョブをキューから取り除く"""
+        self._forget(job)
+        self._order.remove(job.job_id)
+
+    # --- 並び替え ---
+    def move(self, from_index, to_index):
+        """
+        表示上の from_index 番目のジョブを to_index 番目に移動する (ドラッグ並び替え)。
+
+        Returns:
+            bool: 全ジョブの position を振り直した場合は True
+            (False なら position が変わったのは移動したジョブだけ)
+        """
+        if from_index == to_index:
+            return False
+        job_id = self._order.pop(from_index)
+        self._order.insert(to_index, job_id)
+        job = self.jobs[job_id]
+        job.pinned = True  # 手で決めた位置は並び替えの方針より優先する
+
+        # 前後のジョブの中間の位置を割り当てる (他のジョブの position は変えない)
+        before = self.jobs[self._order[to_index - 1]].position if to_index > 0 else None
+        after = (
+            self.jobs[self._order[to_index + 1]].position
+            if to_index + 1 < len(self._order)
+            else None
+        )
+        if before is None:
+            position = after - 1
+        elif after is None:
+            position = before + 1
+        else:
+            position = (before + after) / 2
+        if position == before or position == after:
+            # 浮動小数点の精度が尽きたら、全体の position を振り直す
+            self._renumber()
+            return True
+
+        job.position = position
+        if job.state is JobState.PENDING:
+            heapq.heappush(self._pending_heap, (job.position, job.job_id))
+        return False
+
+    def _renumber(self):
+        """表示順に position を振り直し、解析待ちのヒープを作り直す"""
+        for position, job_id in enumerate(self._order):
+            self.jobs[job_id].position = position
+        self._pending_heap = [
+            (job.position, job.job_id) for job in self.by_state[JobState.PENDING].values()
+        ]
+        heapq.heapify(self._pending_heap)
+
+    def reorder(self, key):
+        """
+        ドラッグで位置を決めていない解析待ちのジョブを key 順に並べ替える。
+        実行中・エラー・位置を固定したジョブは今の位置から動かさず、
+        並べ替えるジョブは、それらが占めていた位置に順に入れ直す (安定ソート)。
+
+        Args:
+            key (callable): Job を受け取り、並び順の値を返す関数
+
+        Returns:
+            bool: 表示順が変わった場合は True
+        """
+        slots = [
+            index
+            for index, job_id in enumerate(self._order)
+            if self.jobs[job_id].state is JobState.PENDING and not self.jobs[job_id].pinned
+        ]
+        current = [self._order[index] for index in slots]
+        ordered = sorted(current, key=lambda job_id: key(self.jobs[job_id]))
+        if ordered == current:
+            return False
+        for index, job_id in zip(slots, ordered):
+            self._order[index] = job_id
+        self._renumber()
+        return True
+
+    def set_lane(self, jobs, lane):
+        """ジョブの優先度レーンを変える (並び順への反映は reorder で行う)"""
+        for job in jobs:
+            job.lane = lane
+
+    def oldest_waiting(self):
+        """
+        位置を固定していない解析待ちのジョブのうち、最も長く待っているものを返す (なければ None)。
+        """
+        arrivals = self._arrivals
+        while arrivals:
+            if self._arrival_job(*arrivals[0]) is not None:
+                break
+            arrivals.popleft()  # 完了・削除・実行中になった・解析待ちに戻し直した古い要素
+        for job_id, queued_at in arrivals:
+            job = self._arrival_job(job_id, queued_at)
+            if job is not None and not job.pinned:
+                return job
+        return None
+
+    def _arrival_job(self, job_id, queued_at):
+        """_arrivals の要素が今も有効なら (解析待ちで、その時刻から待っている) ジョブを返す"""
+        job = self.jobs.get(job_id)
+        if job is None or job.state is not JobState.PENDING or job.queued_at != queued_at:
+            return None
+        return job
+
+    def promote(self, job):
+        """解析待ちのジョブを先頭に移し、次に実行されるようにする (待ちすぎの救済用)"""
+        self._order.remove(job.job_id)
+        self._order.insert(0, job.job_id)
+        first = self.jobs[self._order[1]].position if len(self._order) > 1 else 0
+        job.position = first - 1
+        heapq.heappush(self._pending_heap, (job.position, job.job_id))
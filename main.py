@@ -2,11 +2,33 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 import subprocess
 import os
-import queue
-
-from gui_view import MainView, SettingsWindow
-from config_manager import load_config, save_config
-from blast_worker import BlastWorker
+import time
+
+from gui_view import MainView, SearchWindow, SettingsWindow
+from agent_pool import AgentPool
+from async_engine import start_job
+from config_manager import CONFIG_PATH, load_config, save_config, validate_settings
+from job_queue import LANE_HIGH, LANE_LOW, LANE_NORMAL, JobQueue, JobState
+from scheduler import apply_policy, take_next_launch, take_next_remote_launch
+from message_pump import MessagePump, WorkerMessageQueue
+from job_journal import JobJournal, journal_path_from_config
+from job_metrics import format_summary, open_metrics_log
+from autotune import ThreadTuner
+from result_cache import open_result_cache
+from folder_watch import FolderWatcher, watch_settings_from_config
+from result_index import (
+    ResultIndex,
+    index_path_from_config,
+    open_index_writer,
+    result_path_for,
+)
+
+# リストボックスでの状態ごとの文字色
+STATE_COLORS = {
+    JobState.RUNNING: "blue",
+    JobState.ERROR: "red",
+    JobState.CANCELLED: "gray",
+}
 
 
 class Application:
@@ -14,36 +36,130 @@ class Application:
         self.master = master
         self.config = load_config()
         self.view = MainView(master)
-        self.queue = queue.Queue()
+        self.queue = WorkerMessageQueue()
+        # ワーカーからの通知で起こされ、溜まったメッセージをまとめて処理する
+        self.message_pump = MessagePump(master, self.queue, self._dispatch_message)
 
         # --- 状態管理フラグ ---
         self.is_running = False  # 解析実行中か
         self.stop_requested = False  # 停止が要求されたか
-        self.running_filepath = None  # 現在実行中のファイルパス
 
-        self.current_worker = None  # 現在実行中のワーカースレッドへの参照
+        # 解析キューの状態 (リストボックスはこのモデルを描画するだけ)
+        self.jobs = JobQueue()
+
+        # 実行中のワーカースレッドへの参照 (ファイルパス -> BlastWorker)
+        # 複数のファイルを同時に解析するため、実行中エントリを辞書で管理する
+        # (まとめて実行するファイルは同じワーカーを指す)
+        self.running_workers = {}
+
+        # バッチ全体の進捗用 (実行中ファイルの進捗率と、今回の実行で終わったファイル数)
+        self.job_progress = {}
+        self.batch_finished = 0
+
+        # 過去のジョブの実測値からスレッド数と同時実行数を決める ([AUTOTUNE] が無効なら None)
+        self.tuner = ThreadTuner.from_config(self.config, CONFIG_PATH)
+
+        # バッチ全体の制限時間のタイマー ([TIMEOUTS] の batch_timeout_min)
+        self._batch_timer = None
+
+        # 今回の実行の計測 (ジョブごとの時間・資源使用量。[METRICS] でファイルにも書き出す)
+        self.metrics_log = None
+
+        # 監視フォルダの新しいファイルを自動で追加する ([WATCH] が無効なら None)
+        self.watcher = None
+        self.watch_var = tk.BooleanVar(value=False)
+
+        # 他のノードのエージェント ([AGENTS] が無効なら None)。空きができたらキューで知らせてもらう
+        self.agents = AgentPool.from_config(
+            self.config, on_available=lambda: self.queue.put({"type": "agents_available"})
+        )
+        if self.agents is not None:
+            self.agents.start(wait=False)
+        self.waiting_for_agents = False  # 解析待ちがあるのに実行できるノードがない
+
+        # 完了した結果を取り込む索引 ([RESULT_INDEX] が無効なら None)
+        self.index_writer = open_index_writer(self.config, CONFIG_PATH)
+        # 結果キャッシュ ([CACHE] が無効なら None。全てのジョブで共有する)
+        self.result_cache = open_result_cache(self.config, CONFIG_PATH)
+        self.search_window = None
+        self.search_index = None
+
+        # 結果キャッシュのヒット/ミス件数 (このセッション中の累計)
+        self.cache_hits = 0
+        self.cache_misses = 0
 
         # --- ボタンとイベントに関数を紐づける ---
         self.view.add_button.config(command=self.add_files)
         self.view.remove_button.config(command=self.remove_selected)
         self.view.clear_button.config(command=self.clear_list)
+        self.view.cancel_button.config(command=self.cancel_selected)
+        self.view.requeue_button.config(command=self.requeue_selected)
         self.view.run_button.config(command=self.start_analysis_confirm)
         self.view.stop_button.config(command=self.stop_analysis_confirm)
         self.view.listbox.bind("<Double-Button-1>", self.open_in_notepad)
+        # ドラッグでの並び替えをモデルの順序に反映する
+        self.view.listbox.move_callback = self._move_job
+        # リストボックスはジョブキューから見えている行だけを取り出して描画する
+        self.view.listbox.set_source(
+            lambda: len(self.jobs),
+            self._row_data,
+            lambda index: self.jobs.job_at(index).job_id,
+        )
 
         # --- メニューを設定 ---
         self.view.file_menu.add_command(
             label="設定...", command=self.open_settings_window
         )
+        self.view.file_menu.add_checkbutton(
+            label="フォルダを監視", variable=self.watch_var, command=self.toggle_watch
+        )
+        self.view.file_menu.add_command(
+            label="結果を検索...", command=self.open_search_window
+        )
         self.view.file_menu.add_separator()
         self.view.file_menu.add_command(
             label="終了", command=self.on_closing
         )  # ウィンドウを閉じる動作をフック
+        for label, lane in (
+            ("優先して実行", LANE_HIGH),
+            ("通常に戻す", LANE_NORMAL),
+            ("後回しにする", LANE_LOW),
+        ):
+            self.view.priority_menu.add_command(
+                label=label, command=lambda lane=lane: self.set_selected_lane(lane)
+            )
+        self.view.listbox.bind("<Button-3>", self._show_priority_menu)
         self.toggle_buttons_on_run_state(False)  # 初期状態をセット
 
         # ウィンドウの「×」ボタンが押されたときの動作を定義
         self.master.protocol("WM_DELETE_WINDOW", self.on_closing)
 
+        # キューの状態を記録するジャーナル (前回の未完了ジョブがあれば復元する)
+        self.journal = None
+        journal_path = journal_path_from_config(self.config, CONFIG_PATH)
+        if journal_path is not None:
+            self.journal = JobJournal(journal_path)
+            self._restore_jobs()
+
+        self.message_pump.start()
+        self._show_queue_metrics()
+        self._restart_watch()
+
+    # --- リスト表示 (ジョブキューの描画) ---
+    def _row_data(self, index):
+        """リストボックスの index 行目に表示する (文字列, 文字色) を返す"""
+        job = self.jobs.job_at(index)
+        return job.display_text, STATE_COLORS.get(job.state)
+
+    def _render_list(self):
+        """リストボックスの見えている行を描画し直す"""
+        self.view.listbox.refresh()
+
+    def _selected_jobs(self):
+        """リストボックスで選択されているジョブを表示順に返す"""
+        jobs = (self.jobs.jobs.get(job_id) for job_id in self.view.listbox.selected_keys())
+        return sorted((job for job in jobs if job is not None), key=lambda job: job.position)
+
     # --- ファイル管理メソッド ---
     def add_files(self):
         """「ファイル追加」ボタンが押されたときの処理"""
@@ -53,46 +169,103 @@ class Application:
             filetypes=[("FASTA files", "*.fasta *.fa *.fna"), ("All files", "*.*")],
         )
         if filepaths:
-            for path in filepaths:
-                self.view.listbox.insert(tk.END, path)
-            self.update_status(f"{len(filepaths)}個のファイルを追加しました。")
+            added = self.jobs.add(filepaths)
+            if added:
+                if self.journal is not None:
+                    self.journal.record_enqueued(added)
+                self._apply_policy()
+                self._render_list()
+            self.update_status(f"{len(added)}個のファイルを追加しました。")
 
     def remove_selected(self):
         """【改修】実行中のファイルは削除しないようにする"""
-        selected_indices = self.view.listbox.curselection()
-        if not selected_indices:
+        selected_jobs = self._selected_jobs()
+        if not selected_jobs:
             return
 
-        files_deleted = 0
-        running_file_selected = False
-        for i in reversed(selected_indices):
-            # 実行中のアイテム "(実行中...) ..." かどうかをチェック
-            item_text = self.view.listbox.get(i)
-            is_currently_running_item = item_text.startswith("(実行中...)")
-
-            if is_currently_running_item:
-                running_file_selected = True
-                continue  # 実行中のファイルはスキップ
-
-            self.view.listbox.delete(i)
-            files_deleted += 1
+        running_file_selected = any(
+            job.state is JobState.RUNNING for job in selected_jobs
+        )
+        files_deleted = self.jobs.remove(selected_jobs)  # 実行中のファイルはスキップ
+        if files_deleted > 0:
+            self._record_removed(selected_jobs)
+            self.view.listbox.selection_clear()
 
         if running_file_selected:
             self.update_status("エラー: 実行中のファイルは削除できません。")
         elif files_deleted > 0:
             self.update_status(f"{files_deleted}個のファイルを選択から削除しました。")
 
+    def cancel_selected(self):
+        """選択した実行中のファイルの blastn を、完了を待たずにすぐ中止する"""
+        selected_jobs = [job for job in self._selected_jobs() if job.state is JobState.RUNNING]
+        workers = {self.running_workers[job.filepath] for job in selected_jobs}
+        if not workers:
+            self.update_status("実行中のファイルを選択してください。")
+            return
+        if not messagebox.askyesno(
+            "確認",
+            f"実行中の{len(selected_jobs)}個のファイルを中止しますか？\n"
+            "(まとめて実行しているファイルは、同じ blastn の他のファイルも中止されます)",
+        ):
+            return
+        for worker in workers:
+            worker.cancel("user")
+        self.update_status("中止を要求しました。blastn の終了を待っています...")
+
+    def requeue_selected(self):
+        """選択した中止・エラーのファイルを解析待ちに戻す (解析中なら空きがあればすぐ開始)"""
+        selected_jobs = [
+            job
+            for job in self._selected_jobs()
+            if job.state in (JobState.CANCELLED, JobState.ERROR)
+        ]
+        if not selected_jobs:
+            self.update_status("中止またはエラーのファイルを選択してください。")
+            return
+        for job in selected_jobs:
+            self.jobs.mark_pending(job)
+        if self.journal is not None:
+            self.journal.record_enqueued(selected_jobs)
+        self._apply_policy()
+        self._render_list()
+        self.update_status(f"{len(selected_jobs)}個のファイルを解析待ちに戻しました。")
+        if self.is_running and not self.stop_requested:
+            self.start_analysis_task()
+
+    def set_selected_lane(self, lane):
+        """選択したファイルの優先度レーンを変え、[SCHEDULING] の方針で並べ直す"""
+        selected_jobs = [job for job in self._selected_jobs() if job.state is JobState.PENDING]
+        if not selected_jobs:
+            self.update_status("解析待ちのファイルを選択してください。")
+            return
+        self.jobs.set_lane(selected_jobs, lane)
+        for job in selected_jobs:
+            job.pinned = False  # レーンを指定したら、ドラッグで決めた位置より優先する
+        self._apply_policy()
+        self._render_list()
+        self.update_status(f"{len(selected_jobs)}個のファイルの優先度を変更しました。")
+
+    def _show_priority_menu(self, event):
+        self.view.priority_menu.tk_popup(event.x_root, event.y_root)
+
+    def _apply_policy(self):
+        """解析待ちのファイルを [SCHEDULING] の方針で並べ替える (表示順 = 実行順)"""
+        try:
+            changed = apply_policy(self.jobs, self.config)
+        except ValueError as e:
+            self.update_status(f"並べ替えできません: {e}")
+            return
+        if changed and self.journal is not None:
+            self.journal.record_positions(self.jobs)
+
     def clear_list(self):
         """【改修】確認ダイアログと、実行中のチェックを追加"""
-        if not self.view.listbox.size() > 0:
+        if not len(self.jobs) > 0:
             return
 
-        # 実行中のファイルを除いたリストを作成して確認
-        items_to_clear = []
-        for i in range(self.view.listbox.size()):
-            item_text = self.view.listbox.get(i)
-            if not item_text.startswith("(実行中...)"):
-                items_to_clear.append(item_text)
+        # 実行中のファイルを除いた件数を確認
+        items_to_clear = len(self.jobs) - self.jobs.count(JobState.RUNNING)
 
         if not items_to_clear:
             if self.is_running:
@@ -103,35 +276,23 @@ class Application:
 
         if messagebox.askyesno(
             "確認",
-            f"{len(items_to_clear)}個のファイルをリストからクリアしますか？\n(実行中のファイルがある場合、それは残ります)",
+            f"{items_to_clear}個のファイルをリストからクリアしますか？\n(実行中のファイルがある場合、それは残ります)",
         ):
             # 実行中のファイル以外の全てを削除
-            non_running_indices = []
-            for i in range(self.view.listbox.size()):
-                if not self.view.listbox.get(i).startswith("(実行中...)"):
-                    non_running_indices.append(i)
-
-            for i in reversed(non_running_indices):
-                self.view.listbox.delete(i)
-
+            cleared_jobs = [job for job in self.jobs if job.state is not JobState.RUNNING]
+            self.jobs.clear()
+            self._record_removed(cleared_jobs)
+            self.view.listbox.selection_clear()
             self.update_status("リストをクリアしました。")
 
     def open_in_notepad(self, event):
         """リストボックスの項目がダブルクリックされたときの処理"""
-        selected_indices = self.view.listbox.curselection()
-        if not selected_indices:
+        selected_jobs = self._selected_jobs()
+        if not selected_jobs:
             return
 
-        filepath_display = self.view.listbox.get(selected_indices[0])
-        # 表示されているテキストを取得
-        filepath_actual = filepath_display
-        # デフォルトは表示通り
-
-        # 実行中の場合、ファイルパスから "(実行中...)" のプレフィックスを取り除く
-        if filepath_display.startswith("(実行中...)"):
-            filepath_actual = filepath_display.replace("(実行中...) ", "")
-        elif filepath_display.startswith("(エラー)"):
-            filepath_actual = filepath_display.replace("(エラー) ", "")
+        # 表示文字列ではなく、モデルから実際のファイルパスを取得
+        filepath_actual = selected_jobs[0].filepath
 
         try:
             # 実際のファイルパスで開く
@@ -156,35 +317,9 @@ class Application:
     def _validate_settings(self):
         """設定ファイルの内容が実在するかを検証する"""
         try:
-            blast_path = self.config.get("PATHS", "blast_path")
-            db_path = self.config.get("PATHS", "database_path")
-            db_name = self.config.get("BLAST_SETTINGS", "database_name")
-
-            # 1. blastn.exe の存在確認
-            blastn_exe_path = os.path.join(blast_path, "blastn.exe")
-            if not os.path.exists(blastn_exe_path):
-                messagebox.showerror(
-                    "設定エラー",
-                    f"blastn.exe が見つかりません。\n"
-                    f"パス: {blastn_exe_path}\n"
-                    "設定画面で [BLAST+ binフォルダ] を確認してください。",
-                )
-                return False
-
-            # 2. データベースファイル (.nal または .pal) の存在確認
-            # .nal (nucleotide) または .pal (protein) がDBの代表ファイル
-            db_file_path_nal = os.path.join(db_path, f"{db_name}.nal")
-            db_file_path_pal = os.path.join(db_path, f"{db_name}.pal")
-
-            if not os.path.exists(db_file_path_nal) and not os.path.exists(
-                db_file_path_pal
-            ):
-                messagebox.showerror(
-                    "設定エラー",
-                    f"データベースファイル ({db_name}.nal または .pal) が見つかりません。\n"
-                    f"パス: {db_path}\n"
-                    "設定画面で [DBフォルダ] と [DB名] を確認してください。",
-                )
+            error_message = validate_settings(self.config)
+            if error_message:
+                messagebox.showerror("設定エラー", error_message)
                 return False
 
             return True  # 全ての検証をパス
@@ -204,14 +339,7 @@ class Application:
             self.update_status("設定に不備があります。解析を開始できません。")
             return
 
-        items_to_run = 0
-        for i in range(self.view.listbox.size()):
-            item_text = self.view.listbox.get(i)
-            if not item_text.startswith("(実行中...)") and not item_text.startswith(
-                "(エラー)"
-            ):
-                items_to_run += 1
-
+        items_to_run = self.jobs.count(JobState.PENDING)
         if items_to_run == 0:
             messagebox.showwarning("警告", "解析対象のファイルがありません。")
             return
@@ -219,60 +347,113 @@ class Application:
         if messagebox.askyesno(
             "確認", f"{items_to_run}個のファイルの解析を開始しますか？"
         ):
+            # 待ち時間の長いファイルの救済を含めて、方針どおりに並べ直してから開始する
+            self._apply_policy()
+            self._render_list()
             self.start_analysis_task()
 
     def start_analysis_task(self):
-        """解析タスクの本体（キュー監視の開始）"""
-        if self.is_running:
-            return
-            # 既に実行中なら何もしない
-
-        # 実行中でない最初のファイルを探す
-        next_file_index = -1
-        for i in range(self.view.listbox.size()):
-            # (エラー) で始まるものも除外する
-            item_text = self.view.listbox.get(i)
-            if not item_text.startswith("(実行中...)") and not item_text.startswith(
-                "(エラー)"
-            ):
-                next_file_index = i
-                break
-
-        if next_file_index == -1:
-            # 解析待ちのファイルがない
-            if not any(
-                item.startswith("(実行中...)")
-                for item in self.view.listbox.get(0, tk.END)
-            ):
-                # 実行中のファイルもなければ完了
-                self.update_status("全てのファイルが処理されました。")
+        """解析タスクの本体（空きスロットへのワーカー割り当てとキュー監視の開始）"""
+        # スレッド予算の空きがある限り、解析待ちのファイルを表示順に開始する
+        # (自動調整が有効なら、ファイルの大きさと解析待ちの数からスレッド数を決める)
+        # このマシンに空きがなければ、空きスロットの多いエージェントに割り当てる
+        while True:
+            jobs, num_threads = take_next_launch(
+                self.jobs, self.config, self.running_workers, self.tuner
+            )
+            agent = None
+            if not jobs:
+                jobs, agent = take_next_remote_launch(self.jobs, self.config, self.agents)
+            if not jobs:
+                break  # 空きがないか、解析待ちのファイルがない
+            self._launch_worker(jobs, num_threads, agent)
+
+        self.waiting_for_agents = False
+        if not self.running_workers:
+            if self.jobs.count(JobState.PENDING) and self.agents is not None:
+                # エージェントが応答したら (agents_available) 開始する
+                self.waiting_for_agents = True
+                self.update_status("利用できるエージェントがありません。応答を待っています...")
+                return
+            # 実行中のファイルもなければ完了
+            self.update_status("全てのファイルが処理されました。")
             return
 
-        self.is_running = True
-        self.stop_requested = False
-        self.toggle_buttons_on_run_state(True)
-        # ボタンの状態を「実行中」モードにする
-
-        # 実行対象のファイルパスを取得
-        self.running_filepath = self.view.listbox.get(next_file_index)
-
-        # リストの表示を実行中に更新
-        self.view.listbox.delete(next_file_index)
-        self.view.listbox.insert(
-            next_file_index, f"(実行中...) {self.running_filepath}"
+        if not self.is_running:
+            self.stop_requested = False
+            self.batch_finished = 0
+            self.metrics_log = open_metrics_log(self.config)
+            batch_timeout_min = self.config.getfloat("TIMEOUTS", "batch_timeout_min", fallback=0)
+            if batch_timeout_min > 0:
+                self._batch_timer = self.master.after(
+                    int(batch_timeout_min * 60 * 1000), self._on_batch_timeout
+                )
+            self.view.batch_progressbar["value"] = 0
+            self.toggle_buttons_on_run_state(True)
+            # ボタンの状態を「実行中」モードにする (is_running=True になる)
+
+    def _launch_worker(self, jobs, num_threads=None, agent=None):
+        """
+        実行中にしたジョブのワーカーを開始する (複数ならまとめて1回の blastn で実行)。
+        agent を渡すと、そのエージェントで blastn を実行する。
+        """
+        # リストの表示を実行中に更新 (色も変わる)
+        self._render_list()
+
+        # ワーカーを作成して開始 ([ENGINE] の設定でスレッドまたは asyncio のエンジンで実行)
+        worker = start_job(
+            [job.filepath for job in jobs],
+            self.queue,
+            self.config,
+            self.journal,
+            num_threads,
+            agent,
+            self.result_cache,
         )
-        self.view.listbox.itemconfig(next_file_index, {"fg": "blue"})
-        # 色を変更
-
-        # ワーカースレッドを作成して開始
-        # worker 変数を self.current_worker に格納
-        self.current_worker = BlastWorker(
-            self.running_filepath, self.queue, self.config
+        for job in jobs:
+            self.running_workers[job.filepath] = worker
+
+    def _release_worker(self, filepath):
+        """
+        完了/エラーになったファイルを実行中エントリから外す。
+
+        Returns:
+            bool: 実行中エントリに存在した場合は True
+            (移動エラー後の file_done など、二重通知の場合は False)
+        """
+        if self.running_workers.pop(filepath, None) is None:
+            return False
+        self.job_progress.pop(filepath, None)
+        self.batch_finished += 1
+        if not self.running_workers:
+            self.view.progressbar["value"] = 0
+        self._update_batch_progress()
+        return True
+
+    def _count_cache_result(self, cache_hit):
+        """結果キャッシュのヒット/ミスを数えて、ステータスバーに表示する"""
+        if cache_hit:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+        self.view.cache_label.config(
+            text=f"キャッシュ ヒット: {self.cache_hits} / ミス: {self.cache_misses}"
         )
-        self.current_worker.start()
 
-        # 100ミリ秒後にキューの監視を開始
-        self.master.after(100, self.process_queue)
+    def _finish_run(self, status_message):
+        """全てのワーカーが終了した後、実行状態を解除し、計測の集計を表示する"""
+        if self._batch_timer is not None:
+            self.master.after_cancel(self._batch_timer)
+            self._batch_timer = None
+        if self.metrics_log is not None:
+            summary_text = format_summary(self.metrics_log.summary())
+            print(summary_text)
+            status_message = f"{status_message} ({summary_text})"
+            self._close_metrics_log()
+        self.update_status(status_message)
+        self.stop_requested = False
+        self.toggle_buttons_on_run_state(False)
+        # ボタンを通常モードに戻す (is_running=False になる)
 
     def stop_analysis_confirm(self):
         """「解析中止」ボタンの確認ダイアログ"""
@@ -280,72 +461,101 @@ class Application:
             self.update_status("現在、解析は実行されていません。")
             return
 
-        if messagebox.askyesno(
-            "確認", "現在実行中の処理が完了した後、解析を中止しますか？"
-        ):
-            self.stop_requested = True
+        answer = messagebox.askyesnocancel(
+            "確認",
+            "解析を中止しますか？\n\n"
+            "はい: 実行中の blastn もすぐに中止する\n"
+            "いいえ: 実行中の処理が全て完了した後に中止する",
+        )
+        if answer is None:
+            return
+        self.stop_requested = True
+        self.view.stop_button.config(state=tk.DISABLED)
+        # 中止ボタンを無効化
+        if answer:
+            for worker in set(self.running_workers.values()):
+                worker.cancel("user")
+            self.update_status("中止を要求しました。blastn の終了を待っています...")
+        else:
             self.update_status(
                 "中止を要求しました。現在の処理が完了次第、停止します..."
             )
-            self.view.stop_button.config(state=tk.DISABLED)
-            # 中止ボタンを無効化
+
+    def _on_batch_timeout(self):
+        """バッチ全体の制限時間を過ぎたら、新しいファイルを開始せず、実行中のジョブを中止する"""
+        self._batch_timer = None
+        if not self.is_running:
+            return
+        self.stop_requested = True
+        self.view.stop_button.config(state=tk.DISABLED)
+        for worker in set(self.running_workers.values()):
+            worker.cancel("batch_timeout")
+        self.update_status("バッチ全体の制限時間を過ぎたため、解析を中止しています...")
 
     # --- (B) リファクタリング済みメソッド ---
 
     def _update_progress(self, message):
         """(B-2) 進捗メッセージの処理"""
         self.view.progressbar["value"] = message["value"]
-        self.update_status(message["message"])
+        if "original_path" in message:
+            self.job_progress[message["original_path"]] = message["value"]
+            self._update_batch_progress()
+        if len(self.running_workers) > 1:
+            # 複数ジョブの同時実行中は実行数を併記する
+            self.update_status(
+                f"[{len(self.running_workers)}件実行中] {message['message']}"
+            )
+        else:
+            self.update_status(message["message"])
+
+    def _update_batch_progress(self):
+        """完了ファイル数と実行中ファイルの進捗率から、バッチ全体の進捗を表示する"""
+        total = (
+            self.batch_finished
+            + len(self.running_workers)
+            + self.jobs.count(JobState.PENDING)
+        )
+        if total == 0:
+            return
+        running_fraction = sum(
+            self.job_progress.get(path, 0) for path in self.running_workers
+        ) / 100.0
+        done = self.batch_finished + running_fraction
+        self.view.batch_progressbar["value"] = 100.0 * done / total
+        self.view.batch_label.config(text=f"全体: {self.batch_finished}/{total}")
 
     def _handle_blast_completion(self, message):
         """(B-3) BLAST正常完了メッセージの処理"""
-        # 完了したファイル "(実行中...)" をリストから探して削除
+        # 完了したファイルをキューとリストから削除
         original_path = message["original_path"]
-        running_item_index = -1
-        for i in range(self.view.listbox.size()):
-            item_text = self.view.listbox.get(i)
-            if item_text.startswith("(実行中...)") and item_text.endswith(
-                original_path
-            ):
-                running_item_index = i
-                break
-        if running_item_index != -1:
-            self.view.listbox.delete(running_item_index)
+        job = self.jobs.by_path.get(original_path)
+        if job is not None and job.state is JobState.RUNNING:
+            self.jobs.finish(job)
+            self._render_list()
 
-        self.running_filepath = None
-        self.view.progressbar["value"] = 0
-        self.is_running = False
-        # 次のファイルに移る前に一旦Falseに
-        self.current_worker = None  # ワーカーへの参照をクリア
+        if not self._release_worker(original_path):
+            return  # 既に処理済みの通知 (移動エラー後の file_done など)
+
+        if "cache_hit" in message:
+            self._count_cache_result(message["cache_hit"])
+        if self.index_writer is not None:
+            self.index_writer.submit(result_path_for(original_path))
 
         if self.stop_requested:
-            # 「中止」が要求されていた場合
-            self.update_status("解析を中止しました。")
-            self.stop_requested = False
-            self.toggle_buttons_on_run_state(False)
-            # ボタンを通常モードに戻す
-            # ★リファクタリング: 'return' を削除
-        else:
-            # 解析待ちのファイルがあるか確認
-            items_to_run = 0
-            for i in range(self.view.listbox.size()):
-                item_text = self.view.listbox.get(i)
-                if not item_text.startswith("(実行中...)") and not item_text.startswith(
-                    "(エラー)"
-                ):
-                    items_to_run += 1
-
-            if items_to_run > 0:
-                # 次のタスクを開始
-                # (start_analysis_taskが is_running=True と after をセットする)
-                self.start_analysis_task()
+            # 「中止」が要求されていた場合は新しいファイルを開始しない
+            if not self.running_workers:
+                self._finish_run("解析を中止しました。")
             else:
-                # 全て完了
-                self.update_status("全ての解析が完了しました。")
-                messagebox.showinfo("成功", "全ての解析が完了しました。")
-                self.toggle_buttons_on_run_state(False)
-                # (is_running=False になる)
-                # ★リファクタリング: 'return' を削除
+                self.update_status(
+                    f"中止を要求しました。残り{len(self.running_workers)}件の完了を待っています..."
+                )
+        elif self.jobs.count(JobState.PENDING) > 0:
+            # 空いたスロットで次のタスクを開始
+            self.start_analysis_task()
+        elif not self.running_workers:
+            # 全て完了
+            self._finish_run("全ての解析が完了しました。")
+            messagebox.showinfo("成功", "全ての解析が完了しました。")
 
     # --- (C-5) エラー処理メソッド (改修) ---
     def _handle_blast_error(self, message):
@@ -377,74 +587,204 @@ class Application:
         else:  # GenericError やその他の予期せぬエラー
             messagebox.showerror("エラー", message["message"])
 
-        # エラーが起きたファイル "(実行中...)" をリストから探して削除
-        error_path = message.get("original_path", self.running_filepath)
-        # Workerからパスが来ればそれを使う
-        running_item_index = -1
-        for i in range(self.view.listbox.size()):
-            item_text = self.view.listbox.get(i)
-            if item_text.startswith("(実行中...)") and item_text.endswith(error_path):
-                running_item_index = i
-                break
-        if running_item_index != -1:
-            self.view.listbox.delete(running_item_index)
-            # エラー表示で再挿入
-            self.view.listbox.insert(tk.END, f"(エラー) {error_path}")
-            self.view.listbox.itemconfig(tk.END, {"fg": "red"})
-
-        self.running_filepath = None
-        self.view.progressbar["value"] = 0
-        self.is_running = False  # 次のファイルに移る前に一旦Falseに
-        self.current_worker = None  # ワーカーへの参照をクリア
-
-        # エラー発生時も中止要求かリストが空なら停止
-        items_to_run = 0
-        for i in range(self.view.listbox.size()):
-            item_text = self.view.listbox.get(i)
-            if not item_text.startswith("(実行中...)") and not item_text.startswith(
-                "(エラー)"
-            ):
-                items_to_run += 1
+        # エラーが起きたファイルをエラー状態にして、リストの末尾へ移動
+        error_path = message["original_path"]
+        job = self.jobs.by_path.get(error_path)
+        if job is not None and job.state is JobState.RUNNING:
+            self.jobs.mark_error(job)
+            if self.journal is not None:
+                self.journal.record_positions([job])
+            self._render_list()
 
-        if self.stop_requested or items_to_run == 0:
-            self.update_status("エラーにより解析を停止しました。")
-            self.stop_requested = False
-            self.toggle_buttons_on_run_state(False)
-            # (is_running=False になる)
-            # ★リファクタリング: 'return' を削除
+        if not self._release_worker(error_path):
+            return
+
+        # エラー発生時も中止要求かリストが空なら、実行中の他のジョブを待って停止
+        if self.stop_requested or self.jobs.count(JobState.PENDING) == 0:
+            if not self.running_workers:
+                self._finish_run("エラーにより解析を停止しました。")
         else:
-            # 次のタスクを開始し、監視を継続
-            # (start_analysis_taskが is_running=True と after をセットする)
+            # 空いたスロットで次のタスクを開始
             self.start_analysis_task()
 
-    def process_queue(self):
-        """(B-5) キューを監視し、各処理メソッドに振り分ける"""
-        try:
-            message = self.queue.get_nowait()
+    def _handle_cancelled(self, message):
+        """中止したファイルを「中止」状態にして (再実行できる)、空いたスロットで次を開始する"""
+        original_path = message["original_path"]
+        job = self.jobs.by_path.get(original_path)
+        if job is not None and job.state is JobState.RUNNING:
+            self.jobs.mark_cancelled(job)
+            self._render_list()
+
+        if not self._release_worker(original_path):
+            return
+        self.update_status(message["message"])
+
+        if self.stop_requested or self.jobs.count(JobState.PENDING) == 0:
+            if not self.running_workers:
+                self._finish_run("解析を中止しました。")
+        else:
+            self.start_analysis_task()
 
-            # --- 1. 進捗メッセージ ---
-            if message["type"] == "progress":
-                self._update_progress(message)
+    def _handle_requeue(self, message):
+        """ノードを見失ったファイルを解析待ちに戻し、空きのあるノード (かこのマシン) でやり直す"""
+        original_path = message["original_path"]
+        job = self.jobs.by_path.get(original_path)
+        if job is not None and job.state is JobState.RUNNING:
+            self.jobs.mark_pending(job)
+            if self.journal is not None:
+                self.journal.record_enqueued([job])
+            self._apply_policy()
+            self._render_list()
+        if self.running_workers.pop(original_path, None) is None:
+            return
+        self.job_progress.pop(original_path, None)
+        self._update_batch_progress()
+        self.update_status(message["message"])
 
-            # --- 2. ファイル完了メッセージ ---
-            elif message["type"] == "file_done":
-                self._handle_blast_completion(message)
+        if self.stop_requested:
+            if not self.running_workers:
+                self._finish_run("解析を中止しました。")
+        else:
+            self.start_analysis_task()
 
-            # --- 3. エラーメッセージ ---
-            elif message["type"] == "error":
-                self._handle_blast_error(message)
+    def _on_agents_available(self):
+        """エージェントに空きができたら、解析待ちのファイルを割り当てる"""
+        if not (self.is_running or self.waiting_for_agents) or self.stop_requested:
+            return
+        if self.jobs.count(JobState.PENDING) > 0:
+            self.start_analysis_task()
 
-        except queue.Empty:
-            pass  # キューが空の場合は何もしない
+    def _dispatch_message(self, message):
+        """(B-5) ワーカーからのメッセージを各処理メソッドに振り分ける"""
+        # --- 1. 進捗メッセージ ---
+        if message["type"] == "progress":
+            self._update_progress(message)
 
-        # --- ★監視を継続する after はここに集約 ---
-        # 状態（is_running）は各ハンドラ(_handle_...)が適切に設定する。
-        # ここでは、その状態を見て、監視を継続するかを判断する。
-        if self.is_running or not self.queue.empty():
-            # start_analysis_task が is_running を True にするので、
-            # 次の反復で start_analysis_task が呼ばれない場合にのみ after をセット
-            # if文の条件が複雑化するので、シンプルに毎回 after を呼ぶことにする
-            self.master.after(100, self.process_queue)
+        # --- 2. ファイル完了メッセージ ---
+        elif message["type"] == "file_done":
+            self._record_metrics(message)
+            self._handle_blast_completion(message)
+
+        # --- 3. エラーメッセージ ---
+        elif message["type"] == "error":
+            self._record_metrics(message)
+            self._handle_blast_error(message)
+
+        # --- 4. 中止 (ユーザー操作・タイムアウト) ---
+        elif message["type"] == "cancelled":
+            self._record_metrics(message)
+            self._handle_cancelled(message)
+
+        # --- 5. 監視フォルダの新しいファイル ---
+        elif message["type"] == "watch_files":
+            self._add_watched_files(message["paths"])
+
+        # --- 6. ノードを見失ったジョブ / エージェントの空き ---
+        elif message["type"] == "requeue":
+            self._handle_requeue(message)
+
+        elif message["type"] == "agents_available":
+            self._on_agents_available()
+
+    # --- 監視フォルダ ---
+    def toggle_watch(self):
+        """「フォルダを監視」の切り替え (監視フォルダが未設定なら選んでもらう)"""
+        if not self.config.has_section("WATCH"):
+            self.config.add_section("WATCH")
+        enabled = self.watch_var.get()
+        if enabled and not self.config.get("WATCH", "directories", fallback="").strip():
+            folder_path = filedialog.askdirectory(title="監視するフォルダを選択")
+            if not folder_path:
+                self.watch_var.set(False)
+                return
+            self.config.set("WATCH", "directories", folder_path)
+        self.config.set("WATCH", "enabled", "true" if enabled else "false")
+        save_config(self.config)
+        self._restart_watch()
+
+    def _restart_watch(self):
+        """[WATCH] 設定で監視をやり直す (無効なら止める)"""
+        self._stop_watch()
+        settings = watch_settings_from_config(self.config)
+        self.watch_var.set(settings is not None)
+        if settings is None:
+            return
+        self.watcher = FolderWatcher(
+            settings["directories"],
+            # 監視スレッドからはキューに入れるだけにし、メインスレッドでリストに追加する
+            lambda paths: self.queue.put({"type": "watch_files", "paths": paths}),
+            patterns=settings["patterns"],
+            stable_sec=settings["stable_sec"],
+            poll_sec=settings["poll_sec"],
+        )
+        self.watcher.start()
+        self.update_status(f"フォルダを監視しています: {'; '.join(settings['directories'])}")
+
+    def _stop_watch(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+
+    def _stop_agents(self):
+        if self.agents is not None:
+            self.agents.stop()
+            self.agents = None
+
+    def _add_watched_files(self, filepaths):
+        """監視フォルダで見つけたファイルを追加し、auto_start なら確認なしで解析を始める"""
+        added = self.jobs.add(filepaths)
+        if not added:
+            return  # 既にリストにあるファイルだけだった
+        if self.journal is not None:
+            self.journal.record_enqueued(added)
+        self._apply_policy()
+        self._render_list()
+        self.update_status(f"監視フォルダから{len(added)}個のファイルを追加しました。")
+
+        if not self.config.getboolean("WATCH", "auto_start", fallback=True) or self.stop_requested:
+            return
+        if not self.is_running:
+            # 確認ダイアログを出さずに開始する (設定に不備があればステータスに表示するだけ)
+            try:
+                error_message = validate_settings(self.config)
+            except Exception as e:
+                error_message = str(e)
+            if error_message:
+                self.update_status(f"設定に不備があるため、自動で開始できません: {error_message}")
+                return
+        self.start_analysis_task()
+
+    def _record_metrics(self, message):
+        """実行中のファイルの完了/エラーの計測値を記録する (移動エラー後の file_done は除く)"""
+        original_path = message["original_path"]
+        if self.metrics_log is None or original_path not in self.running_workers:
+            return
+        job = self.jobs.by_path.get(original_path)
+        self.metrics_log.add(message, job.queued_at if job is not None else None)
+        if (
+            self.tuner is not None
+            and message["type"] == "file_done"
+            and "metrics" in message
+            and "agent" not in message["metrics"]  # 自動調整はこのマシンの実測値だけから学ぶ
+        ):
+            self.tuner.observe(message["metrics"])
+
+    def _close_metrics_log(self):
+        if self.metrics_log is not None:
+            self.metrics_log.close()
+            self.metrics_log = None
+
+    def _show_queue_metrics(self):
+        """メッセージキューの深さと処理の遅延を1秒ごとにステータスバーへ表示する"""
+        metrics = self.message_pump.metrics()
+        if metrics["latency_ms_p95"] is not None:
+            self.view.queue_label.config(
+                text=(
+                    f"キュー: {metrics['depth']}件 (最大{metrics['max_depth']}) "
+                    f"遅延 p95: {metrics['latency_ms_p95']:.0f}ms"
+                )
+            )
+        self.master.after(1000, self._show_queue_metrics)
 
     def toggle_buttons_on_run_state(self, is_running):
         """解析実行中/完了時に実行・中止ボタンの状態のみを切り替える"""
@@ -491,6 +831,10 @@ class Application:
             command=lambda: self.browse_folder("db")
         )
         self.settings_window.db_name_button.config(command=self.browse_database_file)
+        self.settings_window.watch_entry.insert(
+            0, self.config.get("WATCH", "directories", fallback="")
+        )
+        self.settings_window.watch_button.config(command=self.browse_watch_folder)
         self.settings_window.save_button.config(command=self.save_settings)
         self.settings_window.cancel_button.config(command=self.settings_window.destroy)
 
@@ -509,6 +853,17 @@ class Application:
             entry_widget.delete(0, tk.END)
             entry_widget.insert(0, folder_path)
 
+    def browse_watch_folder(self):
+        """監視フォルダの欄に、選んだフォルダを追加する (";" 区切り)"""
+        folder_path = filedialog.askdirectory(title="監視するフォルダを選択")
+        if not folder_path:
+            return
+        current = self.settings_window.watch_entry.get().strip()
+        self.settings_window.watch_entry.delete(0, tk.END)
+        self.settings_window.watch_entry.insert(
+            0, f"{current};{folder_path}" if current else folder_path
+        )
+
     def browse_database_file(self):
         db_folder = self.settings_window.db_path_entry.get()
         if not os.path.isdir(db_folder):
@@ -553,11 +908,99 @@ class Application:
         self.config.set(
             "BLAST_SETTINGS", "database_name", self.settings_window.db_name_entry.get()
         )
+        if not self.config.has_section("WATCH"):
+            self.config.add_section("WATCH")
+        self.config.set("WATCH", "directories", self.settings_window.watch_entry.get().strip())
 
         save_config(self.config)
+        # DB が変わった場合に備え、自動調整のモデルを選び直す
+        self.tuner = ThreadTuner.from_config(self.config, CONFIG_PATH)
+        self.result_cache = open_result_cache(self.config, CONFIG_PATH)
         self.settings_window.destroy()
         self.update_status("設定を保存しました。")
         messagebox.showinfo("成功", "設定が正常に保存されました。")
+        # 監視フォルダが変わった場合に備え、監視をやり直す
+        self._restart_watch()
+
+    # --- 結果の検索 ---
+    def open_search_window(self):
+        """結果の索引の検索画面を開く ([RESULT_INDEX] が無効でも、既にある索引は検索できる)"""
+        if self.search_window is not None and self.search_window.winfo_exists():
+            self.search_window.lift()
+            return
+        if self.index_writer is not None:
+            self.search_index = self.index_writer.index
+        else:
+            try:
+                self.search_index = ResultIndex(
+                    index_path_from_config(self.config, CONFIG_PATH, required=True)
+                )
+            except Exception as e:
+                messagebox.showerror("エラー", f"結果の索引を開けません。\n{e}")
+                return
+        self.search_window = SearchWindow(self.master)
+        self.search_window.search_button.config(command=self._run_search)
+        self.search_window.term_entry.bind("<Return>", lambda event: self._run_search())
+        self.search_window.pident_entry.bind("<Return>", lambda event: self._run_search())
+        self.search_window.result_tree.bind("<Double-Button-1>", self._open_search_result)
+        self.search_window.term_entry.focus_set()
+        stats = self.search_index.stats()
+        self.search_window.status_label.config(
+            text=f"索引: サンプル {stats['samples']}個, ヒット {stats['hits']}行"
+        )
+
+    def _run_search(self):
+        """検索欄の語で索引を検索し、ヒットのあるサンプルを表に表示する"""
+        window = self.search_window
+        pident_text = window.pident_entry.get().strip()
+        try:
+            min_pident = float(pident_text) if pident_text else None
+        except ValueError:
+            messagebox.showerror("エラー", "pident には数値を入力してください。", parent=window)
+            return
+        if not window.term_entry.get().strip() and min_pident is None:
+            window.status_label.config(text="検索する語か pident の下限を入力してください。")
+            return
+        started = time.monotonic()
+        try:
+            rows = self.search_index.search(window.term_entry.get(), min_pident=min_pident)
+        except Exception as e:
+            messagebox.showerror("エラー", f"検索中にエラーが発生しました。\n{e}", parent=window)
+            return
+        elapsed_ms = (time.monotonic() - started) * 1000
+
+        window.result_tree.delete(*window.result_tree.get_children())
+        for row in rows:
+            window.result_tree.insert(
+                "",
+                tk.END,
+                iid=row["result_path"],
+                values=(row["sample"], row["hits"], f"{row['max_pident']:.2f}"),
+            )
+        window.status_label.config(text=f"{len(rows)}件 ({elapsed_ms:.1f} ms)")
+
+    def _open_search_result(self, event):
+        """検索結果の行がダブルクリックされたら、その結果ファイルを開く"""
+        selection = self.search_window.result_tree.selection()
+        if not selection:
+            return
+        result_path = selection[0]
+        if not os.path.exists(result_path):
+            messagebox.showerror(
+                "エラー", f"結果ファイルが見つかりません:\n{result_path}", parent=self.search_window
+            )
+            return
+        try:
+            subprocess.Popen(["notepad.exe", result_path])
+        except Exception as e:
+            messagebox.showerror(
+                "エラー", f"ファイルを開けませんでした。\n{e}", parent=self.search_window
+            )
+
+    def _close_index(self):
+        if self.index_writer is not None:
+            self.index_writer.close()
+            self.index_writer = None
 
     def update_status(self, message):
         """ステータスバーのメッセージを更新する"""
@@ -571,23 +1014,77 @@ class Application:
                 "確認",
                 "解析が実行中です。本当に終了しますか？\n(実行中のBLASTプロセスは強制終了されます)",
             ):
-                # 1. 実行中のワーカースレッドに停止命令を出す
-                if self.current_worker:
+                # 1. 実行中の全てのワーカースレッドに停止命令を出す
+                for worker in set(self.running_workers.values()):
                     try:
                         # blast_worker.py に追加した terminate() を呼び出す
-                        self.current_worker.terminate()
+                        worker.terminate()
                         print("ワーカースレッドに終了シグナルを送信しました。")
                     except Exception as e:
                         print(f"ワーカー終了処理中にエラー: {e}")
 
                 # 2. メインウィンドウを破棄
                 #    (ワーカーは daemon=True なので、メインスレッドが終了すれば道連れで終了する)
+                #    強制終了したジョブはジャーナル上は実行中のまま残り、次回起動時に再実行される
+                self._stop_watch()
+                self._stop_agents()
+                self._close_metrics_log()
+                self._close_journal()
+                self._close_index()
                 self.master.destroy()
             else:
                 return  # 終了をキャンセル
         else:
+            self._stop_watch()
+            self._stop_agents()
+            self._close_journal()
+            self._close_index()
             self.master.destroy()
 
+    # --- ジョブジャーナル ---
+    def _restore_jobs(self):
+        """前回のセッションで終わらなかったジョブをキューに戻す"""
+        try:
+            report = self.journal.recover()
+        except Exception as e:
+            print(f"ジョブジャーナルの読み込み中にエラー: {e}")
+            return
+        if not report["jobs"]:
+            return
+
+        added = self.jobs.add([filepath for filepath, _ in report["jobs"]])
+        for job, (_, state) in zip(added, report["jobs"]):
+            if state == JobState.ERROR.value:
+                self.jobs.mark_error(job)
+            elif state == JobState.CANCELLED.value:
+                self.jobs.mark_cancelled(job)
+        # 復元後の表示順で記録し直す
+        self.journal.record_positions(self.jobs)
+        self._render_list()
+
+        status = f"前回の未完了ジョブを{len(added)}件復元しました。"
+        if report["partial_outputs"]:
+            status += f" (書きかけの結果ファイル{len(report['partial_outputs'])}件を削除)"
+        self.update_status(status)
+
+    def _record_removed(self, jobs):
+        """リストから取り除いたジョブをジャーナルに記録する (実行中のジョブは取り除かれない)"""
+        if self.journal is not None:
+            self.journal.record_removed(
+                job.filepath for job in jobs if job.state is not JobState.RUNNING
+            )
+
+    def _move_job(self, from_index, to_index):
+        """ドラッグでの並び替えをモデルの順序とジャーナルに反映する"""
+        renumbered = self.jobs.move(from_index, to_index)
+        if self.journal is not None:
+            # 全体の position を振り直した場合だけ、全ジョブの表示順を記録し直す
+            self.journal.record_positions(self.jobs if renumbered else [self.jobs.job_at(to_index)])
+
+    def _close_journal(self):
+        if self.journal is not None:
+            self.journal.close()
+
 
 if __name__ == "__main__":
     # (C-4) Windowsでのサブプロセス起動時の問題を回避
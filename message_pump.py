@@ -0,0 +1,210 @@
+# message_pump.py
+"""
+ワーカースレッドからGUIへのメッセージを受け渡す仕組み。
+
+以前は 100 ミリ秒ごとに get_nowait() を1回だけ呼んでいたため、1秒間に最大10件しか
+処理できず、同時実行ジョブが多いと完了通知の処理 (次のファイルの開始) が遅れていた。
+
+- WorkerMessageQueue: put() された時刻を記録し、空だったキューにメッセージが来たら
+  notify コールバックで (event_generate により) GUIスレッドを起こす。
+- MessagePump: 起こされるたびに、時間予算の範囲でキューを空になるまで読み出し、
+  同じファイルの進捗メッセージは最新の1件にまとめてから振り分ける。
+  キューの深さと、put() から振り分けまでの遅延を計測する。
+"""
+import collections
+import queue
+import threading
+import time
+
+# ワーカーがGUIスレッドを起こすための仮想イベント
+WAKEUP_EVENT = "<<WorkerMessage>>"
+# 1回の読み出しで振り分けに使う時間の上限 (これを超えたら残りは次のアイドル時に回す)
+DISPATCH_TIME_BUDGET = 0.05
+# イベントで起こせなかった場合に備えた、予備のポーリング間隔 (ミリ秒)
+FALLBACK_POLL_MS = 250
+# 遅延の統計に使う直近の件数
+LATENCY_WINDOW = 500
+
+
+class WorkerMessageQueue(queue.Queue):
+    """
+    put() された時刻と一緒にメッセージを保持するキュー。
+    get() は (put() 時の time.monotonic(), メッセージ) のタプルを返す。
+    """
+
+    def __init__(self, notify=None):
+        """
+        Args:
+            notify (callable): メッセージが届いたときに (ワーカースレッドから) 呼ぶ関数
+        """
+        super().__init__()
+        self.notify = notify
+        self._wakeup_pending = False
+        self._wakeup_lock = threading.Lock()
+
+    def put(self, item, block=True, timeout=None):
+        super().put((time.monotonic(), item), block, timeout)
+        # 読み出し側が起きるまでの間は、通知を1回にまとめる
+        with self._wakeup_lock:
+            if self._wakeup_pending or self.notify is None:
+                return
+            self._wakeup_pending = True
+        try:
+            self.notify()
+        except Exception:
+            # ウィンドウの破棄後などは通知できないが、予備のポーリングで拾われる
+            pass
+
+    def clear_wakeup(self):
+        """読み出しを始める前に呼ぶ (以降の put() で再び通知する)"""
+        with self._wakeup_lock:
+            self._wakeup_pending = False
+
+
+def coalesce_progress(entries):
+    """
+    同じファイルの連続した進捗メッセージを最新の1件にまとめる。
+
+    間に同じファイルの完了・エラーメッセージがあれば、それをまたいではまとめない。
+    まとめた進捗は最初の進捗の位置に置き、時刻も最初の進捗のものを残すので、
+    ファイルごとのメッセージの順序は変わらず、遅延は最も待たされた進捗で計測される。
+
+    Args:
+        entries (list[tuple[float, dict]]): (put() 時の時刻, メッセージ) のリスト
+
+    Returns:
+        list[tuple[float, dict]]: まとめた後のリスト
+    """
+    result = []
+    progress_slots = {}  # ファイルパス -> result 内のまとめ先の位置
+    for posted_at, message in entries:
+        path = message.get("original_path")
+        if message["type"] == "progress":
+            index = progress_slots.get(path)
+            if index is not None:
+                result[index] = (result[index][0], message)
+                continue
+            progress_slots[path] = len(result)
+        else:
+            progress_slots.pop(path, None)
+        result.append((posted_at, message))
+    return result
+
+
+class MessagePump:
+    """WorkerMessageQueue のメッセージを Tk のイベントループで振り分ける"""
+
+    def __init__(self, master, message_queue, dispatch, time_budget=DISPATCH_TIME_BUDGET):
+        """
+        Args:
+            master (tk.Misc): イベントを受け取るウィジェット (ルートウィンドウ)
+            message_queue (WorkerMessageQueue): ワーカーからのメッセージ
+            dispatch (callable): 1件のメッセージ (dict) を処理する関数
+            time_budget (float): 1回の読み出しで振り分けに使う時間の上限 (秒)
+        """
+        self.master = master
+        self.queue = message_queue
+        self.dispatch = dispatch
+        self.time_budget = time_budget
+        self._backlog = collections.deque()  # 時間切れで振り分けられなかった (時刻, メッセージ)
+        self._continue_scheduled = False
+        self._pumping = False
+
+        # --- 計測値 ---
+        self.dispatched = 0  # 振り分けたメッセージ数
+        self.coalesced = 0  # まとめて捨てた進捗メッセージ数
+        self.max_depth = 0  # 読み出し開始時のキューの深さの最大値
+        self._latencies = collections.deque(maxlen=LATENCY_WINDOW)
+
+    def start(self):
+        """ワーカーからの通知の受け付けと、予備のポーリングを開始する"""
+        self.master.bind(WAKEUP_EVENT, lambda event: self.pump())
+        self.queue.notify = self._wakeup
+        self._poll()
+
+    def _wakeup(self):
+        # ワーカースレッドから呼ばれる。イベントは Tk のイベントキューの末尾に積まれる
+        self.master.event_generate(WAKEUP_EVENT, when="tail")
+
+    def _poll(self):
+        self.pump()
+        self.master.after(FALLBACK_POLL_MS, self._poll)
+
+    def _continue(self):
+        self._continue_scheduled = False
+        self.pump()
+
+    def _schedule_continue(self):
+        if not self._continue_scheduled:
+            self._continue_scheduled = True
+            self.master.after_idle(self._continue)
+
+    def pump(self):
+        """キューにあるメッセージを、時間予算の範囲で振り分ける"""
+        if self._pumping:
+            # ハンドラ内のダイアログ表示中 (入れ子のイベントループ) は振り分けない。
+            # 古いメッセージより先に新しいものを処理してしまうため
+            return
+        self._pumping = True
+        try:
+            self._pump()
+        finally:
+            self._pumping = False
+        if not self.queue.empty():
+            # ダイアログ表示中に届いたメッセージ
+            self._schedule_continue()
+
+    def _pump(self):
+        self.queue.clear_wakeup()
+        deadline = time.monotonic() + self.time_budget
+
+        # キューにあるものを全て取り出す (取り出し自体は軽いので予算に関係なく行う)
+        depth = len(self._backlog)
+        while True:
+            try:
+                self._backlog.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+            depth += 1
+        self.max_depth = max(self.max_depth, depth)
+        if not self._backlog:
+            return
+
+        merged = coalesce_progress(self._backlog)
+        self.coalesced += len(self._backlog) - len(merged)
+        self._backlog.clear()
+
+        for i, (posted_at, message) in enumerate(merged):
+            self._latencies.append(time.monotonic() - posted_at)
+            self.dispatched += 1
+            self.dispatch(message)
+            if time.monotonic() > deadline and i + 1 < len(merged):
+                # 時間切れ: 残りは画面の再描画などを挟んでから続ける
+                self._backlog.extend(merged[i + 1:])
+                self._schedule_continue()
+                return
+
+    def metrics(self):
+        """
+        計測値を返す。
+
+        Returns:
+            dict: depth (未処理のメッセージ数), max_depth (読み出し開始時の最大値),
+            dispatched, coalesced, latency_ms_avg, latency_ms_p95, latency_ms_max
+            (遅延は直近 LATENCY_WINDOW 件の put() から振り分けまでの時間)
+        """
+        latencies = sorted(self._latencies)
+        result = {
+            "depth": self.queue.qsize() + len(self._backlog),
+            "max_depth": self.max_depth,
+            "dispatched": self.dispatched,
+            "coalesced": self.coalesced,
+            "latency_ms_avg": None,
+            "latency_ms_p95": None,
+            "latency_ms_max": None,
+        }
+        if latencies:
+            result["latency_ms_avg"] = 1000.0 * sum(latencies) / len(latencies)
+            result["latency_ms_p95"] = 1000.0 * latencies[int(0.95 * (len(latencies) - 1))]
+            result["latency_ms_max"] = 1000.0 * latencies[-1]
+        return result
@@ -0,0 +1,163 @@
+# packed_worker.py
+import os
+import subprocess
+
+from blast_results import split_packed_results
+from blast_worker import BlastWorker
+from fasta_tools import pack_fasta, read_query_ids
+from result_summary import BEST_HITS_SUFFIX, SampleSummary, summary_settings_from_config
+
+
+class PackedBlastWorker(BlastWorker):
+    """
+    小さなFASTAファイルをまとめて1回の blastn で解析するワーカー。
+
+    サンプルごとの小さなファイル (数十リード) では、blastn の起動とDBの読み込みの
+    固定コストが解析時間の大半を占める。このワーカーは複数のファイルを
+    ID を付け替えた1つのクエリにまとめて blastn を1回だけ実行し、結果を
+    ファイルごとの <file>_result.csv に振り分ける。
+    完了通知 (file_done) と processed フォルダへの移動はファイルごとに行う。
+
+    blastn が失敗した場合は、どのファイルが原因か分からないので、
+    1ファイルずつ通常の BlastWorker で実行し直し、ファイルごとに結果・エラーを通知する。
+    blastn が見つからないなど、まとめた全てに共通の失敗は、全てのファイルに同じエラーを通知する。
+    まとめて実行する場合、重複除去と結果キャッシュは使わない (個別の再実行時は使う)。
+    """
+
+    def __init__(self, filepaths, queue, config, journal=None, num_threads=None):
+        """
+        Args:
+            filepaths (list[str]): まとめて処理するファイルパス (表示順)
+            queue (queue.Queue): GUIへ通知を送るためのキュー
+            config (configparser.ConfigParser): 設定情報
+            journal (JobJournal): 開始・移動・完了・エラーを記録するジャーナル (任意)
+            num_threads (int): -num_threads の値 (省略時は設定値)
+        """
+        super().__init__(filepaths[0], queue, config, journal, num_threads)
+        self.filepaths = list(filepaths)
+        self.display_name = (
+            f"{os.path.basename(filepaths[0])} 他{len(filepaths) - 1}ファイル"
+        )
+
+    def _prepare(self):
+        """ファイルを ID を付け替えた1つのクエリにまとめ、blastn の実行計画を返す"""
+        # 進捗は先頭のファイルの進捗として通知する
+        self.queue.put(
+            {
+                "type": "progress",
+                "value": 0,
+                "message": f"処理中: {self.display_name} (まとめて実行)",
+                "original_path": self.filepath,
+            }
+        )
+        self._warm_up_database()
+
+        # まとめる際に各ファイルを1回だけ読むので、ステージング中もクエリはコピーしない
+        self._make_work_dir()
+        query_path = os.path.join(self.work_dir, "packed.fasta")
+        record_counts = pack_fasta(self.filepaths, query_path)
+
+        # qseqid 付きの中間結果から、ファイルごとの結果に振り分ける
+        raw_output = os.path.join(self.work_dir, "raw_result.tsv")
+        runs, chunk_outputs = self._plan_runs(query_path, raw_output, keep_qseqid=True)
+        return {
+            "runs": runs,
+            "chunk_outputs": chunk_outputs,
+            "blast_output": raw_output,
+            "record_counts": record_counts,
+            "summary": summary_settings_from_config(self.config),
+        }
+
+    def _complete(self, plan):
+        """結果をファイルごとに振り分け、ファイルごとに移動・完了を通知する"""
+        if plan["chunk_outputs"] and not self.terminated:
+            self._merge_chunks(plan["chunk_outputs"], plan["blast_output"])
+        if self.terminated:
+            return
+
+        split_packed_results(
+            plan["blast_output"], [self._result_path(filepath) for filepath in self.filepaths]
+        )
+        summaries = []
+        if plan["summary"] is not None:
+            summaries = self._summarize(plan)
+        self._publish_results()
+        self._write_summaries(summaries, plan["summary"])
+        self._write_columnar()
+
+        self._release_work_dir()
+
+        # 1回の blastn の計測値を、まとめた全てのファイルに添える (run_id が共通)
+        metrics = self._job_metrics()
+        for filepath in self.filepaths:
+            self._move_to_processed(filepath)
+            self._record_done(filepath)
+            self.queue.put(
+                {
+                    "type": "file_done",
+                    "original_path": filepath,
+                    "packed": len(self.filepaths),
+                    "metrics": dict(metrics),
+                }
+            )
+
+    def _summarize(self, plan):
+        """
+        qseqid (p<ファイル番号>_<レコード番号>) でファイルごとに最良ヒットを集計する
+        (失敗しても解析は成功扱い)。
+
+        Returns:
+            list[tuple[str, SampleSummary]]: (元のファイル, 集計)
+        """
+        settings = plan["summary"]
+        summaries = []
+        try:
+            for filepath, record_count in zip(self.filepaths, plan["record_counts"]):
+                best_hits_path = (
+                    f"{filepath}{BEST_HITS_SUFFIX}" if settings["best_hits"] else None
+                )
+                summaries.append(SampleSummary(record_count, best_hits_path))
+            # 最良ヒットのファイルには元のクエリIDを書く (必要になったファイルだけ読む)
+            query_ids = {}
+            for qseqid, assignment in self._iter_best_hits(plan["blast_output"], settings):
+                separator = qseqid.index(b"_")
+                file_index = int(qseqid[1:separator])  # "p3_17" -> 3
+                query_id = None
+                if settings["best_hits"]:
+                    if file_index not in query_ids:
+                        query_ids[file_index] = read_query_ids(self.filepaths[file_index])
+                    query_id = query_ids[file_index][int(qseqid[separator + 1 :])]
+                summaries[file_index].add(assignment, query_id)
+        except (OSError, ValueError, IndexError) as e:
+            print(f"結果の集計中にエラー ({self.display_name}): {e}")
+            for summary in summaries:
+                summary.abort()
+            return []
+        return list(zip(self.filepaths, summaries))
+
+    def _handle_failure(self, error):
+        """
+        blastn 自体が失敗した場合 (CalledProcessError) は、どのファイルが原因か
+        分からないので、1ファイルずつ通常の BlastWorker で (このマシンで) 実行し直す。
+        それ以外 (blastn が見つからない・エージェントを見失ったなど) は
+        まとめた全てのファイルに共通の問題なので、1回の失敗として通知する。
+        """
+        if not isinstance(error, subprocess.CalledProcessError):
+            return super()._handle_failure(error)
+        print(f"まとめての実行に失敗したため、1ファイルずつ実行し直します: {error}")
+        workers = []
+        for filepath in self.filepaths:
+            worker = BlastWorker(filepath, self.queue, self.config, self.journal, self.num_threads)
+            worker.cache = self.cache
+            workers.append(worker)
+        return workers
+
+    def _post_error(self, message):
+        """同じエラーを、まとめた全てのファイル (通知済みのものを除く) に通知する"""
+        message.setdefault("metrics", self._job_metrics())
+        for filepath in self.filepaths:
+            if filepath in self._reported_paths:
+                continue
+            super()._post_error(
+                dict(message, original_path=filepath, metrics=dict(message["metrics"]))
+            )
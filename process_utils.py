@@ -0,0 +1,95 @@
+# process_utils.py
+import os
+import signal
+import subprocess
+import sys
+import threading
+
+# 終了要求 (SIGTERM) の後、強制終了 (SIGKILL) に切り替えるまでの猶予 (秒)
+KILL_GRACE_SEC = 5.0
+
+
+def blastn_executable(blast_path):
+    """
+    BLAST+ binフォルダから blastn 実行ファイルのフルパスを返す。
+    Windowsでは blastn.exe、Linux/macOS では拡張子なしの blastn を使う。
+    """
+    exe_name = "blastn.exe" if sys.platform == "win32" else "blastn"
+    return os.path.join(blast_path, exe_name)
+
+
+def popen_platform_kwargs():
+    """
+    サブプロセス起動時のプラットフォーム依存の引数を返す。
+    (C-4) Windowsではコンソールウィンドウを隠し、新しいプロセスグループで起動する。
+    Linux/macOS では新しいセッション (プロセスグループ) で起動し、
+    kill_process_tree で子孫のプロセスまでまとめて終了できるようにする。
+    """
+    if sys.platform == "win32":
+        return {
+            "creationflags": subprocess.CREATE_NO_WINDOW
+            | subprocess.CREATE_NEW_PROCESS_GROUP
+        }
+    return {"start_new_session": True}
+
+
+def kill_process_tree(process, grace_sec=KILL_GRACE_SEC):
+    """
+    popen_platform_kwargs() で起動したプロセスを、子孫のプロセスも含めて終了する。
+
+    Linux/macOS ではプロセスグループに SIGTERM を送り、grace_sec 後にまだ残っていれば
+    SIGKILL を送る (待つのは別スレッドなので呼び出し元はブロックしない)。
+    Windows では taskkill /T /F でプロセスツリーを強制終了する
+    (失敗した場合は本体だけを kill() する)。grace_sec が 0 なら最初から強制終了する。
+
+    Args:
+        process (subprocess.Popen): 終了するプロセス
+        grace_sec (float): 強制終了に切り替えるまでの猶予 (秒)
+    """
+    if process.pid is None:
+        # エージェントで実行中 (agent_pool.RemoteProcess)。接続を切るとエージェントが終了させる
+        process.kill()
+        return
+    if sys.platform == "win32":
+        try:
+            subprocess.run(
+                ["taskkill", "/F", "/T", "/PID", str(process.pid)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                creationflags=subprocess.CREATE_NO_WINDOW,
+            )
+        except OSError as e:
+            print(f"taskkill の実行中にエラー: {e}")
+        if process.poll() is None:
+            process.kill()
+        return
+
+    # start_new_session で起動したので、プロセスグループID = PID
+    pgid = process.pid
+    if grace_sec <= 0:
+        _signal_group(pgid, signal.SIGKILL)
+        return
+    _signal_group(pgid, signal.SIGTERM)
+    # 本体が先に終わっても孫プロセスが残っていることがあるので、グループごと SIGKILL する。
+    # (非デーモンのタイマーなので、アプリの終了直後でも強制終了まで行われる)
+    timer = threading.Timer(grace_sec, _signal_group, args=(pgid, signal.SIGKILL))
+    timer.start()
+
+
+def _signal_group(pgid, sig):
+    try:
+        os.killpg(pgid, sig)
+    except ProcessLookupError:
+        pass  # 既にグループのプロセスが全て終了している
+    except OSError as e:
+        print(f"プロセスグループ {pgid} へのシグナル送信中にエラー: {e}")
+
+
+def drain_stream(stream, tail):
+    """
+    パイプを最後まで読み続け、デコードした行を tail (maxlen 付きの deque) に残す。
+    パイプが詰まって子プロセスが止まらないよう、別スレッドで実行する。
+    """
+    for line in stream:
+        tail.append(line.decode("utf-8", errors="replace"))
+    stream.close()
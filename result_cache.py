@@ -0,0 +1,202 @@
+# result_cache.py
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+
+from blast_db import db_fingerprint
+
+# 結果に影響しない (ファイルごとに変わる) オプションは、キャッシュキーから除外する
+_VOLATILE_OPTIONS = ("-query", "-out", "-num_threads")
+
+
+def file_digest(filepath, chunk_size=1024 * 1024):
+    """ファイル内容の SHA-256 をストリーミングで計算する"""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_cache_key(query_path, blast_command, db_path, db_name):
+    """
+    キャッシュキーを作る。
+    クエリの内容ハッシュ + DBの指紋 + BLASTオプション (+ blastn 実行ファイルの情報)
+
+    Args:
+        query_path (str): クエリのFASTAファイル
+        blast_command (list[str]): _build_blast_command が返すコマンド
+        db_path (str): DBフォルダ
+        db_name (str): DB名
+    """
+    options = []
+    args = blast_command[1:]
+    i = 0
+    while i < len(args):
+        if args[i] in _VOLATILE_OPTIONS:
+            i += 2  # オプションと値を読み飛ばす
+            continue
+        options.append(args[i])
+        i += 1
+
+    # blastn のバージョンが変われば結果も変わり得るので、実行ファイルの情報も含める
+    blastn_exe = blast_command[0]
+    try:
+        stat = os.stat(blastn_exe)
+        exe_info = [stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        exe_info = []
+
+    key_source = {
+        "query": file_digest(query_path),
+        "db": db_fingerprint(db_path, db_name),
+        "options": options,
+        "blastn": exe_info,
+    }
+    return hashlib.sha256(
+        json.dumps(key_source, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+class ResultCache:
+    """
+    BLAST結果 (_result.csv) のディスクキャッシュ。
+    SQLite のインデックスと、cache_dir/blobs 以下の結果ファイルで構成する。
+    合計サイズが上限を超えたら、最後に使われた時刻の古いものから削除する (LRU)。
+
+    複数のワーカースレッドから使われるので、SQLite 接続は操作ごとに開く。
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.blob_dir = os.path.join(cache_dir, "blobs")
+        self.index_path = os.path.join(cache_dir, "index.sqlite3")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS entries_last_access "
+                "ON entries (last_access)"
+            )
+
+    @classmethod
+    def from_config(cls, config, config_path):
+        """
+        [CACHE] 設定からキャッシュを作る。無効な場合は None を返す。
+        相対パスの directory は config.ini のあるフォルダを基準にする
+        (GUI・CLI・監視を別のフォルダから起動しても同じキャッシュを使う)。
+        """
+        if not config.getboolean("CACHE", "enabled", fallback=False):
+            return None
+        cache_dir = config.get("CACHE", "directory", fallback="blast_cache")
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(config_path)), cache_dir)
+        max_size_mb = config.getint("CACHE", "max_size_mb", fallback=2048)
+        return cls(cache_dir, max_size_mb * 1024 * 1024)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """トランザクションを確定してから接続を閉じるコンテキストマネージャ"""
+        conn = sqlite3.connect(self.index_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _blob_path(self, key):
+        return os.path.join(self.blob_dir, key[:2], key)
+
+    def lookup(self, key, dest_path):
+        """
+        キャッシュにあれば結果を dest_path にコピーする。
+
+        Returns:
+            bool: ヒットした場合は True
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return False
+
+            blob_path = self._blob_path(key)
+            if not os.path.exists(blob_path):
+                # 結果ファイルが消えていればインデックスからも削除してミス扱い
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return False
+
+            conn.execute(
+                "UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+
+        # 書きかけの結果が見えないよう、一時ファイルにコピーしてから置き換える
+        tmp_path = f"{dest_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            shutil.copyfile(blob_path, tmp_path)
+        except FileNotFoundError:
+            return False  # コピー直前に他のスレッドが追い出した場合
+        os.replace(tmp_path, dest_path)
+        return True
+
+    def store(self, key, result_path):
+        """結果ファイルをキャッシュに登録し、上限を超えていれば古いものを削除する"""
+        blob_path = self._blob_path(key)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        tmp_path = f"{blob_path}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(result_path, tmp_path)
+        os.replace(tmp_path, blob_path)
+
+        size = os.path.getsize(blob_path)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, size, created, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (key, size, now, now),
+            )
+        self.evict()
+
+    def evict(self):
+        """合計サイズが上限以下になるまで、最後に使われた時刻の古いものから削除する"""
+        with self._connect() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = conn.execute(
+                "SELECT key, size FROM entries ORDER BY last_access"
+            ).fetchall()
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                try:
+                    os.remove(self._blob_path(key))
+                except OSError:
+                    pass
+                total -= size
+
+
+def open_result_cache(config, config_path):
+    """
+    [CACHE] が有効ならキャッシュを開く。開けない場合は警告を表示し、
+    キャッシュを使わずに解析を続ける (キャッシュの障害で解析を止めない)。
+
+    Returns:
+        ResultCache | None: キャッシュ (無効・開けない場合は None)
+    """
+    try:
+        return ResultCache.from_config(config, config_path)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"結果キャッシュを開けません。キャッシュを使わずに解析します: {e}")
+        return None
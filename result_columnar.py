@@ -0,0 +1,339 @@
+# result_columnar.py
+"""
+<file>_result.csv を、圧縮した列指向の <file>_result.bnc に変換する・読む。
+
+outfmt 6 の行は ssciname / stitle の長い文字列をヒットごとに繰り返すため、
+ref_prok_rep_genomes の結果は大きく、後段での読み込みも遅い。.bnc では
+
+- sacc / ssciname / stitle は辞書で符号化し、行ごとには符号 (uint32) だけを持つ
+  (辞書はファイル全体で共有し、各ブロックにはそのブロックで初めて出た文字列だけを書く)
+- pident は float32、staxid は int32 の列 (staxid の "N/A" は 0、複数の taxid は先頭の値)
+- block_rows 行ごとのブロックを zlib で圧縮する
+
+書き込みは1ブロック分の列と辞書だけをメモリに持つので、結果の大きさによらず
+メモリ使用量は一定 (辞書の大きさは異なるアクセッション・学名の数で決まる)。
+
+ファイルの形式 (数値はリトルエンディアン):
+    MAGIC
+    ブロック: "<II" (行数, 圧縮後のバイト数) + zlib で圧縮した
+        pident (float32 × 行数) + staxid (int32 × 行数) +
+        文字列の列ごとに "<II" (新しい文字列の数, バイト数) + "\n" 区切りの新しい文字列 +
+        符号 (uint32 × 行数)
+"""
+import array
+import itertools
+import operator
+import os
+import struct
+import sys
+import zlib
+
+from blast_results import parse_staxid
+
+MAGIC = b"BNCOL1\n"
+# <file>_result.csv に対応する列指向の結果ファイルの接尾辞
+COLUMNAR_SUFFIX = "_result.bnc"
+# 1ブロックの行数 (書き込み中にメモリに持つ行数)
+DEFAULT_BLOCK_ROWS = 65536
+# 辞書で符号化する列 (RESULT_FIELDS の順)
+STRING_COLUMNS = ("sacc", "ssciname", "stitle")
+
+_BLOCK_HEADER = struct.Struct("<II")
+_DICTIONARY_HEADER = struct.Struct("<II")
+_BIG_ENDIAN = sys.byteorder == "big"
+
+
+def columnar_settings_from_config(config):
+    """
+    [COLUMNAR] 設定を読む。
+
+    Returns:
+        dict | None: keep_csv / block_rows / compress_level (無効な場合は None)
+    """
+    if not config.getboolean("COLUMNAR", "enabled", fallback=False):
+        return None
+    return {
+        "keep_csv": config.getboolean("COLUMNAR", "keep_csv", fallback=True),
+        "block_rows": config.getint("COLUMNAR", "block_rows", fallback=DEFAULT_BLOCK_ROWS),
+        "compress_level": config.getint("COLUMNAR", "compress_level", fallback=1),
+    }
+
+
+def _to_bytes(values):
+    """array をリトルエンディアンのバイト列にする"""
+    if _BIG_ENDIAN:
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(typecode, data):
+    values = array.array(typecode)
+    values.frombytes(data)
+    if _BIG_ENDIAN:
+        values.byteswap()
+    return values
+
+
+class ColumnarWriter:
+    """
+    outfmt 6 の行 (RESULT_FIELDS の順) を1行ずつ受け取り、.bnc に書く。
+    一時ファイルに書き、close() で path に置き換えるので、書きかけのファイルは残らない。
+
+    with 文で使うと、例外で抜けたときは一時ファイルを削除する。
+    """
+
+    def __init__(self, path, block_rows=DEFAULT_BLOCK_ROWS, compress_level=1):
+        self.path = path
+        self.block_rows = max(1, block_rows)
+        self.compress_level = compress_level
+        self.rows = 0
+        self._temp_path = f"{path}.tmp"
+        self._file = open(self._temp_path, "wb")
+        self._file.write(MAGIC)
+        self._dictionaries = [{} for _ in STRING_COLUMNS]  # 文字列 (bytes) -> 符号
+        self._lines = []  # まだブロックにしていない行
+
+    def write_line(self, line):
+        """
+        1行を追加する (block_rows 行溜まったらブロックとして書く)。
+
+        Args:
+            line (bytes): タブ区切りの1行 (pident sacc staxid ssciname stitle)
+
+        Raises:
+            ValueError: 列が足りない、または pident が数値でない
+        """
+        self._lines.append(line)
+        if len(self._lines) >= self.block_rows:
+            self._flush_block()
+
+    def write_lines(self, lines):
+        """行の iterable (ファイルなど) を追加する。1行ずつ write_line を呼ぶより速い"""
+        lines = iter(lines)
+        while True:
+            self._lines.extend(itertools.islice(lines, self.block_rows - len(self._lines)))
+            if len(self._lines) < self.block_rows:
+                return
+            self._flush_block()
+
+    def _flush_block(self):
+        """溜まった行を列ごとにまとめて符号化し、1ブロックとして書く"""
+        if not self._lines:
+            return
+        lines = self._lines
+        self._lines = []
+        # ブロック全体を1回で分割し、5列ごとのスライスで列を取り出す
+        # (outfmt 6 の値にはタブが含まれないので、空行がなければ行数 × 5 個に分かれるはず)
+        fields = b"\t".join(map(bytes.rstrip, lines, itertools.repeat(b"\r\n"))).split(b"\t")
+        if len(fields) != 5 * len(lines) or b"\n" in lines or b"\r\n" in lines:
+            fields = self._split_lines_strictly(lines)
+        num_rows = len(fields) // 5
+        if not num_rows:
+            return
+        pident, sacc, staxid, ssciname, stitle = (fields[column::5] for column in range(5))
+
+        parts = [_to_bytes(array.array("f", map(float, pident)))]
+        try:
+            staxid = array.array("i", map(int, staxid))
+        except ValueError:
+            staxid = array.array("i", map(parse_staxid, staxid))  # "N/A" や複数の taxid がある
+        parts.append(_to_bytes(staxid))
+        for dictionary, values in zip(self._dictionaries, (sacc, ssciname, stitle)):
+            codes = list(map(dictionary.get, values))
+            new_strings = []
+            if None in codes:
+                # このブロックで初めて出た文字列に、出た順に次の符号を付ける
+                missing = itertools.compress(
+                    values, map(operator.is_, codes, itertools.repeat(None))
+                )
+                new_strings = list(dict.fromkeys(missing))
+                dictionary.update(zip(new_strings, itertools.count(len(dictionary))))
+                codes = map(dictionary.__getitem__, values)
+            codes = array.array("I", codes)
+            joined = b"\n".join(new_strings)
+            parts.append(_DICTIONARY_HEADER.pack(len(new_strings), len(joined)))
+            parts.append(joined)
+            parts.append(_to_bytes(codes))
+        compressed = zlib.compress(b"".join(parts), self.compress_level)
+        self._file.write(_BLOCK_HEADER.pack(num_rows, len(compressed)))
+        self._file.write(compressed)
+        self.rows += num_rows
+
+    @staticmethod
+    def _split_lines_strictly(lines):
+        """
+        空行を飛ばしながら1行ずつ分割する (列の数が合わないブロックだけに使う)。
+
+        Returns:
+            list[bytes]: 行ごとの5列を並べたもの
+
+        Raises:
+            ValueError: 列が5つでない行がある
+        """
+        fields = []
+        for line in lines:
+            row = line.rstrip(b"\r\n").split(b"\t", 4)
+            if row == [b""]:
+                continue
+            if len(row) < 5:
+                raise ValueError(f"結果の行の列が足りません: {line!r:.200}")
+            fields.extend(row)
+        return fields
+
+    def close(self):
+        """残りの行を書き、path に置き換える"""
+        try:
+            self._flush_block()
+        except BaseException:
+            self.abort()
+            raise
+        self._file.close()
+        os.replace(self._temp_path, self.path)
+
+    def abort(self):
+        """書きかけの一時ファイルを削除する"""
+        self._file.close()
+        try:
+            os.remove(self._temp_path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def convert_csv(csv_path, columnar_path, block_rows=DEFAULT_BLOCK_ROWS, compress_level=1):
+    """
+    <file>_result.csv を1行ずつ読み、.bnc に書く。
+
+    Returns:
+        int: 書いた行数
+    """
+    with open(csv_path, "rb") as f, ColumnarWriter(
+        columnar_path, block_rows=block_rows, compress_level=compress_level
+    ) as writer:
+        writer.write_lines(f)
+    return writer.rows
+
+
+def iter_blocks(path):
+    """
+    .bnc をブロックごとに読む。
+
+    Yields:
+        tuple[dict, list[list[str]]]: (このブロックの列, 文字列の列ごとの辞書)。
+        列は pident (array 'f') / staxid (array 'i') / sacc・ssciname・stitle (符号の array 'I')。
+        辞書はファイル全体で共有し、読み進めるごとに同じリストに追記する
+
+    Raises:
+        ValueError: .bnc のファイルでない、または壊れている
+    """
+    dictionaries = [[] for _ in STRING_COLUMNS]
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"列指向の結果ファイルではありません: {path}")
+        while True:
+            header = f.read(_BLOCK_HEADER.size)
+            if not header:
+                return
+            if len(header) != _BLOCK_HEADER.size:
+                raise ValueError(f"結果ファイルが途中で切れています: {path}")
+            num_rows, size = _BLOCK_HEADER.unpack(header)
+            try:
+                data = zlib.decompress(f.read(size))
+            except zlib.error as e:
+                raise ValueError(f"結果ファイルが壊れています: {path} ({e})") from e
+            offset = 0
+            columns = {}
+            for name, typecode in (("pident", "f"), ("staxid", "i")):
+                end = offset + 4 * num_rows
+                columns[name] = _from_bytes(typecode, data[offset:end])
+                offset = end
+            for name, dictionary in zip(STRING_COLUMNS, dictionaries):
+                count, length = _DICTIONARY_HEADER.unpack_from(data, offset)
+                offset += _DICTIONARY_HEADER.size
+                if count:
+                    dictionary.extend(
+                        data[offset : offset + length].decode("utf-8", errors="replace").split("\n")
+                    )
+                offset += length
+                end = offset + 4 * num_rows
+                columns[name] = _from_bytes("I", data[offset:end])
+                offset = end
+            yield columns, dictionaries
+
+
+def read_columns(path):
+    """
+    .bnc の全ての列を読む (文字列の列は符号のまま。辞書で引いて使う)。
+
+    Returns:
+        dict: pident / staxid / sacc / ssciname / stitle の array と、
+        dictionaries (列名 -> 文字列のリスト)
+    """
+    columns = {"pident": array.array("f"), "staxid": array.array("i")}
+    columns.update((name, array.array("I")) for name in STRING_COLUMNS)
+    dictionaries = [[] for _ in STRING_COLUMNS]
+    for block, dictionaries in iter_blocks(path):
+        for name, values in block.items():
+            columns[name].extend(values)
+    columns["dictionaries"] = dict(zip(STRING_COLUMNS, dictionaries))
+    return columns
+
+
+def iter_rows(path):
+    """
+    .bnc を1行ずつ読む (ブロックごとに読むので、メモリ使用量はブロックの大きさ程度)。
+
+    Yields:
+        tuple[float, str, int, str, str]: (pident (小数3桁), sacc, staxid, ssciname, stitle)
+    """
+    for block, (saccs, sscinames, stitles) in iter_blocks(path):
+        # float32 の pident を、blastn の出力と同じ小数3桁の値に戻す
+        pidents = map(round, block["pident"], itertools.repeat(3))
+        for pident, sacc, staxid, ssciname, stitle in zip(
+            pidents, block["sacc"], block["staxid"], block["ssciname"], block["stitle"]
+        ):
+            yield pident, saccs[sacc], staxid, sscinames[ssciname], stitles[stitle]
+
+
+def write_csv(columnar_path, csv_path):
+    """
+    .bnc を outfmt 6 のタブ区切りに戻す (pident は blastn と同じ小数3桁、staxid の 0 は "N/A")。
+    staxid は .bnc に整数で持つため、複数の taxid が並んでいた行は先頭の taxid だけになる。
+
+    Returns:
+        int: 書いた行数
+    """
+    rows = 0
+    with open(csv_path, "w", encoding="utf-8", newline="\n") as out:
+        for pident, sacc, staxid, ssciname, stitle in iter_rows(columnar_path):
+            out.write(f"{pident:.3f}\t{sacc}\t{staxid or 'N/A'}\t{ssciname}\t{stitle}\n")
+            rows += 1
+    return rows
+
+
+def main(argv=None):
+    """python result_columnar.py 結果.bnc [出力.csv]: .bnc を CSV に戻す (省略時は標準出力)"""
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or len(argv) > 2:
+        print("使い方: python result_columnar.py <file>_result.bnc [出力.csv]", file=sys.stderr)
+        return 2
+    if len(argv) == 2:
+        write_csv(argv[0], argv[1])
+    else:
+        for pident, sacc, staxid, ssciname, stitle in iter_rows(argv[0]):
+            sys.stdout.write(f"{pident:.3f}\t{sacc}\t{staxid or 'N/A'}\t{ssciname}\t{stitle}\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,531 @@
+# result_index.py
+"""
+全ての解析結果 (<file>_result.csv または列指向の <file>_result.bnc) を1つの SQLite に
+取り込み、検索できるようにする。
+
+「taxid X に 97% 以上でヒットしたサンプルは?」のような問い合わせのために、
+何千もの結果ファイルを grep しなくて済むよう、完了した結果を順に取り込む。
+
+- サンプル (結果ファイル)・アクセッション (sacc と stitle)・分類 (staxid と ssciname) は
+  それぞれの表に1回だけ格納し (文字列のインターン)、ヒットの表は整数と pident だけを持つ。
+- ヒットの表は (staxid, pident)・(アクセッション, pident)・pident・サンプルで索引を作る。
+  学名での検索は分類の表で staxid に置き換えてから索引を使う。
+- 取り込みはインクリメンタル: 結果ファイルの大きさと更新時刻が前回と同じなら読まない。
+  変わっていれば、そのサンプルのヒットを入れ替える。
+- 行は INDEX_BATCH_ROWS 行ずつ executemany で挿入し、小さなファイルはまとめて
+  1トランザクションで確定する (ファイルの途中で確定することはない)。
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from blast_results import RESULT_FIELDS, parse_staxid
+from result_columnar import COLUMNAR_SUFFIX, iter_rows
+
+# executemany に一度に渡す行数 / 1トランザクションで確定する目安の行数
+INDEX_BATCH_ROWS = 50000
+# インターンした文字列の ID をメモリに保持する最大件数 (超えたら捨てて引き直す)
+INTERN_CACHE_LIMIT = 1000000
+CSV_SUFFIX = "_result.csv"
+# SQLite のページキャッシュ (KiB)。索引のページが追い出されないよう既定の 2MB より大きくする
+INDEX_CACHE_KIB = 256 * 1024
+# 検索結果の既定の最大件数
+DEFAULT_SEARCH_LIMIT = 1000
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS samples ("
+    "id INTEGER PRIMARY KEY, name TEXT NOT NULL, result_path TEXT NOT NULL UNIQUE, "
+    "size INTEGER, mtime_ns INTEGER, rows INTEGER, ingested_at REAL)",
+    "CREATE TABLE IF NOT EXISTS accessions ("
+    "id INTEGER PRIMARY KEY, sacc TEXT NOT NULL UNIQUE, stitle TEXT)",
+    "CREATE TABLE IF NOT EXISTS taxa ("
+    "id INTEGER PRIMARY KEY, staxid INTEGER NOT NULL, ssciname TEXT NOT NULL, "
+    "UNIQUE (staxid, ssciname))",
+    "CREATE TABLE IF NOT EXISTS hits ("
+    "sample_id INTEGER NOT NULL, pident REAL NOT NULL, accession_id INTEGER NOT NULL, "
+    "taxon_id INTEGER NOT NULL, staxid INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS hits_staxid ON hits (staxid, pident)",
+    "CREATE INDEX IF NOT EXISTS hits_accession ON hits (accession_id, pident)",
+    "CREATE INDEX IF NOT EXISTS hits_pident ON hits (pident)",
+    "CREATE INDEX IF NOT EXISTS hits_sample ON hits (sample_id)",
+    "CREATE INDEX IF NOT EXISTS taxa_ssciname ON taxa (ssciname)",
+)
+
+
+def index_path_from_config(config, config_path, required=False):
+    """
+    [RESULT_INDEX] 設定から索引ファイルのパスを返す。
+    相対パスは config.ini のあるフォルダを基準にする。
+
+    Args:
+        required (bool): True なら enabled でなくてもパスを返す (index / search コマンド)
+
+    Returns:
+        str | None: 索引ファイルのパス (無効な場合は None)
+    """
+    if not required and not config.getboolean("RESULT_INDEX", "enabled", fallback=False):
+        return None
+    filename = config.get("RESULT_INDEX", "filename", fallback="result_index.sqlite3")
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), filename)
+
+
+def find_result_files(paths):
+    """
+    フォルダ (サブフォルダも含む) と結果ファイルのパスから、結果ファイルを列挙する。
+    同じサンプルの <file>_result.csv と <file>_result.bnc がある場合は、読むのが速い .bnc を使う。
+
+    Returns:
+        list[str]: 結果ファイルの絶対パス (パス順)
+    """
+    result_files = []
+    for path in paths:
+        if os.path.isfile(path):
+            result_files.append(os.path.abspath(path))
+            continue
+        for root, _, filenames in os.walk(path):
+            names = set(filenames)
+            result_files.extend(
+                os.path.join(os.path.abspath(root), filename)
+                for filename in filenames
+                if filename.endswith(COLUMNAR_SUFFIX)
+                or (
+                    filename.endswith(CSV_SUFFIX)
+                    and filename[: -len(CSV_SUFFIX)] + COLUMNAR_SUFFIX not in names
+                )
+            )
+    return sorted(result_files)
+
+
+def result_path_for(filepath):
+    """解析した FASTA の結果ファイルのパスを返す (.bnc があればそちら)"""
+    columnar_path = f"{filepath}{COLUMNAR_SUFFIX}"
+    return columnar_path if os.path.exists(columnar_path) else f"{filepath}{CSV_SUFFIX}"
+
+
+def _split_result_path(result_path):
+    """結果ファイルのパスを (解析した FASTA のパス, 接尾辞) に分ける (接尾辞がなければ "")"""
+    for suffix in (CSV_SUFFIX, COLUMNAR_SUFFIX):
+        if result_path.endswith(suffix):
+            return result_path[: -len(suffix)], suffix
+    return result_path, ""
+
+
+def sample_name_for(result_path):
+    """結果ファイルのパスから、サンプル名 (解析した FASTA のファイル名) を返す"""
+    return os.path.basename(_split_result_path(result_path)[0])
+
+
+def _iter_csv_rows(result_path):
+    """<file>_result.csv の行を (pident, sacc, staxid, ssciname, stitle) にして返す"""
+    with open(result_path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t", 4)
+            if len(fields) < 5:
+                continue  # 列の足りない行 (書きかけなど) は飛ばす
+            pident, sacc, staxid, ssciname, stitle = fields
+            try:
+                pident = float(pident)
+            except ValueError:
+                continue
+            yield pident, sacc, parse_staxid(staxid), ssciname, stitle
+
+
+def _iter_result_rows(result_path):
+    if result_path.endswith(COLUMNAR_SUFFIX):
+        return iter_rows(result_path)
+    return _iter_csv_rows(result_path)
+
+
+class ResultIndex:
+    """
+    結果の索引 (SQLite)。取り込みは1つのスレッド (IndexWriter または CLI) から行い、
+    検索はどのスレッドからでもよい (呼び出しごとに接続を開く)。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # インターンした文字列 -> ID。complete なら表の全件を持っている (引き直さずに登録できる)
+        self._accession_ids = {}
+        self._taxon_ids = {}
+        self._interned_complete = False
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{INDEX_CACHE_KIB}")
+        return conn
+
+    # --- 取り込み ---
+    def ingest(self, result_files):
+        """
+        結果ファイルを取り込む (前回から変わっていないファイルは読まない)。
+
+        Args:
+            result_files (Iterable[str | tuple[str, str]]): 結果ファイルのパス、
+                または (結果ファイルのパス, サンプル名) (省略時はファイル名から決める)
+
+        Returns:
+            dict: files (調べたファイル数), ingested (取り込んだファイル数),
+            skipped (変わっていなかったファイル数), missing (見つからなかったファイル数),
+            failed (読めなかったファイル数), rows (取り込んだ行数), seconds (かかった秒数)
+        """
+        started = time.monotonic()
+        report = {"files": 0, "ingested": 0, "skipped": 0, "missing": 0, "failed": 0, "rows": 0}
+        conn = self._connect()
+        try:
+            self._load_interned(conn)
+            pending_rows = 0
+            conn.execute("BEGIN")
+            for item in result_files:
+                result_path, name = item if isinstance(item, tuple) else (item, None)
+                report["files"] += 1
+                try:
+                    stat = os.stat(result_path)
+                except OSError:
+                    report["missing"] += 1
+                    continue
+                # 壊れたファイルはそのファイルの分だけ取り消し、残りの取り込みを続ける
+                conn.execute("SAVEPOINT result_file")
+                try:
+                    rows = self._ingest_file(
+                        conn, result_path, name or sample_name_for(result_path), stat
+                    )
+                except (OSError, ValueError) as e:
+                    conn.execute("ROLLBACK TO result_file")
+                    conn.execute("RELEASE result_file")
+                    self._accession_ids = {}  # 取り消した ID を使わない
+                    self._taxon_ids = {}
+                    self._interned_complete = False
+                    print(f"結果ファイルを取り込めません: {result_path} ({e})")
+                    report["failed"] += 1
+                    continue
+                conn.execute("RELEASE result_file")
+                if rows is None:
+                    report["skipped"] += 1
+                    continue
+                report["ingested"] += 1
+                report["rows"] += rows
+                pending_rows += rows
+                if pending_rows >= INDEX_BATCH_ROWS:
+                    conn.execute("COMMIT")
+                    conn.execute("BEGIN")
+                    pending_rows = 0
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            self._accession_ids = {}  # ロールバックした ID を使わない
+            self._taxon_ids = {}
+            self._interned_complete = False
+            raise
+        finally:
+            conn.close()
+        report["seconds"] = time.monotonic() - started
+        return report
+
+    def _ingest_file(self, conn, result_path, name, stat):
+        """
+        1つの結果ファイルを (呼び出し元のトランザクションの中で) 取り込む。
+
+        Returns:
+            int | None: 取り込んだ行数 (前回から変わっていなければ None)
+        """
+        row = conn.execute(
+            "SELECT id, size, mtime_ns FROM samples WHERE result_path = ?", (result_path,)
+        ).fetchone()
+        if row is not None and (row[1], row[2]) == (stat.st_size, stat.st_mtime_ns):
+            return None
+        # 同じサンプルをもう一方の形式 (.csv / .bnc) で取り込んでいれば、置き換える
+        base, suffix = _split_result_path(result_path)
+        if suffix:
+            other_suffix = COLUMNAR_SUFFIX if suffix == CSV_SUFFIX else CSV_SUFFIX
+            other = conn.execute(
+                "SELECT id FROM samples WHERE result_path = ?", (base + other_suffix,)
+            ).fetchone()
+            if other is not None:
+                conn.execute("DELETE FROM hits WHERE sample_id = ?", (other[0],))
+                conn.execute("DELETE FROM samples WHERE id = ?", (other[0],))
+        if row is not None:
+            sample_id = row[0]
+            conn.execute("DELETE FROM hits WHERE sample_id = ?", (sample_id,))
+        else:
+            sample_id = conn.execute(
+                "INSERT INTO samples (name, result_path) VALUES (?, ?)", (name, result_path)
+            ).lastrowid
+
+        num_rows = 0
+        batch = []
+        insert = (
+            "INSERT INTO hits (sample_id, pident, accession_id, taxon_id, staxid) "
+            "VALUES (?, ?, ?, ?, ?)"
+        )
+        for pident, sacc, staxid, ssciname, stitle in _iter_result_rows(result_path):
+            batch.append(
+                (
+                    sample_id,
+                    pident,
+                    self._accession_id(conn, sacc, stitle),
+                    self._taxon_id(conn, staxid, ssciname),
+                    staxid,
+                )
+            )
+            if len(batch) >= INDEX_BATCH_ROWS:
+                conn.executemany(insert, batch)
+                num_rows += len(batch)
+                batch = []
+        if batch:
+            conn.executemany(insert, batch)
+            num_rows += len(batch)
+
+        conn.execute(
+            "UPDATE samples SET name = ?, size = ?, mtime_ns = ?, rows = ?, ingested_at = ? "
+            "WHERE id = ?",
+            (name, stat.st_size, stat.st_mtime_ns, num_rows, time.time(), sample_id),
+        )
+        return num_rows
+
+    def _load_interned(self, conn):
+        """登録済みのアクセッションと分類の ID を全件読み込む (INTERN_CACHE_LIMIT 件以下の場合)"""
+        if self._interned_complete:
+            return
+        accessions = conn.execute("SELECT COUNT(*) FROM accessions").fetchone()[0]
+        taxa = conn.execute("SELECT COUNT(*) FROM taxa").fetchone()[0]
+        if max(accessions, taxa) > INTERN_CACHE_LIMIT:
+            return
+        self._accession_ids = dict(conn.execute("SELECT sacc, id FROM accessions"))
+        self._taxon_ids = {
+            (staxid, ssciname): taxon_id
+            for taxon_id, staxid, ssciname in conn.execute("SELECT id, staxid, ssciname FROM taxa")
+        }
+        self._interned_complete = True
+
+    def _intern(self, conn, cache, key, insert, select, params):
+        """
+        key の ID を返す (なければ登録する)。キャッシュが全件を持っていれば INSERT の1回で済む。
+        (他のプロセスが同じ索引に登録していた場合は、INSERT が無視されるので引き直す)
+        """
+        if len(cache) >= INTERN_CACHE_LIMIT:
+            cache.clear()
+            self._interned_complete = False
+        cursor = conn.execute(insert, params)
+        if self._interned_complete and cursor.rowcount == 1:
+            cache[key] = cursor.lastrowid
+        else:
+            select_params = key if isinstance(key, tuple) else (key,)
+            cache[key] = conn.execute(select, select_params).fetchone()[0]
+        return cache[key]
+
+    def _accession_id(self, conn, sacc, stitle):
+        """アクセッションの ID を返す (なければ登録する)"""
+        accession_id = self._accession_ids.get(sacc)
+        if accession_id is None:
+            accession_id = self._intern(
+                conn,
+                self._accession_ids,
+                sacc,
+                "INSERT OR IGNORE INTO accessions (sacc, stitle) VALUES (?, ?)",
+                "SELECT id FROM accessions WHERE sacc = ?",
+                (sacc, stitle),
+            )
+        return accession_id
+
+    def _taxon_id(self, conn, staxid, ssciname):
+        """分類 (staxid と学名の組) の ID を返す (なければ登録する)"""
+        key = (staxid, ssciname)
+        taxon_id = self._taxon_ids.get(key)
+        if taxon_id is None:
+            taxon_id = self._intern(
+                conn,
+                self._taxon_ids,
+                key,
+                "INSERT OR IGNORE INTO taxa (staxid, ssciname) VALUES (?, ?)",
+                "SELECT id FROM taxa WHERE staxid = ? AND ssciname = ?",
+                key,
+            )
+        return taxon_id
+
+    # --- 検索 ---
+    def _filters(self, conn, staxid=None, sacc=None, species=None, min_pident=None, sample=None):
+        """
+        検索条件を WHERE 句にする。
+
+        Returns:
+            tuple[list[str], list] | None: (条件, パラメータ)。
+            該当するアクセッション・学名がなければ None (結果は空)
+        """
+        clauses, params = [], []
+        if staxid is not None:
+            clauses.append("h.staxid = ?")
+            params.append(int(staxid))
+        if sacc:
+            row = conn.execute("SELECT id FROM accessions WHERE sacc = ?", (sacc,)).fetchone()
+            if row is None:
+                return None
+            clauses.append("h.accession_id = ?")
+            params.append(row[0])
+        if species:
+            # 学名は分類の表で staxid に置き換え、ヒットの表は staxid の索引で引く
+            staxids = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT DISTINCT staxid FROM taxa WHERE ssciname LIKE ? AND staxid != 0",
+                    (f"%{species}%",),
+                )
+            ]
+            if not staxids:
+                return None
+            clauses.append(f"h.staxid IN ({', '.join('?' * len(staxids))})")
+            params.extend(staxids)
+        if min_pident is not None:
+            clauses.append("h.pident >= ?")
+            params.append(float(min_pident))
+        if sample:
+            clauses.append("s.name LIKE ?")
+            params.append(f"%{sample}%")
+        return clauses, params
+
+    def find_samples(self, limit=DEFAULT_SEARCH_LIMIT, **filters):
+        """
+        条件に合うヒットがあるサンプルを、最高 pident の高い順に返す。
+
+        Args:
+            limit (int): 最大件数
+            **filters: staxid (int) / sacc (str, 完全一致) / species (str, 部分一致) /
+                min_pident (float) / sample (str, サンプル名の部分一致)
+
+        Returns:
+            list[dict]: sample / result_path / hits (ヒット数) / max_pident
+        """
+        with closing(self._connect()) as conn:
+            where = self._filters(conn, **filters)
+            if where is None:
+                return []
+            clauses, params = where
+            sql = (
+                "SELECT s.name, s.result_path, COUNT(*), MAX(h.pident) "
+                "FROM hits h JOIN samples s ON s.id = h.sample_id"
+                + (f" WHERE {' AND '.join(clauses)}" if clauses else "")
+                # "+" で sample_id の索引を集計に使わせない (使うと条件の索引を使わず全件を走査する)
+                + " GROUP BY +h.sample_id ORDER BY MAX(h.pident) DESC, s.name LIMIT ?"
+            )
+            return [
+                {"sample": name, "result_path": path, "hits": hits, "max_pident": max_pident}
+                for name, path, hits, max_pident in conn.execute(sql, params + [limit])
+            ]
+
+    def find_hits(self, limit=DEFAULT_SEARCH_LIMIT, **filters):
+        """
+        条件に合うヒットを pident の高い順に返す (条件は find_samples と同じ)。
+
+        Returns:
+            list[dict]: sample と RESULT_FIELDS の各列
+        """
+        with closing(self._connect()) as conn:
+            where = self._filters(conn, **filters)
+            if where is None:
+                return []
+            clauses, params = where
+            sql = (
+                "SELECT s.name, h.pident, a.sacc, h.staxid, t.ssciname, a.stitle "
+                "FROM hits h JOIN samples s ON s.id = h.sample_id "
+                "JOIN accessions a ON a.id = h.accession_id JOIN taxa t ON t.id = h.taxon_id"
+                + (f" WHERE {' AND '.join(clauses)}" if clauses else "")
+                + " ORDER BY h.pident DESC LIMIT ?"
+            )
+            columns = ["sample"] + RESULT_FIELDS.split()
+            return [dict(zip(columns, row)) for row in conn.execute(sql, params + [limit])]
+
+    def search(self, term, min_pident=None, limit=DEFAULT_SEARCH_LIMIT):
+        """
+        GUI の検索欄の1語で、ヒットのあるサンプルを探す。
+        数字なら staxid、登録済みのアクセッションならアクセッション、それ以外は学名の部分一致。
+        語も pident の下限もなければ (全件の集計になるので) 空のリストを返す。
+
+        Returns:
+            list[dict]: find_samples と同じ
+        """
+        term = term.strip()
+        if not term:
+            if min_pident is None:
+                return []
+            return self.find_samples(limit=limit, min_pident=min_pident)
+        if term.isdigit():
+            return self.find_samples(limit=limit, staxid=int(term), min_pident=min_pident)
+        with closing(self._connect()) as conn:
+            is_accession = conn.execute(
+                "SELECT 1 FROM accessions WHERE sacc = ?", (term,)
+            ).fetchone()
+        if is_accession:
+            return self.find_samples(limit=limit, sacc=term, min_pident=min_pident)
+        return self.find_samples(limit=limit, species=term, min_pident=min_pident)
+
+    def stats(self):
+        """取り込んだサンプル数・ヒット数・アクセッション数・分類数を返す"""
+        with closing(self._connect()) as conn:
+            samples, hits = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(rows), 0) FROM samples"
+            ).fetchone()
+            accessions = conn.execute("SELECT COUNT(*) FROM accessions").fetchone()[0]
+            taxa = conn.execute("SELECT COUNT(*) FROM taxa").fetchone()[0]
+        return {"samples": samples, "hits": hits, "accessions": accessions, "taxa": taxa}
+
+
+class IndexWriter:
+    """
+    完了した結果ファイルを、専用のスレッドで索引に取り込む。
+    解析のワーカーや GUI を待たせないよう、submit() はキューに入れるだけで、
+    書き込みスレッドが溜まったファイルをまとめて1回の ingest() で取り込む。
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="result-index", daemon=True)
+        self._thread.start()
+
+    def submit(self, result_path, sample_name=None):
+        """結果ファイルを取り込み待ちに加える"""
+        self._queue.put((result_path, sample_name or sample_name_for(result_path)))
+
+    def close(self):
+        """取り込み待ちのファイルを全て取り込んでから、スレッドを終了する"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = None in items
+            items = [item for item in items if item is not None]
+            if items:
+                try:
+                    self.index.ingest(items)
+                except (OSError, ValueError, sqlite3.Error) as e:
+                    print(f"結果の索引への取り込み中にエラー: {e}")
+            if stopping:
+                return
+
+
+def open_index_writer(config, config_path):
+    """[RESULT_INDEX] が有効なら IndexWriter を作る (索引を開けなければ警告して None)"""
+    path = index_path_from_config(config, config_path)
+    if path is None:
+        return None
+    try:
+        return IndexWriter(ResultIndex(path))
+    except (OSError, sqlite3.Error) as e:
+        print(f"結果の索引を開けません: {e}")
+        return None
@@ -0,0 +1,331 @@
+# result_summary.py
+"""
+qseqid 付きの BLAST 結果 (RAW_FIELDS) から、クエリごとの最良ヒットと
+サンプル (1つのFASTA) ごとの種の組成をまとめ、<file>_summary.tsv に書く。
+
+<file>_result.csv を書くのと同じ1回の読み出しで集計するので、結果を後から
+別のスクリプトで読み直す必要がない。blastn はクエリの入力順に結果を出力するので、
+クエリごとの行は連続している。行は block_rows 行ずつまとめて列に分け、
+クエリの境界・最大の pident・同点のヒットの選別を C で実装された組み込み関数
+(map / itertools.compress / operator) で行う (Python のループはクエリ単位だけ)。
+
+同点 (最良の pident - tie_delta 以上) のヒットの扱い (tie_rule):
+    first: 最初に出力されたヒットの staxid / ssciname をそのまま使う
+    lca:   同点のヒットがすべて同じ staxid ならその taxon、同じ種 (学名の2語目まで)
+           ならその種、同じ属 (学名の1語目) ならその属に割り当てる。
+           属も一致しなければ ambiguous とする。
+           (outfmt 6 には系統情報がないので、学名から種・属を判断する)
+
+最良の pident が min_pident 未満のクエリと、ヒットのないクエリは unclassified とする。
+"""
+import functools
+import hashlib
+import itertools
+import operator
+import os
+
+from blast_results import strip_qseqid
+
+# <file>_result.csv に対応する集計ファイルの接尾辞
+SUMMARY_SUFFIX = "_summary.tsv"
+# クエリごとの最良ヒットを書くファイルの接尾辞 ([SUMMARY] best_hits = true の場合)
+BEST_HITS_SUFFIX = "_besthits.tsv"
+# 同点のヒットの扱い
+TIE_RULES = ("first", "lca")
+# 1回にまとめて列に分ける行数
+DEFAULT_BLOCK_ROWS = 65536
+
+# 割り当ての階級 (組成表に載るのは CLASSIFIED_RANKS だけ)
+CLASSIFIED_RANKS = ("species", "genus")
+AMBIGUOUS = "ambiguous"
+UNCLASSIFIED = "unclassified"
+
+# RAW_FIELDS の列数 (qseqid pident sacc staxid ssciname stitle)
+_NUM_COLUMNS = 6
+
+
+def summary_settings_from_config(config):
+    """
+    [SUMMARY] 設定を読む。
+
+    Returns:
+        dict | None: tie_rule / tie_delta / min_pident / best_hits (無効な場合は None)
+    """
+    if not config.getboolean("SUMMARY", "enabled", fallback=False):
+        return None
+    return {
+        "tie_rule": config.get("SUMMARY", "tie_rule", fallback="lca").strip().lower(),
+        "tie_delta": config.getfloat("SUMMARY", "tie_delta", fallback=0.5),
+        "min_pident": config.getfloat("SUMMARY", "min_pident", fallback=0.0),
+        "best_hits": config.getboolean("SUMMARY", "best_hits", fallback=False),
+    }
+
+
+def summary_suffixes(settings):
+    """設定に応じて書く集計ファイルの接尾辞"""
+    if settings["best_hits"]:
+        return (SUMMARY_SUFFIX, BEST_HITS_SUFFIX)
+    return (SUMMARY_SUFFIX,)
+
+
+def summary_cache_key(cache_key, settings, suffix):
+    """
+    結果キャッシュのキーから、集計ファイル (suffix) を登録するキーを作る。
+    集計は [SUMMARY] の設定によって変わるので、設定もキーに含める。
+    """
+    material = "\0".join(
+        (
+            cache_key,
+            suffix,
+            settings["tie_rule"],
+            repr(settings["tie_delta"]),
+            repr(settings["min_pident"]),
+        )
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _split_raw_lines(lines):
+    """
+    RAW_FIELDS の行をまとめて列に分ける。
+
+    Returns:
+        list[bytes]: 行ごとの6列を並べたもの (fields[i::6] が i 列目)
+    """
+    fields = b"\t".join(map(bytes.rstrip, lines, itertools.repeat(b"\r\n"))).split(b"\t")
+    if len(fields) != len(lines) * _NUM_COLUMNS:
+        # 空行や列の数が合わない行を含むブロックだけ1行ずつ分ける
+        fields = []
+        for line in lines:
+            row = line.rstrip(b"\r\n").split(b"\t", _NUM_COLUMNS - 1)
+            if row == [b""]:
+                continue
+            if len(row) < _NUM_COLUMNS:
+                raise ValueError(f"結果の行の列が足りません: {line!r:.200}")
+            fields.extend(row)
+    return fields
+
+
+@functools.lru_cache(maxsize=65536)
+def _species_name(name):
+    """学名の2語目までを種名とみなす (同じ学名が繰り返し出るのでキャッシュする)"""
+    return b" ".join(name.split(None, 2)[:2])
+
+
+@functools.lru_cache(maxsize=65536)
+def _genus_name(name):
+    """学名の1語目を属名とみなす"""
+    words = name.split(None, 1)
+    return words[0] if words else b""
+
+
+def _assign(columns, start, end, tie_rule, tie_delta, min_pident):
+    """
+    1クエリ分の行 (start 〜 end - 1) から最良ヒットを選び、割り当てを決める。
+
+    Returns:
+        tuple: (階級, staxid, 学名, 最良の pident, 最良ヒットの sacc)。
+        LCA で種・属にまとめた場合、staxid は空にする。
+    """
+    pidents, saccs, staxids, names = columns
+    group = pidents[start:end]
+    best = max(group)
+    top = pidents.index(best, start, end)
+    if best < min_pident:
+        return UNCLASSIFIED, b"", b"", best, saccs[top]
+    if tie_rule == "first" or end - start == 1:
+        return "species", staxids[top], names[top], best, saccs[top]
+
+    tied = list(
+        itertools.compress(
+            range(start, end), map(operator.ge, group, itertools.repeat(best - tie_delta))
+        )
+    )
+    if len(set(map(staxids.__getitem__, tied))) == 1:
+        return "species", staxids[top], names[top], best, saccs[top]
+    tied_names = set(map(names.__getitem__, tied))
+    species = set(map(_species_name, tied_names))
+    if len(species) == 1:
+        return "species", b"", species.pop(), best, saccs[top]
+    genera = set(map(_genus_name, tied_names))
+    if len(genera) == 1 and b"" not in genera:
+        return "genus", b"", genera.pop(), best, saccs[top]
+    return AMBIGUOUS, b"", b"", best, saccs[top]
+
+
+def iter_best_hits(
+    raw_file,
+    tie_rule="lca",
+    tie_delta=0.0,
+    min_pident=0.0,
+    strip_to=None,
+    block_rows=DEFAULT_BLOCK_ROWS,
+):
+    """
+    RAW_FIELDS 形式の結果ファイルを1回だけ読み、ヒットのあるクエリごとに割り当てを返す。
+
+    Args:
+        raw_file (str): qseqid 付きの結果ファイル
+        tie_rule (str): 同点のヒットの扱い (TIE_RULES のいずれか)
+        tie_delta (float): 最良の pident からこの差までを同点とみなす
+        min_pident (float): 最良の pident がこれ未満のクエリは unclassified
+        strip_to (str, optional): 指定すると、qseqid 列を取り除いた行を同じ読み出しで書く
+            (<file>_result.csv を書きながら集計する)
+        block_rows (int): まとめて列に分ける行数
+
+    Yields:
+        tuple[bytes, tuple]: (qseqid, _assign() の割り当て)。結果ファイルの順
+
+    Raises:
+        ValueError: tie_rule が不正・列が足りない行・pident が数値でない行がある
+    """
+    if tie_rule not in TIE_RULES:
+        raise ValueError(f"tie_rule は {', '.join(TIE_RULES)} のいずれかです: {tie_rule}")
+
+    # 前のブロックの最後のクエリは、次のブロックに続いている可能性があるので持ち越す
+    pending = []
+    out = open(strip_to, "wb") if strip_to is not None else None
+    try:
+        with open(raw_file, "rb") as f:
+            while True:
+                lines = list(itertools.islice(f, block_rows))
+                if out is not None:
+                    out.writelines(map(strip_qseqid, lines))
+                fields = pending + _split_raw_lines(lines) if lines else pending
+
+                qseqids = fields[0::_NUM_COLUMNS]
+                columns = (
+                    list(map(float, fields[1::_NUM_COLUMNS])),
+                    fields[2::_NUM_COLUMNS],
+                    fields[3::_NUM_COLUMNS],
+                    fields[4::_NUM_COLUMNS],
+                )
+                num_rows = len(qseqids)
+                # クエリの境界 (qseqid が前の行と変わる行)
+                starts = (
+                    [0, *itertools.compress(
+                        range(1, num_rows), map(operator.ne, qseqids[1:], qseqids[:-1])
+                    )]
+                    if num_rows
+                    else []
+                )
+                if lines and starts:
+                    last = starts.pop()
+                    pending = fields[last * _NUM_COLUMNS :]
+                    ends = starts[1:] + [last]
+                else:
+                    pending = []
+                    ends = starts[1:] + [num_rows]
+
+                for start, end in zip(starts, ends):
+                    yield qseqids[start], _assign(
+                        columns, start, end, tie_rule, tie_delta, min_pident
+                    )
+                if not lines:
+                    break
+    finally:
+        if out is not None:
+            out.close()
+
+
+class SampleSummary:
+    """
+    1サンプル (1つのFASTA) の最良ヒットの割り当てを集計し、<file>_summary.tsv に書く。
+    best_hits_path を渡すと、クエリごとの最良ヒットも書く。
+    """
+
+    def __init__(self, total_queries, best_hits_path=None):
+        """
+        Args:
+            total_queries (int): サンプルのクエリ数 (ヒットのないクエリも含む)
+            best_hits_path (str, optional): クエリごとの最良ヒットの出力先
+        """
+        self.total_queries = total_queries
+        self.counts = dict.fromkeys((*CLASSIFIED_RANKS, AMBIGUOUS, UNCLASSIFIED), 0)
+        # (階級, staxid, 学名) -> [クエリ数, pident の合計, 最大の pident]
+        self.taxa = {}
+        self.best_hits_path = best_hits_path
+        self._best_hits = None
+        if best_hits_path is not None:
+            self._best_hits = open(f"{best_hits_path}.tmp", "wb")
+            self._best_hits.write(b"qseqid\tpident\tsacc\trank\tstaxid\tssciname\n")
+
+    def add(self, assignment, query_id=None, weight=1):
+        """
+        クエリ1つ (重複除去した代表なら weight 個) の割り当てを加える。
+
+        Args:
+            assignment (tuple): iter_best_hits() が返す割り当て
+            query_id (bytes, optional): 最良ヒットのファイルに書くクエリID
+            weight (int): このクエリが表すレコード数
+        """
+        rank, staxid, name, pident, sacc = assignment
+        self.counts[rank] += weight
+        if rank in CLASSIFIED_RANKS:
+            entry = self.taxa.get((rank, staxid, name))
+            if entry is None:
+                self.taxa[(rank, staxid, name)] = [weight, pident * weight, pident]
+            else:
+                entry[0] += weight
+                entry[1] += pident * weight
+                if pident > entry[2]:
+                    entry[2] = pident
+        if self._best_hits is not None:
+            self._best_hits.write(
+                b"%s\t%.3f\t%s\t%s\t%s\t%s\n"
+                % (query_id, pident, sacc, rank.encode(), staxid or b"-", name or b"-")
+            )
+
+    def write(self, path, settings):
+        """
+        集計を path に書く (一時ファイルに書いてから置き換える)。
+        先頭の "#" 行にクエリ数の内訳と設定、続いて組成表をクエリ数の多い順に書く。
+
+        Args:
+            path (str): 出力先 (<file>_summary.tsv)
+            settings (dict): summary_settings_from_config() の設定
+        """
+        counts = self.counts
+        classified = sum(counts[rank] for rank in CLASSIFIED_RANKS)
+        # ヒットのないクエリも unclassified に数える
+        unclassified = max(0, self.total_queries - classified - counts[AMBIGUOUS])
+        total = max(self.total_queries, 1)
+
+        lines = [
+            f"# queries\t{self.total_queries}",
+            f"# classified\t{classified}",
+            *(f"# {rank}\t{counts[rank]}" for rank in CLASSIFIED_RANKS),
+            f"# {AMBIGUOUS}\t{counts[AMBIGUOUS]}",
+            f"# {UNCLASSIFIED}\t{unclassified}",
+            f"# tie_rule\t{settings['tie_rule']}",
+            f"# tie_delta\t{settings['tie_delta']:g}",
+            f"# min_pident\t{settings['min_pident']:g}",
+            "rank\tstaxid\tssciname\tqueries\tfraction\tmean_pident\tmax_pident",
+        ]
+        ordered = sorted(self.taxa.items(), key=lambda item: (-item[1][0], item[0][2]))
+        for (rank, staxid, name), (queries, pident_sum, max_pident) in ordered:
+            lines.append(
+                f"{rank}\t{staxid.decode('utf-8', 'replace') or '-'}\t"
+                f"{name.decode('utf-8', 'replace')}\t{queries}\t{queries / total:.4f}\t"
+                f"{pident_sum / queries:.3f}\t{max_pident:.3f}"
+            )
+
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8", newline="\n") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_path, path)
+
+        if self._best_hits is not None:
+            self._best_hits.close()
+            self._best_hits = None
+            os.replace(f"{self.best_hits_path}.tmp", self.best_hits_path)
+
+    def abort(self):
+        """書きかけの最良ヒットのファイルを削除する"""
+        if self._best_hits is not None:
+            self._best_hits.close()
+            self._best_hits = None
+            try:
+                os.remove(f"{self.best_hits_path}.tmp")
+            except OSError:
+                pass
@@ -0,0 +1,238 @@
+# scheduler.py
+import os
+import time
+
+from fasta_tools import count_fasta_records
+from job_queue import JobState
+
+# [SCHEDULING] の policy に指定できる方針
+SCHEDULING_POLICIES = ("fifo", "sjf")
+
+
+def compute_job_slots(config):
+    """
+    設定から同時実行ジョブ数と1ジョブあたりのスレッド数を決定する。
+
+    合計スレッド数 (ジョブ数 × num_threads) が thread_budget を超えないように
+    ジョブ数を絞り込む。thread_budget が 0 の場合は CPU コア数を上限とする。
+
+    Args:
+        config (configparser.ConfigParser): 設定情報
+
+    Returns:
+        tuple[int, int]: (同時実行ジョブ数, 1ジョブあたりのスレッド数)
+    """
+    num_threads = max(1, config.getint("BLAST_SETTINGS", "num_threads", fallback=8))
+    max_jobs = max(1, config.getint("BLAST_SETTINGS", "max_jobs", fallback=1))
+    thread_budget = config.getint("BLAST_SETTINGS", "thread_budget", fallback=0)
+    if thread_budget <= 0:
+        thread_budget = os.cpu_count() or num_threads
+
+    # 予算内に収まるジョブ数 (最低でも1ジョブは実行する)
+    jobs_in_budget = max(1, thread_budget // num_threads)
+    return min(max_jobs, jobs_in_budget), num_threads
+
+
+def _packable_records(filepath, max_file_bytes):
+    """まとめて実行できる小さなファイルならレコード数を、そうでなければ None を返す"""
+    try:
+        if os.path.getsize(filepath) > max_file_bytes:
+            return None
+        return count_fasta_records(filepath)
+    except OSError:
+        return None  # ファイルがない場合などは単独で実行し、エラーを通知させる
+
+
+def _job_size(job, measure):
+    """短いジョブ優先の並び順に使うジョブの大きさ (初回だけ調べて Job に覚えておく)"""
+    if job.size is None:
+        try:
+            if measure == "records":
+                job.size = count_fasta_records(job.filepath)
+            else:
+                job.size = os.path.getsize(job.filepath)
+        except OSError:
+            job.size = 0  # 見つからないファイルは先に実行し、すぐにエラーを通知させる
+    return job.size
+
+
+def policy_key(config):
+    """
+    [SCHEDULING] の policy に応じた、解析待ちのジョブの並び順の値を返す関数を作る。
+
+        fifo : 優先度レーン → 今の表示順 (従来どおり)
+        sjf  : 優先度レーン → 小さいファイルから (size_by = size: バイト数 / records: レコード数)
+
+    どちらの方針でも、max_wait_min を超えて待っているジョブを最初に並べる。
+
+    Returns:
+        callable: Job を受け取り、並び順の値 (タプル) を返す関数
+    """
+    policy = config.get("SCHEDULING", "policy", fallback="fifo").lower()
+    if policy not in SCHEDULING_POLICIES:
+        raise ValueError(f"不明なスケジューリング方針です: {policy}")
+    measure = config.get("SCHEDULING", "size_by", fallback="size").lower()
+    if measure not in ("size", "records"):
+        raise ValueError(f"不明な大きさの基準です: {measure}")
+    max_wait_min = config.getfloat("SCHEDULING", "max_wait_min", fallback=60)
+    starved_before = time.time() - max_wait_min * 60 if max_wait_min > 0 else None
+
+    def key(job):
+        waiting = starved_before is None or job.queued_at > starved_before
+        if policy == "sjf":
+            return (waiting, job.lane, _job_size(job, measure), job.position)
+        return (waiting, job.lane, job.position)
+
+    return key
+
+
+def apply_policy(jobs, config):
+    """
+    解析待ちのジョブを [SCHEDULING] の方針で並べ替える (リストの表示順 = 実行順)。
+    ドラッグで位置を決めたジョブは動かさない。
+
+    Returns:
+        bool: 表示順が変わった場合は True
+    """
+    return jobs.reorder(policy_key(config))
+
+
+def _promote_starved(jobs, config):
+    """
+    最も長く待っている解析待ちのジョブが max_wait_min を超えていたら、先頭に移す。
+    短いジョブ優先や後回しのレーンで、大きなファイルがいつまでも始まらないのを防ぐ。
+    """
+    max_wait_min = config.getfloat("SCHEDULING", "max_wait_min", fallback=60)
+    if max_wait_min <= 0:
+        return
+    job = jobs.oldest_waiting()
+    if job is None or time.time() - job.queued_at < max_wait_min * 60:
+        return
+    if job is not jobs.next_pending():
+        jobs.promote(job)
+
+
+def take_next_jobs(jobs, config):
+    """
+    次に1つのワーカーで実行するジョブを表示順に取り出し、実行中にする。
+    待ち時間が [SCHEDULING] の max_wait_min を超えたジョブがあれば、それを先に取り出す。
+
+    [PACKING] が有効で先頭のファイルが小さければ、続く小さなファイルも
+    合計レコード数・ファイル数の上限までまとめて取り出す (1回の blastn で実行する)。
+    大きなファイルが現れたら、そこでまとめるのをやめる。
+
+    Args:
+        jobs (job_queue.JobQueue): ジョブキュー
+        config (configparser.ConfigParser): 設定情報
+
+    Returns:
+        list[job_queue.Job]: 取り出したジョブ (解析待ちがなければ空)
+    """
+    _promote_starved(jobs, config)
+    job = jobs.next_pending()
+    if job is None:
+        return []
+    jobs.mark_running(job)
+    group = [job]
+    if not config.getboolean("PACKING", "enabled", fallback=False):
+        return group
+
+    max_file_bytes = config.getint("PACKING", "max_file_kb", fallback=1024) * 1024
+    max_records = config.getint("PACKING", "max_records", fallback=20000)
+    max_files = config.getint("PACKING", "max_files", fallback=200)
+
+    total_records = _packable_records(job.filepath, max_file_bytes)
+    if total_records is None:
+        return group
+    while len(group) < max_files:
+        candidate = jobs.next_pending()
+        if candidate is None:
+            break
+        records = _packable_records(candidate.filepath, max_file_bytes)
+        if records is None or total_records + records > max_records:
+            break
+        jobs.mark_running(candidate)
+        group.append(candidate)
+        total_records += records
+    return group
+
+
+def take_next_remote_launch(jobs, config, agents):
+    """
+    空きスロットの最も多いエージェントに、次に1つのワーカーで実行するジョブを割り当てる。
+    (このマシンの空きは take_next_launch で先に使う)
+
+    Args:
+        jobs (job_queue.JobQueue): ジョブキュー
+        config (configparser.ConfigParser): 設定情報
+        agents (agent_pool.AgentPool): 登録したエージェント ([AGENTS] が無効なら None)
+
+    Returns:
+        tuple[list[job_queue.Job], agent_pool.RemoteAgent | None]: (取り出したジョブ,
+        割り当てたエージェント)。空きがないか、解析待ちがなければ ([], None)
+    """
+    if agents is None or not jobs.count(JobState.PENDING):
+        return [], None
+    agent = agents.acquire()
+    if agent is None:
+        return [], None
+    group = take_next_jobs(jobs, config)
+    if not group:
+        agent.release()
+        return [], None
+    return group, agent
+
+
+def _query_size(group):
+    """ジョブのクエリの大きさ (塩基数の近似としてファイルサイズの合計) を返す"""
+    total = 0
+    for job in group:
+        try:
+            total += os.path.getsize(job.filepath)
+        except OSError:
+            pass
+    return total
+
+
+def take_next_launch(jobs, config, running_workers, tuner=None):
+    """
+    空きがあれば、次に1つのワーカーで実行するジョブとそのスレッド数を決めて取り出す。
+
+    tuner がなければ compute_job_slots の同時実行数まで、設定の num_threads で実行する。
+    tuner (autotune.ThreadTuner) があれば、ジョブの大きさと解析待ちの数から
+    スレッド数を選び、実行中のワーカーと合わせてスレッド予算に収まる範囲で開始する
+    (予算の残りが選んだスレッド数より少なければ、残りのスレッドで開始する)。
+
+    エージェントで実行中のワーカーはこのマシンのスレッドを使わないので数えない。
+    [AGENTS] が有効で use_local = false なら、このマシンでは開始しない。
+
+    Args:
+        jobs (job_queue.JobQueue): ジョブキュー
+        config (configparser.ConfigParser): 設定情報
+        running_workers (dict): ファイルパス -> 実行中のワーカー (num_threads 属性を持つ)
+        tuner (autotune.ThreadTuner): スレッド数の自動調整 (任意)
+
+    Returns:
+        tuple[list[job_queue.Job], int | None]: (取り出したジョブ, スレッド数)。
+        開始できなければ ([], None)。スレッド数が None なら設定の num_threads を使う
+    """
+    if config.getboolean("AGENTS", "enabled", fallback=False) and not config.getboolean(
+        "AGENTS", "use_local", fallback=True
+    ):
+        return [], None
+    workers = {worker for worker in running_workers.values() if worker.agent is None}
+    if tuner is None:
+        max_jobs, _ = compute_job_slots(config)
+        if len(workers) >= max_jobs:
+            return [], None
+        return take_next_jobs(jobs, config), None
+
+    free_threads = tuner.thread_budget - sum(worker.num_threads for worker in workers)
+    if free_threads < 1 or len(workers) >= tuner.max_jobs:
+        return [], None
+    group = take_next_jobs(jobs, config)
+    if not group:
+        return [], None
+    pending_jobs = jobs.count(JobState.PENDING) + 1
+    num_threads = tuner.choose_threads(_query_size(group), pending_jobs)
+    return group, min(num_threads, free_threads)
@@ -0,0 +1,128 @@
+# staging.py
+"""
+クエリと結果をローカルの高速なディスク (scratch) に置いて blastn を実行する。
+
+入力フォルダがネットワーク共有だと、blastn のクエリの読み込みと結果の書き出しが
+共有フォルダへのアクセスになり、途中の結果もそのまま共有フォルダに見える。
+[STAGING] を有効にすると、ジョブの一時フォルダを scratch に作り、クエリをそこへ
+コピーして blastn の入出力を全て scratch で行う。完了した結果は publish_file() で
+<file>_result.csv として公開する (同じボリュームなら rename、違えば1回のコピーの後に
+rename するので、書きかけの結果が見えることはない)。
+
+scratch の空きはジョブの開始時に予約する。(予約済みの合計 + このジョブの必要量) を
+引いても min_free_mb 以上残らなければ、そのジョブはステージングせず元のフォルダで実行する。
+"""
+import errno
+import os
+import shutil
+import tempfile
+import threading
+
+_scratches = {}  # scratch フォルダ -> ScratchSpace
+_scratches_lock = threading.Lock()
+
+
+def get_scratch(config):
+    """
+    [STAGING] が有効なら、設定の scratch フォルダに対応する ScratchSpace を返す (無効なら None)。
+    同じフォルダには1つを共有し、ジョブ間で空きの予約を合計する。
+    """
+    if not config.getboolean("STAGING", "enabled", fallback=False):
+        return None
+    directory = config.get("STAGING", "directory", fallback="") or tempfile.gettempdir()
+    directory = os.path.abspath(directory)
+    with _scratches_lock:
+        scratch = _scratches.get(directory)
+        if scratch is None:
+            scratch = ScratchSpace(
+                directory,
+                config.getint("STAGING", "min_free_mb", fallback=1024) * 1024 * 1024,
+                config.getfloat("STAGING", "space_factor", fallback=3.0),
+            )
+            _scratches[directory] = scratch
+        return scratch
+
+
+def publish_file(source, destination):
+    """
+    source を destination に移す。同じボリュームなら rename (アトミック)。
+    ボリュームが違えば、destination と同じフォルダの一時ファイルへ1回だけコピーしてから
+    rename するので、destination に書きかけのファイルが見えることはない。
+
+    Args:
+        source (str): 移すファイル (完了後に削除される)
+        destination (str): 公開先のパス (既にあれば置き換える)
+    """
+    try:
+        os.replace(source, destination)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    directory = os.path.dirname(os.path.abspath(destination))
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(destination)}.", suffix=".part"
+    )
+    os.close(fd)
+    try:
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, destination)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    os.remove(source)
+
+
+class ScratchSpace:
+    """
+    scratch フォルダの空き容量を、同時に実行中のジョブの間で予約して管理する。
+    複数のワーカースレッドから使われるので、予約はロックで守る。
+    """
+
+    def __init__(self, directory, min_free_bytes, space_factor=3.0):
+        """
+        Args:
+            directory (str): scratch フォルダ (なければ作る)
+            min_free_bytes (int): 予約後にも残しておく空き容量
+            space_factor (float): クエリの大きさに対する必要量の倍率
+                (クエリのコピー + 重複除去・分割の中間ファイル + 結果)
+        """
+        self.directory = directory
+        self.min_free_bytes = min_free_bytes
+        self.space_factor = space_factor
+        self._reserved = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def required_bytes(self, filepaths):
+        """ファイル群を解析するジョブが scratch に必要とするバイト数の見積もり"""
+        size = 0
+        for filepath in filepaths:
+            try:
+                size += os.path.getsize(filepath)
+            except OSError:
+                pass
+        return int(size * self.space_factor)
+
+    def reserve(self, nbytes):
+        """
+        nbytes の空きを予約する。
+
+        Returns:
+            bool: 予約できた場合は True (空きが足りなければ False で、何も予約しない)
+        """
+        with self._lock:
+            free = shutil.disk_usage(self.directory).free
+            if free - self._reserved - nbytes < self.min_free_bytes:
+                return False
+            self._reserved += nbytes
+            return True
+
+    def release(self, nbytes):
+        """reserve() で予約した空きを返す"""
+        with self._lock:
+            self._reserved = max(0, self._reserved - nbytes)
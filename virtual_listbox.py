@@ -0,0 +1,205 @@
+# virtual_listbox.py
+import tkinter as tk
+import tkinter.font as tkfont
+
+# 選択行の背景色
+SELECT_BACKGROUND = "#cce0ff"
+
+
+class VirtualListbox(tk.Canvas):
+    """
+    表示中の行だけを描画する仮想リストボックス (ドラッグ＆ドロップで並び替え可能)。
+
+    行のデータは set_source() で渡した関数から必要な分だけ取り出す。
+    ファイルが何万件あっても、Tcl 側に作る項目は画面に見えている行数分だけなので、
+    一括追加やドラッグ中の再描画のコストは件数に依存しない。
+    選択は行番号ではなく行のキー (row_key) で覚えるので、上の行が削除されたり
+    並び替えられたりしても、選択が別の行にずれることはない。
+    """
+
+    def __init__(self, master, **kwargs):
+        kwargs.setdefault("background", "white")
+        kwargs.setdefault("highlightthickness", 0)
+        super().__init__(master, **kwargs)
+        self.font = tkfont.nametofont("TkDefaultFont")
+        self.row_height = self.font.metrics("linespace") + 2
+
+        self.yscrollcommand = None  # スクロールバーの set メソッド
+        # 並び替えをモデルに反映するためのコールバック (from_index, to_index)
+        self.move_callback = None
+
+        self._row_count = lambda: 0  # 行数を返す関数
+        self._row_data = None  # index -> (表示文字列, 文字色 or None) を返す関数
+        self._row_key = lambda index: index  # index -> 行を識別するキーを返す関数
+        self.top = 0  # 表示中の先頭行
+        self.selection = set()  # 選択中の行のキー
+        self._anchor = None  # Shift+クリックの範囲選択の起点
+        self.dragged_index = None
+        self._row_items = []  # 再利用する (背景の矩形, 文字) のキャンバス項目
+
+        self.bind("<Configure>", lambda event: self.refresh())
+        self.bind("<Button-1>", self.on_click)
+        self.bind("<Shift-Button-1>", self.on_shift_click)
+        self.bind("<Control-Button-1>", self.on_control_click)
+        self.bind("<B1-Motion>", self.on_drag)
+        self.bind("<ButtonRelease-1>", self.on_release)
+        self.bind("<MouseWheel>", self.on_mousewheel)
+        self.bind("<Button-4>", lambda event: self.yview_scroll(-3, "units"))
+        self.bind("<Button-5>", lambda event: self.yview_scroll(3, "units"))
+        self.bind("<Enter>", lambda event: self.focus_set())
+
+    def set_source(self, row_count, row_data, row_key=None):
+        """
+        表示するデータの取り出し方を設定する。
+
+        Args:
+            row_count (callable): 行数を返す関数
+            row_data (callable): index -> (表示文字列, 文字色 or None)
+            row_key (callable): index -> 行を識別するキー (省略時は行番号)
+        """
+        self._row_count = row_count
+        self._row_data = row_data
+        if row_key is not None:
+            self._row_key = row_key
+        self.refresh()
+
+    # --- 描画 ---
+    def _page_size(self):
+        """画面に完全に収まる行数"""
+        return max(1, self.winfo_height() // self.row_height)
+
+    def refresh(self):
+        """見えている行だけを描画し直す"""
+        count = self._row_count()
+        page = self._page_size()
+        self.top = max(0, min(self.top, count - page))
+
+        # 部分的に見える最下行も含めて描画する
+        visible = page + 1
+        while len(self._row_items) < visible:
+            rect = self.create_rectangle(0, 0, 0, 0, outline="", fill="")
+            text = self.create_text(0, 0, anchor=tk.W, font=self.font)
+            self._row_items.append((rect, text))
+
+        width = self.winfo_width()
+        for slot, (rect, text) in enumerate(self._row_items):
+            index = self.top + slot
+            if slot >= visible or index >= count:
+                self.itemconfig(rect, state=tk.HIDDEN)
+                self.itemconfig(text, state=tk.HIDDEN)
+                continue
+            label, color = self._row_data(index)
+            y = slot * self.row_height
+            self.coords(rect, 0, y, width, y + self.row_height)
+            self.itemconfig(
+                rect,
+                state=tk.NORMAL,
+                fill=SELECT_BACKGROUND if self._row_key(index) in self.selection else "",
+            )
+            self.coords(text, 4, y + self.row_height // 2)
+            self.itemconfig(text, state=tk.NORMAL, text=label, fill=color or "black")
+
+        if self.yscrollcommand is not None:
+            if count:
+                self.yscrollcommand(self.top / count, min(1.0, (self.top + page) / count))
+            else:
+                self.yscrollcommand(0.0, 1.0)
+
+    # --- スクロール (tk.Scrollbar の command と互換) ---
+    def yview(self, *args):
+        if not args:
+            count = self._row_count()
+            if not count:
+                return 0.0, 1.0
+            return self.top / count, min(1.0, (self.top + self._page_size()) / count)
+        if args[0] == tk.MOVETO:
+            self.yview_moveto(args[1])
+        elif args[0] == tk.SCROLL:
+            self.yview_scroll(args[1], args[2])
+
+    def yview_moveto(self, fraction):
+        self.top = int(float(fraction) * self._row_count())
+        self.refresh()
+
+    def yview_scroll(self, number, what):
+        step = self._page_size() if what == tk.PAGES else 1
+        self.top += int(number) * step
+        self.refresh()
+
+    def on_mousewheel(self, event):
+        # Windows は1ノッチで delta=120
+        self.yview_scroll(-3 if event.delta > 0 else 3, tk.UNITS)
+
+    def see(self, index):
+        """index の行が見えるようにスクロールする"""
+        page = self._page_size()
+        if index < self.top:
+            self.top = index
+        elif index >= self.top + page:
+            self.top = index - page + 1
+        self.refresh()
+
+    # --- 選択 ---
+    def nearest(self, y):
+        """y 座標に最も近い行番号を返す (行がなければ -1)"""
+        count = self._row_count()
+        if not count:
+            return -1
+        return max(0, min(count - 1, self.top + int(y) // self.row_height))
+
+    def selected_keys(self):
+        """選択中の行のキーを返す (削除済みの行のキーが含まれることがある)"""
+        return set(self.selection)
+
+    def selection_clear(self):
+        self.selection.clear()
+        self._anchor = None
+        self.refresh()
+
+    def on_click(self, event):
+        index = self.nearest(event.y)
+        self.dragged_index = index if index >= 0 else None
+        self.selection = {self._row_key(index)} if index >= 0 else set()
+        self._anchor = self.dragged_index
+        self.refresh()
+
+    def on_shift_click(self, event):
+        index = self.nearest(event.y)
+        if index < 0:
+            return
+        # 起点の行が削除されていることがあるので、行数の範囲に収める
+        anchor = min(self._anchor, self._row_count() - 1) if self._anchor is not None else index
+        low, high = sorted((anchor, index))
+        self.selection = {self._row_key(i) for i in range(low, high + 1)}
+        self.dragged_index = None
+        self.refresh()
+
+    def on_control_click(self, event):
+        index = self.nearest(event.y)
+        if index < 0:
+            return
+        self.selection ^= {self._row_key(index)}
+        self._anchor = index
+        self.dragged_index = None
+        self.refresh()
+
+    # --- ドラッグでの並び替え ---
+    def on_drag(self, event):
+        if self.dragged_index is None:
+            return
+        # 上下の端を越えてドラッグしたら自動でスクロールする
+        if event.y < 0:
+            self.yview_scroll(-1, tk.UNITS)
+        elif event.y > self.winfo_height():
+            self.yview_scroll(1, tk.UNITS)
+
+        current_index = self.nearest(event.y)
+        if current_index != self.dragged_index and current_index >= 0:
+            if self.move_callback is not None:
+                self.move_callback(self.dragged_index, current_index)
+            self._anchor = current_index
+            self.dragged_index = current_index
+            self.refresh()
+
+    def on_release(self, event):
+        self.dragged_index = None